@@ -1,108 +1,95 @@
 """
 Validateurs de sécurité pour les données capteurs
 """
+import logging
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
 
+logger = logging.getLogger('django.security')
+
 class SensorDataValidator:
     """Validateur de sécurité pour les données capteurs"""
     
+    # champ: (min, max, message d'erreur, seuil bas, seuil haut, niveau de log, message d'alerte)
+    # Une valeur hors [min, max] est rejetée; < seuil bas ou > seuil haut est journalisée.
+    RANGES = {
+        # ⭐⭐⭐⭐⭐ Critique pour la sécurité sanitaire
+        'spo2': (70, 100, "SpO2 invalide: {value}%. Doit être entre 70-100%",
+                 85, None, logging.CRITICAL, "SpO2 critique détectée: {value}% - Alerte médicale requise"),
+        'respiratory_rate': (5, 60, "Fréquence respiratoire invalide: {value}/min. Doit être entre 5-60/min",
+                             8, 40, logging.WARNING, "Fréquence respiratoire anormale: {value}/min"),
+        'heart_rate': (30, 250, "Fréquence cardiaque invalide: {value} bpm. Doit être entre 30-250 bpm",
+                       40, 200, logging.WARNING, "Fréquence cardiaque anormale: {value} bpm"),
+        'aqi': (0, 500, "AQI invalide: {value}. Doit être entre 0-500",
+                None, 300, logging.CRITICAL, "AQI dangereux: {value} - Alerte environnementale"),
+        'temperature': (30.0, 45.0, "Température invalide: {value}°C. Doit être entre 30-45°C",
+                        35.0, 42.0, logging.WARNING, "Température corporelle anormale: {value}°C"),
+        # DHT11
+        'humidity': (0, 100, "Humidité invalide: {value}%. Doit être entre 0-100%",
+                     None, None, None, None),
+        # CJMCU-811 (plages typiques)
+        'eco2': (350, 8192, "eCO2 invalide: {value}ppm. Doit être entre 350-8192ppm",
+                 None, 5000, logging.WARNING, "eCO2 très élevé: {value}ppm - Ventilation requise"),
+        'tvoc': (0, 60000, "TVOC invalide: {value}ppb. Doit être entre 0-60000ppb",
+                 None, 3300, logging.WARNING, "TVOC élevé: {value}ppb - Qualité d'air dégradée"),
+    }
+    
+    @classmethod
+    def validate_range(cls, field, value):
+        """Valider une valeur selon RANGES (journalise les valeurs anormales)"""
+        if value is None:
+            return value
+        low, high, error, warn_low, warn_high, level, warning = cls.RANGES[field]
+        if not (low <= value <= high):
+            raise ValidationError(error.format(value=value))
+        if (warn_low is not None and value < warn_low) or (warn_high is not None and value > warn_high):
+            logger.log(level, warning.format(value=value))
+        return value
+    
     @staticmethod
     def validate_spo2(value):
         """Valider SpO2 - Critique pour la sécurité sanitaire"""
-        if value is not None:
-            if not (70 <= value <= 100):
-                raise ValidationError(f"SpO2 invalide: {value}%. Doit être entre 70-100%")
-            if value < 85:
-                # Log critique - SpO2 dangereux
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.critical(f"SpO2 critique détectée: {value}% - Alerte médicale requise")
-        return value
+        return SensorDataValidator.validate_range('spo2', value)
     
     @staticmethod
     def validate_respiratory_rate(value):
         """Valider fréquence respiratoire - Critique"""
-        if value is not None:
-            if not (5 <= value <= 60):
-                raise ValidationError(f"Fréquence respiratoire invalide: {value}/min. Doit être entre 5-60/min")
-            if value < 8 or value > 40:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning(f"Fréquence respiratoire anormale: {value}/min")
-        return value
+        return SensorDataValidator.validate_range('respiratory_rate', value)
     
     @staticmethod
     def validate_heart_rate(value):
         """Valider fréquence cardiaque"""
-        if value is not None:
-            if not (30 <= value <= 250):
-                raise ValidationError(f"Fréquence cardiaque invalide: {value} bpm. Doit être entre 30-250 bpm")
-            if value < 40 or value > 200:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning(f"Fréquence cardiaque anormale: {value} bpm")
-        return value
+        return SensorDataValidator.validate_range('heart_rate', value)
     
     @staticmethod
     def validate_aqi(value):
         """Valider AQI"""
-        if value is not None:
-            if not (0 <= value <= 500):
-                raise ValidationError(f"AQI invalide: {value}. Doit être entre 0-500")
-            if value > 300:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.critical(f"AQI dangereux: {value} - Alerte environnementale")
-        return value
+        return SensorDataValidator.validate_range('aqi', value)
     
     @staticmethod
     def validate_temperature(value):
         """Valider température corporelle"""
-        if value is not None:
-            if not (30.0 <= value <= 45.0):
-                raise ValidationError(f"Température invalide: {value}°C. Doit être entre 30-45°C")
-            if value < 35.0 or value > 42.0:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning(f"Température corporelle anormale: {value}°C")
-        return value
+        return SensorDataValidator.validate_range('temperature', value)
     
     @staticmethod
     def validate_humidity(value):
         """Valider humidité - DHT11"""
-        if value is not None:
-            if not (0 <= value <= 100):
-                raise ValidationError(f"Humidité invalide: {value}%. Doit être entre 0-100%")
-        return value
+        return SensorDataValidator.validate_range('humidity', value)
     
     @staticmethod
     def validate_eco2(value):
         """Valider eCO2 - CJMCU-811"""
-        if value is not None:
-            if not (350 <= value <= 8192):  # Plage typique CJMCU-811
-                raise ValidationError(f"eCO2 invalide: {value}ppm. Doit être entre 350-8192ppm")
-            if value > 5000:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning(f"eCO2 très élevé: {value}ppm - Ventilation requise")
-        return value
+        return SensorDataValidator.validate_range('eco2', value)
     
     @staticmethod
     def validate_tvoc(value):
         """Valider TVOC - CJMCU-811"""
-        if value is not None:
-            if not (0 <= value <= 60000):  # Plage typique CJMCU-811
-                raise ValidationError(f"TVOC invalide: {value}ppb. Doit être entre 0-60000ppb")
-            if value > 3300:  # Seuil d'alerte TVOC
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning(f"TVOC élevé: {value}ppb - Qualité d'air dégradée")
-        return value
+        return SensorDataValidator.validate_range('tvoc', value)
     
     @staticmethod
-    def validate_data_integrity(data):
-        """Valider l'intégrité globale des données"""
+    def integrity_warnings(data):
+        """Incohérences entre métriques d'une lecture: liste de (niveau, message)"""
+        warnings = []
         # Vérifier la cohérence entre les métriques médicales
         spo2 = data.get('spo2')
         heart_rate = data.get('heart_rate')
@@ -111,24 +98,25 @@ class SensorDataValidator:
         # Vérifier la cohérence environnementale
         eco2 = data.get('eco2')
         tvoc = data.get('tvoc')
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
         
         # Détection d'anomalies médicales corrélées
         if spo2 and heart_rate and respiratory_rate:
             if spo2 < 90 and heart_rate < 60 and respiratory_rate > 30:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.critical("Combinaison de valeurs médicales suspecte - Possible urgence médicale")
+                warnings.append((logging.CRITICAL, "Combinaison de valeurs médicales suspecte - Possible urgence médicale"))
         
         # Cohérence capteurs environnementaux Ubidots
         if eco2 and tvoc:
             # eCO2 et TVOC doivent être corrélés
             if eco2 > 2000 and tvoc < 200:
-                import logging
-                logger = logging.getLogger('django.security')
-                logger.warning("Incohérence eCO2/TVOC détectée - Vérifier capteur CJMCU-811")
+                warnings.append((logging.WARNING, "Incohérence eCO2/TVOC détectée - Vérifier capteur CJMCU-811"))
         
+        return warnings
+    
+    @staticmethod
+    def validate_data_integrity(data):
+        """Valider l'intégrité globale des données"""
+        for level, message in SensorDataValidator.integrity_warnings(data):
+            logger.log(level, message)
         return data
 
 
@@ -163,8 +151,6 @@ class APISecurityValidator:
         limit = limits.get(endpoint, 20)  # Limite par défaut
         
         if len(requests) >= limit:
-            import logging
-            logger = logging.getLogger('django.security')
             logger.warning(f"Rate limit dépassé pour {user.email} sur {endpoint}: {len(requests)}/{limit}")
             raise ValidationError(f"Limite de fréquence dépassée pour {endpoint}")
         
@@ -181,8 +167,6 @@ class APISecurityValidator:
         
         if data_type in sensitive_types:
             # Log l'accès aux données sensibles
-            import logging
-            logger = logging.getLogger('django.security')
             logger.info(f"Accès données sensibles: {user.email} -> {data_type}")
             
             # Vérifier que l'utilisateur a les permissions appropriées
@@ -237,15 +221,11 @@ class SecurityMiddleware:
         """Vérifications de sécurité spécifiques aux APIs médicales"""
         if request.user.is_authenticated:
             # Log d'accès aux données médicales
-            import logging
-            logger = logging.getLogger('django.security')
             hashed_user = DataEncryptionHelper.hash_user_identifier(request.user.id)
             logger.info(f"Accès API médicale: User#{hashed_user} -> {request.path}")
     
     def _log_medical_api_access(self, request, response):
         """Logger les accès aux données médicales pour audit"""
         if response.status_code >= 400:
-            import logging
-            logger = logging.getLogger('django.security')
             hashed_user = DataEncryptionHelper.hash_user_identifier(request.user.id) if request.user.is_authenticated else "Anonymous"
             logger.warning(f"Échec API médicale: User#{hashed_user} -> {request.path} (Status: {response.status_code})")
\ No newline at end of file
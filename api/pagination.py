@@ -0,0 +1,45 @@
+"""
+Pagination par curseur (keyset) des historiques par utilisateur
+
+Remplace PageNumberPagination sur les listes volumineuses: pas de COUNT(*)
+ni d'OFFSET, chaque page est lue sur l'index (user, timestamp) à coût
+constant quelle que soit sa profondeur. Le total est opt-in: ?count=true.
+"""
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class TimestampCursorPagination(CursorPagination):
+    """Curseur sur (timestamp, id), plus récent d'abord"""
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.total = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.total is not None:
+            payload['count'] = self.total
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+
+class CreatedAtCursorPagination(TimestampCursorPagination):
+    """
+    Curseur sur (created_at, id), plus récent d'abord (historique de conversation)
+
+    La première page porte les derniers messages; next remonte le temps.
+    Le client inverse chaque page pour l'afficher dans l'ordre chronologique.
+    """
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,38 @@
+"""
+Rendu JSON rapide (orjson, optionnel)
+
+orjson encode en une passe C: datetime, date, UUID et tableaux NumPy
+nativement, le reste (Decimal, timedelta, QuerySet, chaînes paresseuses...)
+via l'encodeur DRF. Sans orjson, ou pour un rendu indenté (API navigable,
+Accept: application/json; indent=4), on retombe sur JSONRenderer.
+"""
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson optionnel: rendu JSON standard
+    orjson = None
+
+if orjson is not None:
+    # Non-chaînes en clés de dict converties comme json.dumps, UTC écrit 'Z' comme DRF
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer encodé par orjson (UTF-8, compact)"""
+    _fallback_encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._fallback_encoder.default, option=ORJSON_OPTIONS)
+        # Comme JSONRenderer: U+2028 / U+2029 échappés (sous-ensemble strict de JavaScript)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
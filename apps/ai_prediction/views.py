@@ -6,11 +6,11 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.utils import timezone
-from django.db.models import Avg, Max, Min, Q
 from datetime import timedelta
 from apps.environment.services.weather_service import WeatherService
 from apps.environment.services.air_quality_service import AirQualityService
-from apps.sensors.models import SensorData
+from apps.sensors import rollups
+from apps.sensors.latest_state import get_latest_state
 import logging
 
 logger = logging.getLogger(__name__)
@@ -100,13 +100,10 @@ def ai_prediction_data(request):
         end_time = timezone.now()
         start_time_sensors = end_time - timedelta(hours=hours_back)
         
-        sensors_query = SensorData.objects.filter(
-            user=user,
-            timestamp__gte=start_time_sensors
-        ).order_by('-timestamp')
-        
-        # Dernière valeur de chaque capteur
-        latest_sensor = sensors_query.first()
+        # Dernière valeur de chaque capteur (état courant, sans tri sur SensorData)
+        latest_sensor = get_latest_state(user)
+        if latest_sensor and latest_sensor.timestamp < start_time_sensors:
+            latest_sensor = None
         
         if latest_sensor:
             sensors_current = {
@@ -122,24 +119,22 @@ def ai_prediction_data(request):
                 "timestamp": latest_sensor.timestamp
             }
             
-            # Statistiques sur la période
-            stats = sensors_query.aggregate(
-                avg_spo2=Avg('spo2'),
-                min_spo2=Min('spo2'),
-                max_spo2=Max('spo2'),
-                avg_heart_rate=Avg('heart_rate'),
-                max_heart_rate=Max('heart_rate'),
-                avg_risk_score=Avg('risk_score')
-            )
+            # Statistiques sur la période (tranches pré-agrégées)
+            summary = rollups.summarize(user, start_time_sensors, now=end_time)
+            stats = {
+                'avg_spo2': rollups.average(summary, 'spo2'),
+                'avg_heart_rate': rollups.average(summary, 'heart_rate'),
+                'avg_risk_score': rollups.average(summary, 'risk_score'),
+            }
             
             sensors_trends = {
                 "avg_spo2": round(stats['avg_spo2'], 1) if stats['avg_spo2'] else None,
-                "min_spo2": stats['min_spo2'],
-                "max_spo2": stats['max_spo2'],
+                "min_spo2": rollups.extremum(summary, 'spo2_min'),
+                "max_spo2": rollups.extremum(summary, 'spo2_max'),
                 "avg_heart_rate": round(stats['avg_heart_rate'], 1) if stats['avg_heart_rate'] else None,
-                "max_heart_rate": stats['max_heart_rate'],
+                "max_heart_rate": rollups.extremum(summary, 'heart_rate_max'),
                 "avg_risk_score": round(stats['avg_risk_score'], 1) if stats['avg_risk_score'] else None,
-                "total_readings": sensors_query.count()
+                "total_readings": summary['count']
             }
         else:
             sensors_current = {
@@ -0,0 +1,181 @@
+"""
+Moteur de règles d'alertes SensorData
+
+Les règles sont décrites une seule fois dans ALERT_RULES et évaluées en une
+passe sur un lot de lectures. Un délai de carence (cooldown) par utilisateur
+et par type d'alerte, conservé dans le cache, évite de générer une alerte par
+lecture pendant un même épisode: seule une aggravation de la sévérité passe
+pendant la carence. Carences et compteur de non lues ne sont écrits dans le
+cache qu'au commit: une ingestion annulée puis rejouée n'est pas bloquée par
+sa propre carence.
+"""
+import logging
+import operator
+from django.core.cache import cache
+from django.db import transaction
+from apps.sensors import notifications
+from apps.sensors.models import RiskAlert
+from Security.core.security import DataEncryptionHelper
+
+logger = logging.getLogger('django.security')
+
+SEVERITY_RANK = {'INFO': 0, 'WARNING': 1, 'CRITICAL': 2}
+
+# Compteur d'alertes non lues (badge de l'app): TTL court pour borner toute dérive
+UNREAD_COUNT_TTL = 300
+
+# Chaque règle: champ, comparaison, seuil, sévérité (et escalade éventuelle),
+# carence en secondes, message utilisateur et log de sécurité (niveau, format).
+ALERT_RULES = (
+    # ⭐⭐⭐⭐⭐ SpO2 critique
+    {
+        'alert_type': 'LOW_SPO2', 'field': 'spo2', 'op': operator.lt, 'threshold': 90,
+        'severity': 'CRITICAL', 'cooldown': 15 * 60,
+        'message': 'SpO2 critique détectée: {value}% (normal: >95%)',
+        'log': (logging.CRITICAL, 'SpO2 critique User#{user}: {value}%'),
+    },
+    # ⭐⭐⭐⭐⭐ Fréquence respiratoire anormale
+    {
+        'alert_type': 'HIGH_RESPIRATORY_RATE', 'field': 'respiratory_rate', 'op': operator.gt, 'threshold': 30,
+        'severity': 'WARNING', 'cooldown': 15 * 60,
+        'message': 'Fréquence respiratoire élevée: {value}/min (normal: 12-20/min)',
+        'log': (logging.WARNING, 'FR élevée User#{user}: {value}/min'),
+    },
+    # ⭐⭐⭐⭐⭐ Qualité de l'air dangereuse
+    {
+        'alert_type': 'POOR_AIR_QUALITY', 'field': 'aqi', 'op': operator.gt, 'threshold': 150,
+        'severity': 'WARNING', 'escalate': (300, 'CRITICAL'), 'cooldown': 30 * 60,
+        'message': 'Qualité de l\'air dangereuse: AQI {value} (bon: <50)',
+        'log': (logging.WARNING, 'AQI dangereux User#{user}: {value}'),
+    },
+    # ⭐⭐⭐⭐ Fumée détectée
+    {
+        'alert_type': 'SMOKE_DETECTED', 'field': 'smoke_detected', 'op': operator.eq, 'threshold': True,
+        'severity': 'CRITICAL', 'cooldown': 10 * 60,
+        'message': 'Fumée détectée dans votre environnement!',
+        'log': (logging.CRITICAL, 'Fumée détectée User#{user}'),
+    },
+    # ⭐⭐⭐⭐ Pollen élevé
+    {
+        'alert_type': 'HIGH_POLLEN', 'field': 'pollen_level', 'op': operator.eq, 'threshold': 'HIGH',
+        'severity': 'INFO', 'cooldown': 6 * 3600,
+        'message': 'Niveau de pollen élevé aujourd\'hui',
+        'log': None,
+    },
+)
+
+
+def _cooldown_key(user_id, alert_type):
+    return f"sensors:alert_cooldown:{user_id}:{alert_type}"
+
+
+def _unread_key(user_id):
+    return f"sensors:alert_unread:{user_id}"
+
+
+def unread_count(user_id):
+    """Nombre d'alertes non lues: cache, sinon comptage sur l'index partiel"""
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = RiskAlert.objects.filter(user_id=user_id, is_read=False).count()
+        cache.add(key, count, UNREAD_COUNT_TTL)
+    return count
+
+
+def adjust_unread_count(user_id, delta):
+    """Répercuter une variation sur le compteur au commit (absent du cache: recalculé à la lecture)"""
+    if not delta:
+        return
+
+    def apply():
+        try:
+            if delta > 0:
+                cache.incr(_unread_key(user_id), delta)
+            else:
+                cache.decr(_unread_key(user_id), -delta)
+        except ValueError:
+            pass
+    transaction.on_commit(apply)
+
+
+def invalidate_unread_count(user_id):
+    transaction.on_commit(lambda: cache.delete(_unread_key(user_id)))
+
+
+def _triggered(instances):
+    """(instance, règle, valeur, sévérité) pour chaque règle déclenchée, par ordre chronologique"""
+    triggered = []
+    for instance in sorted(instances, key=lambda instance: instance.timestamp):
+        for rule in ALERT_RULES:
+            value = getattr(instance, rule['field'])
+            # Valeur absente ou nulle (capteur retiré du poignet: spo2=0): pas d'alerte
+            if not value or not rule['op'](value, rule['threshold']):
+                continue
+            severity = rule['severity']
+            escalate = rule.get('escalate')
+            if escalate and value > escalate[0]:
+                severity = escalate[1]
+            triggered.append((instance, rule, value, severity))
+    return triggered
+
+
+def evaluate(instances):
+    """
+    Évaluer les règles sur un lot de lectures sauvegardées
+
+    Returns:
+        Liste d'instances RiskAlert non sauvegardées (une par épisode)
+    """
+    triggered = _triggered(instances)
+    if not triggered:
+        return []
+
+    keys = {_cooldown_key(instance.user_id, rule['alert_type']) for instance, rule, _, _ in triggered}
+    # clé -> (timestamp de la dernière alerte, rang de sévérité)
+    state = cache.get_many(keys)
+    updated = {}
+    alerts = []
+
+    for instance, rule, value, severity in triggered:
+        key = _cooldown_key(instance.user_id, rule['alert_type'])
+        reading_time = instance.timestamp.timestamp()
+        rank = SEVERITY_RANK[severity]
+        previous = state.get(key)
+        # Carence mesurée sur l'horodatage des lectures (lots hors-ligne rejoués)
+        if previous and abs(reading_time - previous[0]) < rule['cooldown'] and rank <= previous[1]:
+            continue
+
+        state[key] = updated[key] = (reading_time, rank)
+        if rule['log']:
+            level, message = rule['log']
+            hashed_user = DataEncryptionHelper.hash_user_identifier(instance.user_id)
+            logger.log(level, message.format(user=hashed_user, value=value))
+        alerts.append(RiskAlert(
+            user_id=instance.user_id,
+            sensor_data=instance,
+            alert_type=rule['alert_type'],
+            severity=severity,
+            message=rule['message'].format(value=value),
+        ))
+
+    if updated:
+        timeout = max(rule['cooldown'] for rule in ALERT_RULES)
+        transaction.on_commit(lambda: cache.set_many(updated, timeout))
+    return alerts
+
+
+def create_alerts(instances):
+    """Évaluer un lot de lectures et insérer les alertes en une requête"""
+    alerts = evaluate(instances)
+    if alerts:
+        RiskAlert.objects.bulk_create(alerts)
+        per_user = {}
+        for alert in alerts:
+            per_user[alert.user_id] = per_user.get(alert.user_id, 0) + 1
+        for user_id, count in per_user.items():
+            adjust_unread_count(user_id, count)
+        # Push des alertes critiques via l'outbox, dans la même transaction
+        notifications.enqueue_for_alerts(alerts)
+    return alerts
+
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class SensorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.sensors'
+
+    def ready(self):
+        # Invalidation du cache de résolution device/email -> utilisateur
+        from apps.sensors import signals  # noqa: F401
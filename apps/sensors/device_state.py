@@ -0,0 +1,142 @@
+"""
+Écritures différées de l'état des bracelets (last_sync, is_connected, batterie)
+
+Chaque lecture mettait à jour la ligne BraceletDevice du device: une écriture
+par lecture sur une ligne très sollicitée. L'état le plus récent est gardé en
+mémoire par bracelet et écrit en masse au plus toutes les
+DEVICE_STATE_FLUSH_SECONDS secondes (0 = écriture immédiate du seul bracelet,
+dans la transaction de l'appelant).
+
+L'écriture groupée n'a jamais lieu dans la transaction de l'appelant: après
+son commit (transaction.on_commit) ou depuis le timer. L'état n'est retiré de
+la file qu'une fois écrit, et le cache de résolution des bracelets écrits est
+invalidé (bulk_update n'émet pas post_save).
+"""
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections, transaction
+from apps.sensors import resolver
+from apps.sensors.models import BraceletDevice
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStateBuffer:
+    """Dernier état connu par bracelet, en attente d'écriture"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._owners = {}  # bracelet_id -> user_id (invalidation du bracelet par défaut en cache)
+        self._last_flush = time.monotonic()
+        self._flush_scheduled = False
+        self._timer = None
+
+    def record(self, bracelet, last_sync=None, is_connected=None, battery_level=None):
+        """
+        Enregistrer l'état d'un bracelet (valeurs None ignorées)
+
+        L'instance est mise à jour immédiatement; la base l'est au prochain flush.
+        """
+        state = {
+            field: value for field, value in (
+                ('last_sync', last_sync), ('is_connected', is_connected), ('battery_level', battery_level)
+            ) if value is not None
+        }
+        if not state:
+            return
+
+        interval = settings.DEVICE_STATE_FLUSH_SECONDS
+        if not interval:
+            for field, value in state.items():
+                setattr(bracelet, field, value)
+            self._write({bracelet.pk: state}, {bracelet.pk: bracelet.user_id})
+            return
+
+        with self._lock:
+            pending = self._pending.setdefault(bracelet.pk, {})
+            previous_sync = pending.get('last_sync')
+            pending.update(state)
+            # last_sync ne recule jamais (lots hors-ligne concurrents)
+            if previous_sync and pending.get('last_sync') and pending['last_sync'] < previous_sync:
+                pending['last_sync'] = previous_sync
+            for field in state:
+                setattr(bracelet, field, pending[field])
+            self._owners[bracelet.pk] = bracelet.user_id
+
+            due = time.monotonic() - self._last_flush >= interval and not self._flush_scheduled
+            if due:
+                self._flush_scheduled = True
+            elif self._timer is None:
+                # Écriture garantie même si plus aucune lecture n'arrive
+                self._timer = threading.Timer(interval, self.safe_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due:
+            # Après le commit de l'appelant: ni verrou sur les bracelets des autres, ni perte au rollback
+            transaction.on_commit(self._flush_logged, robust=True)
+
+    def flush(self):
+        """Écrire l'état en attente (une requête bulk_update par ensemble de champs)"""
+        with self._lock:
+            pending = {bracelet_id: dict(state) for bracelet_id, state in self._pending.items()}
+            owners = dict(self._owners)
+            self._flush_scheduled = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        self._write(pending, owners)
+
+        with self._lock:
+            # Retiré seulement une fois écrit, et s'il n'a pas changé entre-temps
+            for bracelet_id, state in pending.items():
+                if self._pending.get(bracelet_id) == state:
+                    del self._pending[bracelet_id]
+                    self._owners.pop(bracelet_id, None)
+            self._last_flush = time.monotonic()
+        return len(pending)
+
+    @staticmethod
+    def _write(pending, owners):
+        groups = {}
+        for bracelet_id, state in pending.items():
+            groups.setdefault(tuple(sorted(state)), []).append(BraceletDevice(pk=bracelet_id, **state))
+        for fields, bracelets in groups.items():
+            BraceletDevice.objects.bulk_update(bracelets, fields)
+
+        # bulk_update n'émet pas post_save: un bracelet déconnecté ne doit plus être servi
+        # comme bracelet par défaut (une connexion ne rend pas le cache faux, None n'y est pas gardé)
+        disconnected = [
+            owners[bracelet_id] for bracelet_id, state in pending.items()
+            if state.get('is_connected') is False and bracelet_id in owners
+        ]
+        if disconnected:
+            resolver.forget_default_bracelets(*disconnected)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Écriture différée de l'état des bracelets en échec: {e}")
+
+    def safe_flush(self):
+        """flush() hors requête (timer, arrêt du processus): erreurs journalisées"""
+        try:
+            self._flush_logged()
+        finally:
+            # Connexion propre à ce thread
+            connections.close_all()
+
+
+buffer = DeviceStateBuffer()
+record = buffer.record
+flush = buffer.flush
+
+atexit.register(buffer.safe_flush)
@@ -0,0 +1,235 @@
+"""
+Export en flux de l'historique capteurs (CSV, NDJSON, Parquet)
+
+Les lignes sont lues par blocs de EXPORT_CHUNK_SIZE (pagination keyset sur
+(timestamp, id), une requête courte par bloc) et encodées au fil de l'eau:
+la mémoire reste constante quelle que soit la période exportée. Sous ASGI,
+le flux est un itérateur asynchrone (bloc lu et encodé via sync_to_async):
+Django ne le matérialise pas avant le premier octet comme un itérateur
+synchrone. Parquet nécessite pyarrow (optionnel), un groupe de lignes par bloc.
+"""
+import csv
+import json
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from apps.sensors.models import RiskAlert, SensorData
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow optionnel: export Parquet indisponible
+    pa = pq = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Jeu de données -> (modèle, colonnes exportées)
+DATASETS = {
+    'readings': (SensorData, (
+        'id', 'timestamp', 'bracelet_id', 'spo2', 'heart_rate', 'respiratory_rate',
+        'temperature', 'humidity', 'eco2', 'tvoc', 'aqi', 'smoke_detected', 'pollen_level',
+        'activity_level', 'steps', 'spo2_variation_1h', 'aqi_avg_3h', 'risk_score', 'risk_level',
+    )),
+    'alerts': (RiskAlert, (
+        'id', 'timestamp', 'sensor_data_id', 'alert_type', 'severity', 'message', 'is_read', 'is_dismissed',
+    )),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Paramètres d'export invalides (réponse 400)"""
+
+
+def available_outputs():
+    return [output for output in CONTENT_TYPES if output != 'parquet' or pa is not None]
+
+
+def _queryset(user, dataset, start=None, end=None):
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.filter(user=user)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    return queryset.order_by('timestamp', 'id').values_list(*fields)
+
+
+def _fetch_chunk(queryset, after, chunk_size):
+    """Bloc suivant la clé (timestamp, id) after, par ordre chronologique"""
+    if after is not None:
+        timestamp, pk = after
+        queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+    return list(queryset[:chunk_size])
+
+
+def iter_chunks(user, dataset, start=None, end=None, chunk_size=None):
+    """Listes de tuples des colonnes du jeu de données, par ordre chronologique"""
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    queryset = _queryset(user, dataset, start, end)
+    after = None
+    while True:
+        rows = _fetch_chunk(queryset, after, chunk_size)
+        if not rows:
+            return
+        yield rows
+        # Colonnes 'id' puis 'timestamp' en tête de chaque jeu de données
+        after = (rows[-1][1], rows[-1][0])
+
+
+class _Echo:
+    """Pseudo-fichier: csv.writer renvoie la ligne encodée au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+class CSVEncoder:
+    def __init__(self, model, fields):
+        self.fields = fields
+        self._writer = csv.writer(_Echo())
+
+    def begin(self):
+        return self._writer.writerow(self.fields)
+
+    def encode(self, rows):
+        return ''.join(
+            self._writer.writerow(value.isoformat() if hasattr(value, 'isoformat') else value for value in row)
+            for row in rows
+        )
+
+    def end(self):
+        return ''
+
+
+class NDJSONEncoder:
+    def __init__(self, model, fields):
+        self.fields = fields
+
+    def begin(self):
+        return ''
+
+    def encode(self, rows):
+        return ''.join(json.dumps(dict(zip(self.fields, row)), cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+    def end(self):
+        return ''
+
+
+class _ParquetSink:
+    """Fichier en écriture seule dont les octets sont récupérés après chaque groupe de lignes"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def _arrow_type(model, field):
+    internal = model._meta.get_field(field[:-3] if field.endswith('_id') else field).get_internal_type()
+    if internal == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    if internal == 'BooleanField':
+        return pa.bool_()
+    if internal == 'FloatField':
+        return pa.float64()
+    if internal in ('CharField', 'TextField'):
+        return pa.string()
+    return pa.int64()
+
+
+class ParquetEncoder:
+    def __init__(self, model, fields):
+        self.fields = fields
+        self._schema = pa.schema([(field, _arrow_type(model, field)) for field in fields])
+        self._sink = _ParquetSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+
+    def begin(self):
+        return self._sink.drain()
+
+    def encode(self, rows):
+        self._writer.write_table(
+            pa.Table.from_pylist([dict(zip(self.fields, row)) for row in rows], schema=self._schema)
+        )
+        return self._sink.drain()
+
+    def end(self):
+        self._writer.close()
+        return self._sink.drain()
+
+
+ENCODERS = {'csv': CSVEncoder, 'ndjson': NDJSONEncoder, 'parquet': ParquetEncoder}
+
+
+def _stream(encoder, chunks):
+    yield encoder.begin()
+    for rows in chunks:
+        yield encoder.encode(rows)
+    yield encoder.end()
+
+
+def _encode_next(encoder, queryset, after, chunk_size):
+    """Bloc suivant lu et encodé (un seul aller-retour sync_to_async): (données, clé) ou (None, None)"""
+    rows = _fetch_chunk(queryset, after, chunk_size)
+    if not rows:
+        return None, None
+    return encoder.encode(rows), (rows[-1][1], rows[-1][0])
+
+
+async def _astream(encoder, queryset):
+    encode_next = sync_to_async(_encode_next)
+    chunk_size = EXPORT_CHUNK_SIZE
+    yield encoder.begin()
+    after = None
+    while True:
+        data, after = await encode_next(encoder, queryset, after, chunk_size)
+        if data is None:
+            break
+        yield data
+    yield await sync_to_async(encoder.end)()
+
+
+def export_stream(user, output, dataset='readings', start=None, end=None, asynchronous=False):
+    """
+    Octets / chaînes de l'export: générateur, ou itérateur asynchrone (ASGI)
+
+    Raises:
+        ExportError: format ou jeu de données inconnu, pyarrow absent
+    """
+    if output not in CONTENT_TYPES:
+        raise ExportError(f"output invalide (choix: {', '.join(available_outputs())})")
+    if output == 'parquet' and pa is None:
+        raise ExportError("Export Parquet indisponible (pyarrow non installé)")
+    if dataset not in DATASETS:
+        raise ExportError(f"dataset invalide (choix: {', '.join(DATASETS)})")
+
+    model, fields = DATASETS[dataset]
+    encoder = ENCODERS[output](model, fields)
+    if asynchronous:
+        return _astream(encoder, _queryset(user, dataset, start, end))
+    return _stream(encoder, iter_chunks(user, dataset, start, end))
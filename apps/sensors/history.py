@@ -0,0 +1,172 @@
+"""
+Historique agrégé par tranches de temps (graphiques)
+
+Une seule requête groupée: sur les tranches SensorRollup quand elles couvrent
+la demande, sinon sur SensorData tronqué en base (TruncMinute/Hour/Day). Les
+sous-tranches sont ensuite regroupées à la taille demandée (5m, 6h...).
+La réponse est en colonnes: une liste par métrique et par agrégat.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+from apps.sensors import rollups
+from apps.sensors.models import SensorData, SensorRollup
+
+BUCKETS = {
+    '1m': timedelta(minutes=1),
+    '5m': timedelta(minutes=5),
+    '15m': timedelta(minutes=15),
+    '1h': timedelta(hours=1),
+    '6h': timedelta(hours=6),
+    '1d': timedelta(days=1),
+}
+# Résolution SensorRollup / troncature SQL qui divise chaque taille de tranche
+SOURCE_RESOLUTIONS = {'1m': '1m', '5m': '1m', '15m': '1m', '1h': '1h', '6h': '1h', '1d': '1d'}
+TRUNCATE = {'1m': TruncMinute, '1h': TruncHour, '1d': TruncDay}
+
+METRICS = rollups.METRICS + ('temperature', 'humidity', 'eco2', 'tvoc')
+AGGREGATES = ('avg', 'min', 'max', 'sum', 'count')
+
+# Points max par réponse (1 semaine en 5m = 2016)
+MAX_BUCKETS = 5000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class HistoryQueryError(ValueError):
+    """Paramètres d'historique invalides (réponse 400)"""
+
+
+def align(timestamp, size):
+    """Début de la tranche de taille size contenant timestamp (tranches alignées sur l'epoch, UTC)"""
+    return EPOCH + (timestamp - EPOCH) // size * size
+
+
+def _merge(target, row, metrics):
+    target['count'] += row['count'] or 0
+    for metric in metrics:
+        target[f'{metric}_count'] += row[f'{metric}_count'] or 0
+        target[f'{metric}_sum'] += row[f'{metric}_sum'] or 0
+        for suffix, pick in (('min', min), ('max', max)):
+            field = f'{metric}_{suffix}'
+            if row[field] is not None:
+                target[field] = row[field] if target[field] is None else pick(target[field], row[field])
+
+
+def _empty(metrics):
+    values = {'count': 0}
+    for metric in metrics:
+        values.update({f'{metric}_count': 0, f'{metric}_sum': 0, f'{metric}_min': None, f'{metric}_max': None})
+    return values
+
+
+def _rollup_rows(user, resolution, start, end, metrics):
+    fields = ['count'] + [f'{metric}_{suffix}' for metric in metrics for suffix in ('count', 'sum', 'min', 'max')]
+    rows = SensorRollup.objects.filter(
+        user=user, resolution=resolution, bucket__gte=start, bucket__lt=end
+    ).values('bucket', *fields)
+    for row in rows:
+        yield row['bucket'], row
+
+
+def _raw_rows(user, resolution, start, end, metrics):
+    aggregates = {'count': Count('id')}
+    for metric in metrics:
+        aggregates.update({
+            f'{metric}_count': Count(metric),
+            f'{metric}_sum': Sum(metric),
+            f'{metric}_min': Min(metric),
+            f'{metric}_max': Max(metric),
+        })
+    rows = SensorData.objects.filter(
+        user=user, timestamp__gte=start, timestamp__lt=end
+    ).annotate(
+        slot=TRUNCATE[resolution]('timestamp', tzinfo=dt_timezone.utc)
+    ).values('slot').annotate(**aggregates).order_by('slot')
+    for row in rows:
+        yield row['slot'], row
+
+
+def _value(value):
+    if value is None:
+        return None
+    value = round(value, 2)
+    return int(value) if value == int(value) else value
+
+
+def query_history(user, start, end, bucket='1h', metrics=('spo2',), aggregates=('avg',), now=None):
+    """
+    Séries agrégées de user entre start et end
+
+    start et end sont étendus aux bornes des tranches. Seules les tranches
+    contenant des lectures sont renvoyées.
+
+    Returns:
+        dict en colonnes: timestamps, count, puis {métrique: {agrégat: [valeurs]}}
+    """
+    if bucket not in BUCKETS:
+        raise HistoryQueryError(f"bucket invalide (choix: {', '.join(BUCKETS)})")
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if not metrics or unknown:
+        raise HistoryQueryError(f"metrics invalides (choix: {', '.join(METRICS)})")
+    unknown = [aggregate for aggregate in aggregates if aggregate not in AGGREGATES]
+    if not aggregates or unknown:
+        raise HistoryQueryError(f"agg invalides (choix: {', '.join(AGGREGATES)})")
+    if start >= end:
+        raise HistoryQueryError("from doit précéder to")
+
+    size = BUCKETS[bucket]
+    start = align(start, size)
+    end = align(end - timedelta(microseconds=1), size) + size
+    if (end - start) / size > MAX_BUCKETS:
+        raise HistoryQueryError(f"Période trop longue pour bucket={bucket} (max {MAX_BUCKETS} points)")
+
+    resolution = SOURCE_RESOLUTIONS[bucket]
+    now = now or timezone.now()
+    horizon = now - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS)
+    use_rollups = (
+        all(metric in rollups.METRICS for metric in metrics)
+        and (resolution != '1m' or start >= horizon)
+    )
+    if use_rollups:
+        rows = _rollup_rows(user, resolution, start, end, metrics)
+        source = f'rollup_{resolution}'
+    else:
+        rows = _raw_rows(user, resolution, start, end, metrics)
+        source = 'raw'
+
+    buckets = {}
+    for slot, row in rows:
+        _merge(buckets.setdefault(align(slot, size), _empty(metrics)), row, metrics)
+
+    timestamps = sorted(buckets)
+    series = {}
+    for metric in metrics:
+        columns = {}
+        for aggregate in aggregates:
+            values = []
+            for timestamp in timestamps:
+                bucket_values = buckets[timestamp]
+                count = bucket_values[f'{metric}_count']
+                if aggregate == 'avg':
+                    values.append(_value(bucket_values[f'{metric}_sum'] / count) if count else None)
+                elif aggregate == 'count':
+                    values.append(count)
+                elif aggregate == 'sum':
+                    values.append(_value(bucket_values[f'{metric}_sum']) if count else None)
+                else:
+                    values.append(_value(bucket_values[f'{metric}_{aggregate}']))
+            columns[aggregate] = values
+        series[metric] = columns
+
+    return {
+        'from': start,
+        'to': end,
+        'bucket': bucket,
+        'source': source,
+        'timestamps': timestamps,
+        'count': [buckets[timestamp]['count'] for timestamp in timestamps],
+        'series': series,
+    }
@@ -0,0 +1,229 @@
+"""
+File d'ingestion write-behind pour le webhook Ubidots
+
+Le webhook n'écrit qu'une ligne IngestQueueItem et répond 202; le consommateur
+(commande drain_ingest_queue) vide la file par lots avec des insertions en masse.
+"""
+import logging
+from django.db import transaction
+from apps.sensors import device_state, resolver
+from apps.sensors.models import BraceletDevice, IngestQueueItem
+from apps.sensors.ingest_service import ingest_ubidots_readings, ubidots_payload_to_reading
+from apps.sensors.validation import validate_batch
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('device_id', 'user_email', 'timestamp', 'data')
+# Essais d'un élément en erreur (exception à l'ingestion) avant abandon en FAILED
+MAX_ATTEMPTS = 5
+UNRESOLVED_ERROR = 'Utilisateur non trouvé ou device associé à un autre utilisateur'
+
+
+def validate_webhook_payload(payload):
+    """Valider la forme d'un payload webhook. Retourne un message d'erreur ou None"""
+    if not isinstance(payload, dict) or not all(key in payload for key in REQUIRED_FIELDS):
+        return 'Champs manquants: device_id, user_email, timestamp, data requis'
+    for key in ('device_id', 'user_email'):
+        if not isinstance(payload[key], str) or not payload[key].strip():
+            return f'{key} doit être une chaîne non vide'
+    if not isinstance(payload['timestamp'], int) or isinstance(payload['timestamp'], bool):
+        return 'timestamp doit être un entier (Unix ms)'
+    if not isinstance(payload['data'], dict):
+        return 'data doit être un objet'
+    return None
+
+
+def validate_webhook_payloads(payloads):
+    """
+    Valider un lot de payloads webhook (forme puis plages capteurs en une passe)
+
+    Returns:
+        (liste de (index, payload) valides, liste de {'index', 'error'})
+    """
+    shaped = []
+    errors = []
+    for index, payload in enumerate(payloads):
+        error = validate_webhook_payload(payload)
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            shaped.append((index, payload))
+
+    range_errors = validate_batch([payload['data'] for _, payload in shaped])
+    for position in range_errors:
+        errors.append({
+            'index': shaped[position][0],
+            'error': '; '.join(message for messages in range_errors[position].values() for message in messages)
+        })
+    valid = [item for position, item in enumerate(shaped) if position not in range_errors]
+    return valid, sorted(errors, key=lambda error: error['index'])
+
+
+def enqueue(payload, source='ubidots_webhook'):
+    """Ajouter un payload déjà validé à la file"""
+    return IngestQueueItem.objects.create(source=source, payload=payload)
+
+
+def enqueue_many(payloads, source='ubidots_webhook'):
+    """Ajouter plusieurs payloads validés à la file en une insertion"""
+    return IngestQueueItem.objects.bulk_create(
+        [IngestQueueItem(source=source, payload=payload) for payload in payloads]
+    )
+
+
+def resolve_targets(payloads):
+    """
+    Résoudre utilisateur et bracelet de chaque (user_email, device_id) du lot
+
+    Passe par le cache de résolution (aucune requête si tout est connu); les
+    devices inconnus d'un utilisateur existant sont créés.
+
+    Returns:
+        dict (email, device_id) -> (user, bracelet), user None si l'email est
+        inconnu, bracelet None si le device appartient à un autre utilisateur
+    """
+    user_ids = resolver.user_ids_for_emails(payload['user_email'] for payload in payloads)
+    known = resolver.devices(payload['device_id'] for payload in payloads)
+
+    targets = {}
+    for payload in payloads:
+        key = (payload['user_email'], payload['device_id'])
+        if key in targets:
+            continue
+        user_id = user_ids.get(payload['user_email'])
+        if user_id is None:
+            targets[key] = (None, None)
+            continue
+
+        device_id = payload['device_id']
+        if device_id not in known:
+            bracelet, _ = BraceletDevice.objects.get_or_create(
+                user_id=user_id,
+                device_id=device_id,
+                defaults={
+                    'device_name': f"Capteurs Ubidots {device_id[-3:]}",
+                    'is_connected': True,
+                    'battery_level': 100
+                }
+            )
+            resolver.remember_device(bracelet)
+            known[device_id] = (bracelet.user_id, bracelet.pk)
+
+        owner_id, bracelet_id = known[device_id]
+        user = resolver.user_ref(user_id)
+        bracelet = resolver.bracelet_ref(bracelet_id, owner_id, device_id) if owner_id == user_id else None
+        targets[key] = (user, bracelet)
+    return targets
+
+
+def ingest_payloads(payloads):
+    """
+    Insérer en masse une liste de payloads webhook validés
+
+    Utilisateurs et bracelets sont résolus via le cache de résolution, les
+    lectures regroupées par device (un timestamp par device: la dernière
+    livraison gagne) puis insérées avec l'ingestion idempotente. Chaque device
+    est ingéré dans son propre savepoint: une erreur n'annule que son groupe.
+
+    Returns:
+        (nombre de lectures créées, indices des payloads non rattachables,
+        dict indice -> message des payloads dont l'ingestion a échoué)
+    """
+    indices_by_device = {}
+    for index, payload in enumerate(payloads):
+        indices_by_device.setdefault(payload['device_id'], []).append(index)
+
+    try:
+        with transaction.atomic():
+            targets = resolve_targets(payloads)
+    except Exception as e:
+        # Résolution refaite device par device: seul le groupe fautif échouera
+        logger.warning(f"⚠️ Résolution groupée impossible ({e}), résolution par device")
+        targets = None
+
+    created = 0
+    unresolved = []
+    errored = {}
+    for device_id, indices in indices_by_device.items():
+        group = [payloads[index] for index in indices]
+        try:
+            with transaction.atomic():
+                group_targets = resolve_targets(group) if targets is None else targets
+                target = None
+                written = []
+                readings = {}
+                for index, payload in zip(indices, group):
+                    user, bracelet = group_targets[(payload['user_email'], device_id)]
+                    if user is None or bracelet is None:
+                        unresolved.append(index)
+                        continue
+                    target = (user, bracelet)
+                    readings[payload['timestamp']] = ubidots_payload_to_reading(payload)
+                if readings:
+                    # Livraisons webhook: le bracelet est connecté (écrit avec last_sync)
+                    written = ingest_ubidots_readings(
+                        *target, device_id, list(readings.values()), is_connected=True, optimistic=True
+                    )
+                    created += len(written)
+        except Exception as e:
+            logger.exception(f"❌ Ingestion du device {device_id} en échec")
+            unresolved = [index for index in unresolved if index not in indices]
+            errored.update((index, f"{type(e).__name__}: {e}") for index in indices)
+            continue
+
+        # Rejeux uniquement: le bracelet est tout de même connecté
+        if target is not None and not written:
+            device_state.record(target[1], is_connected=True)
+
+    return created, sorted(unresolved), errored
+
+
+def drain_queue(batch_size=500):
+    """
+    Traiter un lot d'éléments en attente
+
+    Les éléments sont verrouillés (SKIP LOCKED) pour permettre plusieurs
+    consommateurs. Non rattachables: FAILED. Erreur d'ingestion: le groupe
+    reste PENDING (attempts, error) jusqu'à MAX_ATTEMPTS essais, puis FAILED.
+
+    Returns:
+        dict avec les compteurs processed / created / failed / retried
+    """
+    with transaction.atomic():
+        items = list(
+            IngestQueueItem.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('id')[:batch_size]
+        )
+        if not items:
+            return {'processed': 0, 'created': 0, 'failed': 0, 'retried': 0}
+
+        created, unresolved, errored = ingest_payloads([item.payload for item in items])
+
+        kept = []
+        for index in unresolved:
+            item = items[index]
+            item.status = 'FAILED'
+            item.attempts += 1
+            item.error = UNRESOLVED_ERROR
+            kept.append(item)
+        for index, message in errored.items():
+            item = items[index]
+            item.attempts += 1
+            item.error = message
+            item.status = 'FAILED' if item.attempts >= MAX_ATTEMPTS else 'PENDING'
+            kept.append(item)
+
+        kept_ids = {item.id for item in kept}
+        IngestQueueItem.objects.filter(
+            id__in=[item.id for item in items if item.id not in kept_ids]
+        ).delete()
+        if kept:
+            IngestQueueItem.objects.bulk_update(kept, ['status', 'attempts', 'error'])
+
+    failed = sum(1 for item in kept if item.status == 'FAILED')
+    retried = len(kept) - failed
+    if failed or retried:
+        logger.warning(f"⚠️ File d'ingestion: {failed} éléments en échec, {retried} à réessayer")
+
+    return {'processed': len(items), 'created': created, 'failed': failed, 'retried': retried}
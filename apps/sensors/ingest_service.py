@@ -0,0 +1,138 @@
+"""
+Service d'ingestion des lectures capteurs (unitaire ou en lot)
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from apps.sensors import alert_engine, device_state, latest_state, realtime, resolver, rolling_analytics, rollups
+from apps.sensors.models import SensorData, SensorAnalytics, BraceletDevice
+
+logger = logging.getLogger('django.security')
+
+
+def get_default_bracelet(user):
+    """Bracelet connecté de l'utilisateur (cache de résolution), créé à la volée si besoin"""
+    bracelet = resolver.default_bracelet(user)
+
+    if not bracelet:
+        bracelet = BraceletDevice.objects.create(
+            user=user,
+            device_id=f"default_{user.id}",
+            is_connected=True
+        )
+        resolver.remember_default_bracelet(bracelet)
+    return bracelet
+
+
+def ingest_readings(user, bracelet, readings, is_connected=None):
+    """
+    Enregistrer un lot de lectures validées en une seule transaction
+
+    Args:
+        user: Propriétaire des lectures
+        bracelet: BraceletDevice associé
+        readings: Liste de dicts de champs SensorData déjà validés
+        is_connected: État de connexion à enregistrer avec last_sync (une seule écriture du bracelet)
+
+    Returns:
+        Liste des instances SensorData créées (dans l'ordre d'entrée)
+    """
+    instances = [SensorData(user=user, bracelet=bracelet, **reading) for reading in readings]
+
+    # bulk_create n'appelle pas save(): calculs dérivés faits ici, en une passe vectorisée
+    SensorData.apply_derived_fields_bulk(instances)
+
+    with transaction.atomic():
+        _save_readings(user, bracelet, instances, is_connected)
+
+    return instances
+
+
+def _save_readings(user, bracelet, instances, is_connected=None):
+    """Écritures de l'ingestion (dans la transaction de ingest_readings)"""
+    # Analyses glissantes incrémentales, état verrouillé par utilisateur (remplit spo2_variation_1h / aqi_avg_3h)
+    analytics = rolling_analytics.apply(instances)
+    SensorData.objects.bulk_create(instances)
+    if analytics:
+        SensorAnalytics.objects.bulk_create(analytics)
+    # Tranches pré-agrégées des endpoints de statistiques
+    rollups.update_rollups(instances)
+
+    # Alertes évaluées sur tout le lot, avec carence par type (un épisode = une alerte)
+    alerts = alert_engine.create_alerts(instances)
+    latest_state.update_latest_state(user, bracelet, instances)
+
+    # Diffusion temps réel une fois les lignes visibles
+    transaction.on_commit(lambda: realtime.publish_ingest(instances, alerts))
+
+    device_state.record(bracelet, last_sync=timezone.now(), is_connected=is_connected)
+
+
+def ubidots_payload_to_reading(payload):
+    """Convertir un payload webhook Ubidots en champs SensorData"""
+    data = payload['data']
+    return {
+        # Convertir timestamp Unix (ms) en datetime
+        'timestamp': datetime.fromtimestamp(payload['timestamp'] / 1000, tz=dt_timezone.utc),
+        'spo2': data.get('spo2'),
+        'heart_rate': data.get('heart_rate'),
+        'temperature': data.get('temperature'),
+        'humidity': data.get('humidity'),
+        'eco2': data.get('eco2'),
+        'tvoc': data.get('tvoc'),
+        'respiratory_rate': data.get('respiratory_rate'),
+        'ubidots_device_id': payload['device_id'],
+        'ubidots_timestamp': payload['timestamp'],
+        'activity_level': data.get('activity_level', 'REST'),
+        'steps': data.get('steps', 0),
+    }
+
+
+def existing_ubidots_timestamps(user, device_id, timestamps):
+    """Timestamps Ubidots déjà stockés pour un device, en une seule requête sur la fenêtre"""
+    if not timestamps:
+        return set()
+    return set(
+        SensorData.objects.filter(
+            user=user,
+            ubidots_device_id=device_id,
+            ubidots_timestamp__gte=min(timestamps),
+            ubidots_timestamp__lte=max(timestamps),
+        ).values_list('ubidots_timestamp', flat=True)
+    )
+
+
+def ingest_ubidots_readings(user, bracelet, device_id, readings, is_connected=None, optimistic=False):
+    """
+    Ingestion idempotente de lectures Ubidots (clé: device + ubidots_timestamp)
+
+    Les timestamps déjà présents sont chargés en une requête puis seules les
+    nouvelles lignes sont insérées. Si un webhook concurrent insère les mêmes
+    lectures entre-temps, la contrainte unique fait échouer le lot: on recharge
+    l'existant et on réessaie une fois.
+
+    optimistic=True (livraisons webhook, presque toujours nouvelles): premier
+    essai sans lecture préalable, l'existant n'est chargé qu'après un conflit.
+
+    Returns:
+        Liste des instances SensorData créées
+    """
+    attempts = 3 if optimistic else 2
+    for attempt in range(attempts):
+        existing = set() if optimistic and not attempt else existing_ubidots_timestamps(
+            user, device_id, [reading['ubidots_timestamp'] for reading in readings]
+        )
+        new_readings = [
+            reading for reading in readings
+            if reading['ubidots_timestamp'] not in existing
+        ]
+        if not new_readings:
+            return []
+        try:
+            return ingest_readings(user, bracelet, new_readings, is_connected)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+            logger.info(f"Lectures Ubidots déjà présentes ou insérées en parallèle pour {device_id}, nouvel essai")
+    return []
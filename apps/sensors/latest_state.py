@@ -0,0 +1,72 @@
+"""
+Dernier état connu des capteurs (table LatestSensorState)
+
+Mis à jour par l'ingestion (et recalculé après modification, suppression ou
+rescoring de lectures), il sert les endpoints "état courant" sans requête
+ORDER BY timestamp sur SensorData. Repli sur SensorData pour les lectures
+écrites hors du pipeline d'ingestion (admin, données anciennes).
+"""
+from django.db import transaction
+from apps.sensors.models import BraceletDevice, LatestSensorState, SensorData
+from apps.sensors.serializers import SensorDataSerializer
+
+STATE_FIELDS = (
+    'timestamp', 'spo2', 'heart_rate', 'respiratory_rate', 'temperature', 'humidity',
+    'eco2', 'tvoc', 'aqi', 'smoke_detected', 'pollen_level', 'risk_score', 'risk_level',
+)
+
+
+def _state_values(instance):
+    values = {field: getattr(instance, field) for field in STATE_FIELDS}
+    values['sensor_data'] = instance
+    values['payload'] = SensorDataSerializer(instance).data
+    return values
+
+
+def update_latest_state(user, bracelet, instances):
+    """Enregistrer la lecture la plus récente du lot si elle est plus récente que l'état connu"""
+    if not instances:
+        return
+    newest = max(instances, key=lambda instance: instance.timestamp)
+    values = _state_values(newest)
+
+    # Cas courant: une seule requête UPDATE conditionnelle
+    updated = LatestSensorState.objects.filter(
+        user=user, bracelet=bracelet, timestamp__lt=newest.timestamp
+    ).update(**values)
+    if not updated:
+        LatestSensorState.objects.get_or_create(user=user, bracelet=bracelet, defaults=values)
+
+
+def refresh_latest_state(user_ids):
+    """Recalculer l'état des utilisateurs depuis leurs lectures restantes les plus récentes (par bracelet)"""
+    bracelets = BraceletDevice.objects.filter(user_id__in=user_ids).values_list('id', 'user_id')
+    with transaction.atomic():
+        for bracelet_id, user_id in bracelets:
+            newest = SensorData.objects.filter(
+                user_id=user_id, bracelet_id=bracelet_id
+            ).order_by('-timestamp').first()
+            if newest is None:
+                LatestSensorState.objects.filter(user_id=user_id, bracelet_id=bracelet_id).delete()
+            else:
+                LatestSensorState.objects.update_or_create(
+                    user_id=user_id, bracelet_id=bracelet_id, defaults=_state_values(newest)
+                )
+
+
+def get_latest_state(user):
+    """
+    Dernier état connu de l'utilisateur (tous bracelets confondus)
+
+    Returns:
+        LatestSensorState (ou SensorData en repli, mêmes attributs) ou None.
+        L'attribut payload contient la représentation SensorDataSerializer.
+    """
+    state = LatestSensorState.objects.filter(user=user).order_by('-timestamp').first()
+    if state is not None:
+        return state
+
+    latest = SensorData.objects.filter(user=user).order_by('-timestamp').first()
+    if latest is not None:
+        latest.payload = SensorDataSerializer(latest).data
+    return latest
@@ -0,0 +1,55 @@
+"""
+Benchmark du score de risque: évaluation ligne par ligne vs lot vectorisé
+"""
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.sensors import risk_engine
+
+
+class Command(BaseCommand):
+    help = "Compare le débit (lignes/s) du calcul de risque scalaire et vectorisé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if risk_engine.np is None:
+            raise CommandError("NumPy n'est pas installé: pas de chemin vectorisé à mesurer")
+
+        rows = options['rows']
+        rng = random.Random(options['seed'])
+
+        def column(low, high, missing=0.1):
+            return [None if rng.random() < missing else rng.randint(low, high) for _ in range(rows)]
+
+        columns = {
+            'spo2': column(80, 100),
+            'respiratory_rate': column(8, 40),
+            'aqi': column(0, 400),
+            'eco2': column(350, 6000),
+            'tvoc': column(0, 4000),
+            'heart_rate': column(40, 140),
+            'smoke_detected': [rng.random() < 0.02 for _ in range(rows)],
+        }
+
+        start = time.perf_counter()
+        scalar = [
+            risk_engine.score_row(**{field: columns[field][i] for field in risk_engine.RISK_FIELDS})
+            if risk_engine.is_scorable(columns['spo2'][i], columns['aqi'][i]) else None
+            for i in range(rows)
+        ]
+        scalar_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorized, _ = risk_engine.score_batch(columns)
+        vector_seconds = time.perf_counter() - start
+
+        if scalar != vectorized:
+            raise CommandError("❌ Résultats divergents entre scalaire et vectorisé")
+
+        self.stdout.write(f"Lignes: {rows}")
+        self.stdout.write(f"Scalaire:   {rows / scalar_seconds:,.0f} lignes/s ({scalar_seconds:.3f}s)")
+        self.stdout.write(f"Vectorisé:  {rows / vector_seconds:,.0f} lignes/s ({vector_seconds:.3f}s)")
+        self.stdout.write(self.style.SUCCESS(f"✅ Accélération x{scalar_seconds / vector_seconds:.1f}, résultats identiques"))
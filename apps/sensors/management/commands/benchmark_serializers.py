@@ -0,0 +1,95 @@
+"""
+Benchmark de la sérialisation en lecture: ModelSerializer DRF vs read_serializers
+"""
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from apps.sensors import read_serializers
+from apps.sensors.models import RiskAlert, SensorAnalytics, SensorData
+from apps.sensors.serializers import RiskAlertSerializer, SensorAnalyticsSerializer, SensorDataSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare le débit (lignes/s) des serializers DRF et des serializers de lecture rapides"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+
+        def maybe(value, missing=0.1):
+            return None if rng.random() < missing else value
+
+        readings = [
+            SensorData(
+                id=i + 1, user_id=1, bracelet_id=1,
+                timestamp=now - timedelta(seconds=5 * i, microseconds=rng.randint(0, 999999)),
+                created_at=now, spo2=maybe(rng.randint(85, 100)), heart_rate=maybe(rng.randint(45, 140)),
+                respiratory_rate=maybe(rng.randint(10, 30)), temperature=maybe(rng.uniform(18, 35)),
+                humidity=maybe(rng.uniform(20, 90)), eco2=maybe(rng.randint(400, 3000)),
+                tvoc=maybe(rng.randint(0, 1000)), aqi=maybe(rng.randint(0, 300)),
+                smoke_detected=rng.random() < 0.02, pollen_level=rng.choice(['LOW', 'MEDIUM', 'HIGH']),
+                activity_level=rng.choice(['REST', 'WALK', 'RUN']), steps=rng.randint(0, 200),
+                hour_of_day=rng.randint(0, 23), spo2_variation_1h=maybe(rng.uniform(0, 5)),
+                aqi_avg_3h=maybe(rng.uniform(0, 200)), risk_score=maybe(rng.randint(0, 100)),
+                risk_level=rng.choice(['LOW', 'MODERATE', 'HIGH', 'CRITICAL']),
+            )
+            for i in range(rows)
+        ]
+        alerts = [
+            RiskAlert(
+                id=i + 1, user_id=1, sensor_data_id=maybe(i + 1), timestamp=now - timedelta(minutes=i),
+                alert_type=rng.choice(['LOW_SPO2', 'POOR_AIR_QUALITY', 'COMPOSITE_RISK']),
+                severity=rng.choice(['INFO', 'WARNING', 'CRITICAL']),
+                message='Alerte de test', is_read=rng.random() < 0.5, is_dismissed=False,
+            )
+            for i in range(rows)
+        ]
+        analytics = [
+            SensorAnalytics(
+                id=i + 1, user_id=1, timestamp=now - timedelta(minutes=5 * i), created_at=now,
+                spo2_avg_1h=maybe(rng.uniform(90, 99)), aqi_avg_24h=maybe(rng.uniform(0, 200)),
+                respiratory_health_score=maybe(rng.randint(0, 100)),
+                environmental_risk_score=maybe(rng.randint(0, 100)),
+            )
+            for i in range(rows)
+        ]
+
+        renderer = JSONRenderer()
+        total_drf = total_fast = 0
+        for label, serializer_class, reader, instances in (
+            ('SensorData', SensorDataSerializer, read_serializers.sensor_data, readings),
+            ('RiskAlert', RiskAlertSerializer, read_serializers.risk_alerts, alerts),
+            ('SensorAnalytics', SensorAnalyticsSerializer, read_serializers.sensor_analytics, analytics),
+        ):
+            # Lignes telles que renvoyées par values_list(*reader.columns)
+            tuples = [tuple(getattr(instance, column) for column in reader.columns) for instance in instances]
+
+            start = time.perf_counter()
+            drf = serializer_class(instances, many=True).data
+            drf_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            fast = reader.to_representation(tuples)
+            fast_seconds = time.perf_counter() - start
+
+            if renderer.render(drf) != renderer.render(fast):
+                raise CommandError(f"❌ {label}: sortie JSON différente du serializer DRF")
+
+            total_drf += drf_seconds
+            total_fast += fast_seconds
+            self.stdout.write(
+                f"{label:<16} DRF: {rows / drf_seconds:>10,.0f} lignes/s  "
+                f"rapide: {rows / fast_seconds:>10,.0f} lignes/s  x{drf_seconds / fast_seconds:.1f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Accélération x{total_drf / total_fast:.1f}, JSON identique octet pour octet"
+        ))
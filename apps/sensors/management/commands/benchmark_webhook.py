@@ -0,0 +1,68 @@
+"""
+Benchmark du webhook Ubidots: vue DRF historique vs ingestion allégée
+"""
+import json
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compare le débit (lectures/s) de ubidots/webhook/ et ubidots/ingest/ (rien n'est conservé)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        readings = options['readings']
+        batch_size = options['batch_size']
+
+        # Tout est annulé à la fin: ni utilisateur ni lectures ne restent en base
+        with override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False,
+                               UBIDOTS_WEBHOOK_ASYNC=False), transaction.atomic():
+            email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+            User.objects.create_user(username=email, email=email, password=uuid.uuid4().hex)
+            client = Client()
+
+            results = [
+                ('webhook (DRF, 1/requête)', self._run(client, '/api/v1/sensors/ubidots/webhook/', email, readings, 1)),
+                ('ingest (1/requête)', self._run(client, '/api/v1/sensors/ubidots/ingest/', email, readings, 1)),
+                (f'ingest ({batch_size}/requête)', self._run(client, '/api/v1/sensors/ubidots/ingest/', email, readings, batch_size)),
+            ]
+            transaction.set_rollback(True)
+
+        baseline = results[0][1]
+        self.stdout.write(f"Lectures: {readings}")
+        for label, seconds in results:
+            self.stdout.write(
+                f"{label:<28} {readings / seconds:,.0f} lectures/s ({seconds:.3f}s, x{baseline / seconds:.1f})"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark terminé"))
+
+    def _run(self, client, url, email, readings, batch_size):
+        device_id = f"bench-{uuid.uuid4().hex[:8]}"
+        base_ms = int(timezone.now().timestamp() * 1000)
+        payloads = [
+            {
+                'device_id': device_id,
+                'user_email': email,
+                'timestamp': base_ms - i * 1000,
+                'data': {'spo2': 97, 'heart_rate': 72, 'temperature': 36.6},
+            }
+            for i in range(readings)
+        ]
+
+        start = time.perf_counter()
+        for i in range(0, readings, batch_size):
+            chunk = payloads[i:i + batch_size]
+            body = chunk[0] if batch_size == 1 else chunk
+            response = client.post(url, json.dumps(body), content_type='application/json')
+            assert response.status_code < 300, response.content
+        return time.perf_counter() - start
@@ -0,0 +1,46 @@
+"""
+Réparation et compaction des tranches SensorRollup
+"""
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.sensors import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les tranches SensorRollup closes depuis SensorData (écarts: admin, "
+        "transactions concurrentes) et purge les tranches minute expirées. --all pour le backfill initial. "
+        "Avec --loop, chaque passe ne reprend que les heures closes depuis la précédente"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help="Heures closes compactées à la première passe")
+        parser.add_argument('--all', action='store_true', help="Recalculer tout l'historique")
+        parser.add_argument('--user', help="Email d'un utilisateur (défaut: tous)")
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=3600, help="Pause (s) entre deux passes")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['user']:
+            user_ids = list(get_user_model().objects.filter(email=options['user']).values_list('id', flat=True))
+
+        if options['all']:
+            # Backfill: tout l'historique, tranches ouvertes comprises
+            since = timezone.now()
+            written = rollups.rebuild(user_ids=user_ids)
+        else:
+            written, since = rollups.compact(timezone.now() - timedelta(hours=options['hours']), user_ids=user_ids)
+
+        while True:
+            pruned = rollups.prune()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {written} tranches recalculées, {pruned} tranches minute purgées"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            written, since = rollups.compact(since, user_ids=user_ids)
@@ -0,0 +1,49 @@
+"""
+Envoi des notifications push en attente dans l'outbox
+"""
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from apps.sensors.notifications import dispatch_pending, get_sender
+
+
+class Command(BaseCommand):
+    help = "Envoie par lots les notifications de NotificationOutbox (retry avec backoff)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=2.0, help="Pause (s) quand rien n'est dû")
+
+    def handle(self, *args, **options):
+        # Sans transport réel, refuser de démarrer plutôt que laisser l'outbox croître en silence
+        for provider in settings.NOTIFICATION_SENDERS:
+            try:
+                get_sender(provider)
+            except ImproperlyConfigured as e:
+                raise CommandError(f"❌ {e}")
+
+        batch_size = options['batch_size']
+        total = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0}
+
+        while True:
+            stats = dispatch_pending(batch_size=batch_size)
+            for key, value in stats.items():
+                total[key] += value
+
+            processed = stats['sent'] + stats['retried'] + stats['failed']
+            if processed and options['loop']:
+                self.stdout.write(
+                    f"📲 {stats['sent']} envoyées, {stats['retried']} à réessayer, {stats['failed']} en échec"
+                )
+            # Lot plein: on enchaîne sans pause
+            if processed >= batch_size:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total['sent']} notifications envoyées, {total['retried']} à réessayer, {total['failed']} en échec"
+        ))
@@ -0,0 +1,51 @@
+"""
+Consommateur de la file d'ingestion write-behind du webhook Ubidots
+"""
+import logging
+import time
+from django.core.management.base import BaseCommand
+from apps.sensors.ingest_queue import drain_queue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Insère en masse les payloads webhook mis en file (UBIDOTS_WEBHOOK_ASYNC)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=2.0, help="Pause (s) quand la file est vide")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = {'processed': 0, 'created': 0, 'failed': 0, 'retried': 0}
+
+        while True:
+            try:
+                stats = drain_queue(batch_size=batch_size)
+            except Exception:
+                # Erreur hors des groupes (verrouillage, mise à jour de la file): le lot est rejoué
+                if not options['loop']:
+                    raise
+                logger.exception("❌ Lot de la file d'ingestion en échec")
+                time.sleep(options['interval'])
+                continue
+            for key, value in stats.items():
+                total[key] += value
+
+            if stats['processed'] and options['loop']:
+                self.stdout.write(
+                    f"📥 {stats['processed']} payloads, {stats['created']} lectures, "
+                    f"{stats['failed']} échecs, {stats['retried']} à réessayer"
+                )
+            # Lot plein: on enchaîne sans pause
+            if stats['processed'] >= batch_size:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total['processed']} payloads traités, {total['created']} lectures créées, {total['failed']} échecs"
+        ))
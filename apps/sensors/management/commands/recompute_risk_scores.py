@@ -0,0 +1,56 @@
+"""
+Recalcul historique des scores de risque SensorData (après changement de seuils)
+"""
+from django.core.management.base import BaseCommand
+from apps.sensors.models import SensorData
+from apps.sensors import latest_state, risk_engine, rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcule risk_score / risk_level de l'historique SensorData par lots vectorisés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Email d'un utilisateur (défaut: tous)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = SensorData.objects.only(
+            'id', 'user_id', 'risk_score', 'risk_level', *risk_engine.RISK_FIELDS
+        ).order_by('id')
+        if options['user']:
+            queryset = queryset.filter(user__email=options['user'])
+
+        scanned = updated = 0
+        user_ids = set()
+        chunk = []
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(instance)
+            if len(chunk) >= chunk_size:
+                updated += self._recompute(chunk, user_ids)
+                scanned += len(chunk)
+                chunk = []
+        if chunk:
+            updated += self._recompute(chunk, user_ids)
+            scanned += len(chunk)
+
+        if updated:
+            # risk_score / risk_level sont agrégés dans les tranches et copiés dans le dernier état
+            rollups.rebuild(user_ids=list(user_ids) if options['user'] else None)
+            latest_state.refresh_latest_state(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {scanned} lectures analysées, {updated} scores mis à jour"
+        ))
+
+    def _recompute(self, chunk, user_ids):
+        before = [(instance.risk_score, instance.risk_level) for instance in chunk]
+        risk_engine.score_instances(chunk)
+        changed = [
+            instance for instance, previous in zip(chunk, before)
+            if (instance.risk_score, instance.risk_level) != previous
+        ]
+        if changed:
+            SensorData.objects.bulk_update(changed, ['risk_score', 'risk_level'])
+            user_ids.update(instance.user_id for instance in changed)
+        return len(changed)
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_ubidots_readings(apps, schema_editor):
+    """Supprimer les doublons existants avant de poser la contrainte (garde la plus ancienne ligne)"""
+    SensorData = apps.get_model('sensors', 'SensorData')
+    duplicates = (
+        SensorData.objects
+        .filter(ubidots_device_id__isnull=False, ubidots_timestamp__isnull=False)
+        .values('user_id', 'ubidots_device_id', 'ubidots_timestamp')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        SensorData.objects.filter(
+            user_id=duplicate['user_id'],
+            ubidots_device_id=duplicate['ubidots_device_id'],
+            ubidots_timestamp=duplicate['ubidots_timestamp'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0005_alter_sensordata_aqi_alter_sensordata_smoke_detected'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ubidots_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensordata',
+            constraint=models.UniqueConstraint(fields=('user', 'ubidots_device_id', 'ubidots_timestamp'), name='unique_ubidots_reading'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0006_unique_ubidots_reading'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UbidotsSyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(help_text='ID device Ubidots', max_length=100)),
+                ('variable_id', models.CharField(help_text='ID variable Ubidots', max_length=100)),
+                ('field', models.CharField(help_text='Champ SensorData alimenté', max_length=30)),
+                ('last_timestamp', models.BigIntegerField(help_text='Dernier timestamp Ubidots ingéré (ms)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ubidots_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'device_id', 'variable_id'), name='unique_ubidots_sync_cursor')],
+            },
+        ),
+    ]
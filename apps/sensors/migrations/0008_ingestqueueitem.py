@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0007_ubidotssynccursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestQueueItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(default='ubidots_webhook', max_length=30)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('FAILED', 'En échec')], default='PENDING', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='sensors_ing_status_bbc8f0_idx')],
+            },
+        ),
+    ]
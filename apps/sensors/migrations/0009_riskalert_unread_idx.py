@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0008_ingestqueueitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='riskalert',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-timestamp'], name='riskalert_unread_idx'),
+        ),
+    ]
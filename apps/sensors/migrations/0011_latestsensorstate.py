@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0010_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestSensorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('spo2', models.IntegerField(blank=True, null=True)),
+                ('heart_rate', models.IntegerField(blank=True, null=True)),
+                ('respiratory_rate', models.IntegerField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.IntegerField(blank=True, null=True)),
+                ('eco2', models.IntegerField(blank=True, null=True)),
+                ('tvoc', models.IntegerField(blank=True, null=True)),
+                ('aqi', models.IntegerField(blank=True, null=True)),
+                ('smoke_detected', models.BooleanField(default=False)),
+                ('pollen_level', models.CharField(blank=True, max_length=10)),
+                ('risk_score', models.IntegerField(blank=True, null=True)),
+                ('risk_level', models.CharField(blank=True, max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bracelet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.braceletdevice')),
+                ('sensor_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensordata')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_sensor_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'bracelet'), name='unique_latest_sensor_state')],
+            },
+        ),
+    ]
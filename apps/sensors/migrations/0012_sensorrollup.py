@@ -0,0 +1,58 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0011_latestsensorstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 heure'), ('1d', '1 jour')], max_length=2)),
+                ('bucket', models.DateTimeField(help_text='Début de la tranche (UTC)')),
+                ('count', models.IntegerField(default=0, help_text='Nombre de lectures')),
+                ('spo2_count', models.IntegerField(default=0)),
+                ('spo2_sum', models.FloatField(default=0)),
+                ('spo2_min', models.FloatField(blank=True, null=True)),
+                ('spo2_max', models.FloatField(blank=True, null=True)),
+                ('heart_rate_count', models.IntegerField(default=0)),
+                ('heart_rate_sum', models.FloatField(default=0)),
+                ('heart_rate_min', models.FloatField(blank=True, null=True)),
+                ('heart_rate_max', models.FloatField(blank=True, null=True)),
+                ('respiratory_rate_count', models.IntegerField(default=0)),
+                ('respiratory_rate_sum', models.FloatField(default=0)),
+                ('respiratory_rate_min', models.FloatField(blank=True, null=True)),
+                ('respiratory_rate_max', models.FloatField(blank=True, null=True)),
+                ('aqi_count', models.IntegerField(default=0)),
+                ('aqi_sum', models.FloatField(default=0)),
+                ('aqi_min', models.FloatField(blank=True, null=True)),
+                ('aqi_max', models.FloatField(blank=True, null=True)),
+                ('risk_score_count', models.IntegerField(default=0)),
+                ('risk_score_sum', models.FloatField(default=0)),
+                ('risk_score_min', models.FloatField(blank=True, null=True)),
+                ('risk_score_max', models.FloatField(blank=True, null=True)),
+                ('max30102_count', models.IntegerField(default=0)),
+                ('dht11_count', models.IntegerField(default=0)),
+                ('cjmcu811_count', models.IntegerField(default=0)),
+                ('risk_low_count', models.IntegerField(default=0)),
+                ('risk_moderate_count', models.IntegerField(default=0)),
+                ('risk_high_count', models.IntegerField(default=0)),
+                ('risk_critical_count', models.IntegerField(default=0)),
+                ('risk_none_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'resolution', 'bucket'), name='unique_sensor_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0012_sensorrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='riskalert',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='riskalert_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0013_riskalert_user_ts_idx'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollingWindowState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rolling_window_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('windows', models.JSONField(blank=True, null=True)),
+                ('last_snapshot', models.DateTimeField(blank=True, help_text='Dernier instantané SensorAnalytics', null=True)),
+            ],
+        ),
+    ]
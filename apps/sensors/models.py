@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from apps.sensors import risk_engine
 
 User = get_user_model()
 
@@ -83,88 +85,39 @@ class SensorData(models.Model):
             models.Index(fields=['risk_level', '-timestamp']),
             models.Index(fields=['spo2', '-timestamp']),
         ]
+        constraints = [
+            # Une lecture Ubidots n'est stockée qu'une fois (sync et webhook idempotents)
+            models.UniqueConstraint(
+                fields=['user', 'ubidots_device_id', 'ubidots_timestamp'],
+                name='unique_ubidots_reading'
+            ),
+        ]
     
     def save(self, *args, **kwargs):
-        # Auto-calculer l'heure du jour
-        if self.timestamp:
-            self.hour_of_day = self.timestamp.hour
-        
-        # Calcul intelligent du score de risque
-        if self.spo2 is not None or self.aqi is not None:
-            self.risk_score = self.calculate_risk_score()
-            
-            if self.risk_score < 25:
-                self.risk_level = 'LOW'
-            elif self.risk_score < 50:
-                self.risk_level = 'MODERATE'
-            elif self.risk_score < 75:
-                self.risk_level = 'HIGH'
-            else:
-                self.risk_level = 'CRITICAL'
-                
+        self.apply_derived_fields()
         super().save(*args, **kwargs)
     
+    def apply_derived_fields(self):
+        """Champs calculés (heure, score de risque) - appelé aussi avant bulk_create qui ignore save()"""
+        SensorData.apply_derived_fields_bulk([self])
+    
+    @classmethod
+    def apply_derived_fields_bulk(cls, instances):
+        """Champs calculés pour un lot d'instances (score de risque vectorisé)"""
+        for instance in instances:
+            # Auto-calculer l'heure du jour
+            if instance.timestamp:
+                instance.hour_of_day = instance.timestamp.hour
+        
+        # Calcul intelligent du score de risque (uniquement si SpO2 ou AQI présent)
+        risk_engine.score_instances(instances)
+        return instances
+    
     def calculate_risk_score(self):
         """Calcul intelligent du score de risque basé sur toutes les métriques"""
-        score = 0
-        
-        # ⭐⭐⭐⭐⭐ SpO2 (poids max: 30 points)
-        if self.spo2 is not None:
-            if self.spo2 < 90:
-                score += 30
-            elif self.spo2 < 95:
-                score += 20
-            elif self.spo2 < 98:
-                score += 10
-        
-        # ⭐⭐⭐⭐⭐ Fréquence respiratoire (poids: 25 points)
-        if self.respiratory_rate is not None:
-            if self.respiratory_rate > 30 or self.respiratory_rate < 12:
-                score += 25
-            elif self.respiratory_rate > 25 or self.respiratory_rate < 15:
-                score += 15
-        
-        # ⭐⭐⭐⭐⭐ AQI (poids: 20 points)
-        if self.aqi is not None:
-            if self.aqi > 300:
-                score += 20
-            elif self.aqi > 150:
-                score += 15
-            elif self.aqi > 100:
-                score += 10
-            elif self.aqi > 50:
-                score += 5
-        
-        # ⭐⭐⭐⭐ eCO2 - CJMCU-811 (poids: 15 points)
-        if self.eco2 is not None:
-            if self.eco2 > 5000:  # Dangereux
-                score += 15
-            elif self.eco2 > 2000:  # Mauvais
-                score += 10
-            elif self.eco2 > 1000:  # Modéré
-                score += 5
-        
-        # ⭐⭐⭐ TVOC - CJMCU-811 (poids: 10 points)
-        if self.tvoc is not None:
-            if self.tvoc > 3300:  # Mauvais
-                score += 10
-            elif self.tvoc > 1000:  # Modéré
-                score += 5
-            elif self.tvoc > 220:  # Léger
-                score += 2
-        
-        # ⭐⭐⭐⭐ Fréquence cardiaque (poids: 15 points)
-        if self.heart_rate is not None:
-            if self.heart_rate > 120 or self.heart_rate < 50:
-                score += 15
-            elif self.heart_rate > 100 or self.heart_rate < 60:
-                score += 8
-        
-        # ⭐⭐⭐⭐ Fumée détectée (poids: 10 points)
-        if self.smoke_detected:
-            score += 10
-        
-        return min(score, 100)  # Maximum 100
+        return risk_engine.score_row(**{
+            field: getattr(self, field) for field in risk_engine.RISK_FIELDS
+        })
     
     def __str__(self):
         return f"{self.user.email} - {self.timestamp} - Risque: {self.risk_level}"
@@ -236,6 +189,210 @@ class RiskAlert(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Alertes non lues d'un utilisateur (badge, liste unread)
+            models.Index(
+                fields=['user', '-timestamp'],
+                condition=models.Q(is_read=False),
+                name='riskalert_unread_idx'
+            ),
+            # Liste paginée par curseur
+            models.Index(fields=['user', '-timestamp', '-id'], name='riskalert_user_ts_idx'),
+        ]
         
     def __str__(self):
         return f"Alert {self.alert_type} - {self.user.email}"
+
+
+
+class UbidotsSyncCursor(models.Model):
+    """Watermark de synchronisation Ubidots par device / variable"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ubidots_cursors')
+    device_id = models.CharField(max_length=100, help_text="ID device Ubidots")
+    variable_id = models.CharField(max_length=100, help_text="ID variable Ubidots")
+    field = models.CharField(max_length=30, help_text="Champ SensorData alimenté")
+    last_timestamp = models.BigIntegerField(help_text="Dernier timestamp Ubidots ingéré (ms)")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'device_id', 'variable_id'],
+                name='unique_ubidots_sync_cursor'
+            ),
+        ]
+        
+    def __str__(self):
+        return f"Cursor {self.device_id}/{self.field} - {self.user.email}"
+
+
+
+class IngestQueueItem(models.Model):
+    """File d'attente durable des payloads webhook (mode write-behind)"""
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('FAILED', 'En échec'),
+    ]
+    
+    source = models.CharField(max_length=30, default='ubidots_webhook')
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        
+    def __str__(self):
+        return f"Queue #{self.id} {self.source} - {self.status}"
+
+
+
+class NotificationOutbox(models.Model):
+    """Outbox transactionnelle des notifications push (alertes critiques)"""
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('SENT', 'Envoyée'),
+        ('FAILED', 'En échec'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    alert = models.ForeignKey(RiskAlert, on_delete=models.CASCADE, null=True, blank=True)
+    provider = models.CharField(max_length=30, default='push')
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    payload = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        
+    def __str__(self):
+        return f"Notification {self.provider} #{self.id} - {self.status}"
+
+
+
+class LatestSensorState(models.Model):
+    """Dernier état connu par utilisateur et bracelet (mis à jour à l'ingestion)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='latest_sensor_states')
+    bracelet = models.ForeignKey(BraceletDevice, on_delete=models.CASCADE)
+    sensor_data = models.ForeignKey(SensorData, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+    
+    # ⭐⭐⭐⭐⭐ Constantes vitales
+    spo2 = models.IntegerField(null=True, blank=True)
+    heart_rate = models.IntegerField(null=True, blank=True)
+    respiratory_rate = models.IntegerField(null=True, blank=True)
+    
+    # ⭐⭐⭐⭐⭐ Environnement
+    temperature = models.FloatField(null=True, blank=True)
+    humidity = models.IntegerField(null=True, blank=True)
+    eco2 = models.IntegerField(null=True, blank=True)
+    tvoc = models.IntegerField(null=True, blank=True)
+    aqi = models.IntegerField(null=True, blank=True)
+    smoke_detected = models.BooleanField(default=False)
+    pollen_level = models.CharField(max_length=10, blank=True)
+    
+    # RISQUE
+    risk_score = models.IntegerField(null=True, blank=True)
+    risk_level = models.CharField(max_length=20, blank=True)
+    
+    # Représentation API de la lecture (SensorDataSerializer)
+    payload = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'bracelet'], name='unique_latest_sensor_state'),
+        ]
+        
+    def __str__(self):
+        return f"Dernier état {self.bracelet.device_id} - {self.timestamp}"
+
+
+
+class SensorRollup(models.Model):
+    """Agrégats SensorData par utilisateur et tranche de temps (1 minute, 1 heure, 1 jour, UTC)"""
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 heure'),
+        ('1d', '1 jour'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sensor_rollups')
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField(help_text="Début de la tranche (UTC)")
+    count = models.IntegerField(default=0, help_text="Nombre de lectures")
+    
+    # ⭐⭐⭐⭐⭐ MÉTRIQUES: nombre de valeurs, somme, min, max
+    spo2_count = models.IntegerField(default=0)
+    spo2_sum = models.FloatField(default=0)
+    spo2_min = models.FloatField(null=True, blank=True)
+    spo2_max = models.FloatField(null=True, blank=True)
+    heart_rate_count = models.IntegerField(default=0)
+    heart_rate_sum = models.FloatField(default=0)
+    heart_rate_min = models.FloatField(null=True, blank=True)
+    heart_rate_max = models.FloatField(null=True, blank=True)
+    respiratory_rate_count = models.IntegerField(default=0)
+    respiratory_rate_sum = models.FloatField(default=0)
+    respiratory_rate_min = models.FloatField(null=True, blank=True)
+    respiratory_rate_max = models.FloatField(null=True, blank=True)
+    aqi_count = models.IntegerField(default=0)
+    aqi_sum = models.FloatField(default=0)
+    aqi_min = models.FloatField(null=True, blank=True)
+    aqi_max = models.FloatField(null=True, blank=True)
+    risk_score_count = models.IntegerField(default=0)
+    risk_score_sum = models.FloatField(default=0)
+    risk_score_min = models.FloatField(null=True, blank=True)
+    risk_score_max = models.FloatField(null=True, blank=True)
+    
+    # Lectures par capteur
+    max30102_count = models.IntegerField(default=0)
+    dht11_count = models.IntegerField(default=0)
+    cjmcu811_count = models.IntegerField(default=0)
+    
+    # Distribution des niveaux de risque (none: lecture non scorée)
+    risk_low_count = models.IntegerField(default=0)
+    risk_moderate_count = models.IntegerField(default=0)
+    risk_high_count = models.IntegerField(default=0)
+    risk_critical_count = models.IntegerField(default=0)
+    risk_none_count = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'resolution', 'bucket'],
+                name='unique_sensor_rollup'
+            ),
+        ]
+        
+    def __str__(self):
+        return f"Rollup {self.resolution} {self.bucket} - User#{self.user_id}"
+
+
+class RollingWindowState(models.Model):
+    """État persistant des fenêtres glissantes d'un utilisateur (rolling_analytics)"""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='rolling_window_state'
+    )
+    # Tranches agrégées par fenêtre (None: à reconstruire depuis SensorData)
+    windows = models.JSONField(null=True, blank=True)
+    last_snapshot = models.DateTimeField(null=True, blank=True, help_text="Dernier instantané SensorAnalytics")
+    
+    def __str__(self):
+        return f"Fenêtres glissantes - User#{self.user_id}"
@@ -0,0 +1,163 @@
+"""
+Notifications push des alertes critiques (pattern outbox)
+
+Les notifications sont écrites dans NotificationOutbox dans la même transaction
+que les alertes, puis envoyées par lots par la commande dispatch_notifications.
+Le transport est choisi par fournisseur via settings.NOTIFICATION_SENDERS;
+sans transport, aucune notification n'est mise en file (et le process
+dispatch_notifications n'est pas déployé).
+"""
+import logging
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from apps.sensors.models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# Seules ces sévérités déclenchent un push
+NOTIFY_SEVERITIES = {'CRITICAL'}
+
+_senders = {}
+
+
+class StubSender:
+    """Transport local: journalise sans rien envoyer (développement et tests uniquement)"""
+
+    def send_batch(self, notifications):
+        """
+        Envoyer un lot de notifications
+
+        Returns:
+            dict id -> message d'erreur pour les envois en échec (vide si tout est parti)
+        """
+        for notification in notifications:
+            logger.info(f"📲 Push (stub) User#{notification.user_id}: {notification.title}")
+        return {}
+
+
+def is_configured(provider):
+    """Un transport est-il configuré pour ce fournisseur"""
+    return bool(settings.NOTIFICATION_SENDERS.get(provider))
+
+
+def get_sender(provider):
+    """
+    Instance du transport configuré pour un fournisseur
+
+    Raises:
+        ImproperlyConfigured: aucun transport configuré pour ce fournisseur
+    """
+    path = settings.NOTIFICATION_SENDERS.get(provider)
+    if not path:
+        raise ImproperlyConfigured(
+            f"Aucun transport de notification configuré pour '{provider}' (NOTIFICATION_SENDERS)"
+        )
+    if path not in _senders:
+        _senders[path] = import_string(path)()
+    return _senders[path]
+
+
+def enqueue_for_alerts(alerts, provider='push'):
+    """
+    Ajouter à l'outbox les alertes à pousser (appelé dans la transaction d'ingestion)
+
+    Sans transport configuré rien n'est mis en file: l'outbox ne grossit pas
+    sans consommateur.
+    """
+    if not is_configured(provider):
+        return []
+    notifications = [
+        NotificationOutbox(
+            user_id=alert.user_id,
+            alert=alert,
+            provider=provider,
+            title=alert.get_alert_type_display(),
+            body=alert.message,
+            payload={
+                'alert_id': alert.id,
+                'alert_type': alert.alert_type,
+                'severity': alert.severity,
+                'sensor_data_id': alert.sensor_data_id,
+            },
+        )
+        for alert in alerts
+        if alert.severity in NOTIFY_SEVERITIES
+    ]
+    if notifications:
+        NotificationOutbox.objects.bulk_create(notifications)
+    return notifications
+
+
+def _backoff(attempts):
+    """Délai avant la prochaine tentative: exponentiel avec jitter"""
+    delay = settings.NOTIFICATION_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.5))
+
+
+def dispatch_pending(batch_size=100):
+    """
+    Envoyer un lot de notifications dues, regroupées par fournisseur
+
+    Returns:
+        dict avec les compteurs sent / retried / failed / skipped (pas de transport)
+    """
+    now = timezone.now()
+    stats = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0}
+
+    with transaction.atomic():
+        pending = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not pending:
+            return stats
+
+        handled = []
+        by_provider = {}
+        for notification in pending:
+            by_provider.setdefault(notification.provider, []).append(notification)
+
+        for provider, notifications in by_provider.items():
+            try:
+                sender = get_sender(provider)
+            except ImproperlyConfigured as e:
+                # Rien n'est marqué envoyé: les notifications restent PENDING jusqu'à configuration
+                logger.error(f"❌ {e}")
+                stats['skipped'] += len(notifications)
+                continue
+            try:
+                errors = sender.send_batch(notifications)
+            except Exception as e:
+                logger.error(f"❌ Envoi {provider} en échec: {e}")
+                errors = {notification.id: str(e) for notification in notifications}
+            handled += notifications
+
+            for notification in notifications:
+                notification.attempts += 1
+                error = errors.get(notification.id)
+                if error is None:
+                    notification.status = 'SENT'
+                    notification.sent_at = now
+                    notification.last_error = ''
+                    stats['sent'] += 1
+                elif notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                    notification.status = 'FAILED'
+                    notification.last_error = error
+                    stats['failed'] += 1
+                else:
+                    notification.next_attempt_at = now + _backoff(notification.attempts)
+                    notification.last_error = error
+                    stats['retried'] += 1
+
+        if handled:
+            NotificationOutbox.objects.bulk_update(
+                handled, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+            )
+
+    return stats
@@ -0,0 +1,61 @@
+"""
+Projections SensorData: ne lire et ne renvoyer que les colonnes demandées
+
+?fields=spo2,heart_rate ou un preset capteur (max30102, dht11, cjmcu811, all).
+Les lignes sont lues avec values() et mises au format de SensorDataSerializer
+par read_serializers, sans instancier de modèles.
+"""
+from django.db.models import Q
+from apps.sensors import read_serializers
+from apps.sensors.serializers import SensorDataSerializer
+
+FIELDS = tuple(SensorDataSerializer.Meta.fields)
+
+PRESETS = {
+    'max30102': ('timestamp', 'spo2', 'heart_rate', 'risk_level'),
+    'dht11': ('timestamp', 'temperature', 'humidity'),
+    'cjmcu811': ('timestamp', 'eco2', 'tvoc'),
+    'all': ('timestamp', 'spo2', 'heart_rate', 'temperature', 'humidity', 'eco2', 'tvoc', 'risk_level'),
+}
+
+# Lectures retenues par preset: au moins une mesure du capteur
+PRESET_FILTERS = {
+    'max30102': Q(spo2__isnull=False) | Q(heart_rate__isnull=False),
+    'dht11': Q(temperature__isnull=False) | Q(humidity__isnull=False),
+    'cjmcu811': Q(eco2__isnull=False) | Q(tvoc__isnull=False),
+    'all': Q(),
+}
+
+
+class ProjectionError(ValueError):
+    """Champ demandé inconnu (réponse 400)"""
+
+
+def parse_fields(value, default=None):
+    """
+    Champs demandés (?fields=): liste séparée par des virgules ou nom de preset
+
+    Returns:
+        tuple de champs (ordre de la demande, sans doublon) ou default si absent
+    """
+    if not value:
+        return default
+    if value in PRESETS:
+        return PRESETS[value]
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in FIELDS]
+    if not fields or unknown:
+        raise ProjectionError(
+            f"Champs inconnus: {', '.join(unknown) or value} (choix: {', '.join(FIELDS)} ou {', '.join(PRESETS)})"
+        )
+    return fields
+
+
+def project(queryset, fields, extra=()):
+    """values() limité aux champs demandés (plus extra, ex. clés de pagination)"""
+    return queryset.values(*dict.fromkeys(fields + tuple(extra)))
+
+
+def representation(fields):
+    """Fonction ligne values() -> dict identique à SensorDataSerializer restreint à fields"""
+    return read_serializers.for_serializer(SensorDataSerializer, tuple(fields)).representation()
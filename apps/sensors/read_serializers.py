@@ -0,0 +1,110 @@
+"""
+Sérialisation rapide en lecture (listes volumineuses)
+
+Même sortie que les ModelSerializer DRF, mais construite directement depuis
+des lignes values() / values_list(): un convertisseur pré-calculé par champ,
+sans instance de modèle ni machinerie de champ DRF par valeur.
+"""
+from functools import lru_cache
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+from apps.sensors.serializers import RiskAlertSerializer, SensorAnalyticsSerializer, SensorDataSerializer
+
+# Format DATETIME_FORMAT du projet, produit via isoformat() (plus rapide que strftime)
+ISO_MICROSECONDS_Z = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or field_timezone is None:
+        return field.to_representation
+
+    if output_format.lower() == ISO_8601:
+        def convert(value):
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    elif output_format == ISO_MICROSECONDS_Z:
+        def convert(value):
+            value = value.astimezone(field_timezone)
+            if value.year < 1000:  # %Y n'est pas complété à 4 chiffres par strftime
+                return value.strftime(output_format)
+            return value.replace(tzinfo=None).isoformat(timespec='microseconds') + 'Z'
+    else:
+        def convert(value):
+            return value.astimezone(field_timezone).strftime(output_format)
+    return convert
+
+
+def _converter(field):
+    """Fonction valeur brute (non None) -> représentation identique à field.to_representation"""
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, serializers.BooleanField):
+        return field.to_representation
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return None  # values() renvoie déjà la clé
+    if type(field) is serializers.FloatField:
+        return float
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.CharField:
+        return str
+    return field.to_representation
+
+
+class ReadSerializer:
+    """
+    Représentation d'un ModelSerializer depuis des lignes de colonnes
+
+    Les lignes sont des tuples values_list(*columns) ou des dicts
+    values(*columns) (pagination par curseur), dans l'ordre de columns.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        declared = serializer_class().fields
+        model = serializer_class.Meta.model
+        self.fields = tuple(fields or declared)
+        self._declared = [declared[name] for name in self.fields]
+        self.columns = tuple(
+            model._meta.get_field(field.source).attname for field in self._declared
+        )
+
+    def values(self, queryset, extra=()):
+        """values() des colonnes (plus extra, ex. clés de pagination, ajoutées en fin de ligne)"""
+        return queryset.values(*dict.fromkeys(self.columns + tuple(extra)))
+
+    def values_list(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def representation(self):
+        """Fonction ligne -> dict (convertisseurs résolus une fois: fuseau courant de la requête)"""
+        pairs = tuple((name, _converter(field)) for name, field in zip(self.fields, self._declared))
+
+        def represent(row):
+            if isinstance(row, dict):
+                row = row.values()
+            return {
+                name: value if value is None or convert is None else convert(value)
+                for (name, convert), value in zip(pairs, row)
+            }
+        return represent
+
+    def to_representation(self, rows):
+        represent = self.representation()
+        return [represent(row) for row in rows]
+
+
+@lru_cache(maxsize=64)
+def for_serializer(serializer_class, fields=None):
+    """ReadSerializer partagé par (serializer, champs)"""
+    return ReadSerializer(serializer_class, fields)
+
+
+sensor_data = for_serializer(SensorDataSerializer)
+risk_alerts = for_serializer(RiskAlertSerializer)
+sensor_analytics = for_serializer(SensorAnalyticsSerializer)
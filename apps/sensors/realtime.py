@@ -0,0 +1,133 @@
+"""
+Canal temps réel: diffusion des nouvelles lectures et alertes aux clients SSE
+
+Les événements sont publiés après commit de l'ingestion et distribués par un
+broker. InProcessBroker suffit avec un seul processus ASGI; RedisBroker
+(redis-py requis) relaie entre plusieurs workers. Choix via REALTIME_BROKER.
+"""
+import asyncio
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from apps.sensors.serializers import RiskAlertSerializer, SensorDataSerializer
+
+logger = logging.getLogger(__name__)
+
+# File par abonné: un client trop lent perd les événements les plus anciens
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _encode(event, data):
+    return json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+
+
+def _deliver(queue, message):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class InProcessBroker:
+    """Fan-out en mémoire vers les abonnés de ce processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> {queue: boucle asyncio de l'abonné}
+        self._subscribers = {}
+
+    def publish(self, user_id, message):
+        """Publier un message JSON (appelable depuis n'importe quel thread)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, message)
+            except RuntimeError:
+                # Boucle fermée: l'abonné sera retiré à sa déconnexion
+                pass
+
+    async def subscribe(self, user_id):
+        """Itérateur asynchrone des messages destinés à un utilisateur"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user_id, {})
+                subscribers.pop(queue, None)
+                if not subscribers:
+                    self._subscribers.pop(user_id, None)
+
+
+class RedisBroker:
+    """Relais Redis pub/sub entre workers (REDIS_URL)"""
+
+    def __init__(self):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker nécessite le paquet 'redis'")
+        self._url = settings.REALTIME_REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+        self._async_redis = redis.asyncio
+
+    @staticmethod
+    def _channel(user_id):
+        return f"sensors:events:{user_id}"
+
+    def publish(self, user_id, message):
+        self._client.publish(self._channel(user_id), message)
+
+    async def subscribe(self, user_id):
+        client = self._async_redis.Redis.from_url(self._url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self._channel(user_id))
+        try:
+            async for item in pubsub.listen():
+                if item['type'] == 'message':
+                    yield item['data'].decode()
+        finally:
+            await pubsub.unsubscribe(self._channel(user_id))
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Broker configuré (instance unique par processus)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def publish_ingest(instances, alerts):
+    """Publier la dernière lecture et les alertes d'une ingestion (appelé après commit)"""
+    # Une lecture par utilisateur: la plus récente du lot (un backfill n'inonde pas les clients)
+    latest = {}
+    for instance in instances:
+        current = latest.get(instance.user_id)
+        if current is None or instance.timestamp > current.timestamp:
+            latest[instance.user_id] = instance
+
+    try:
+        broker = get_broker()
+        for instance in latest.values():
+            broker.publish(instance.user_id, _encode('reading', SensorDataSerializer(instance).data))
+        for alert in alerts:
+            broker.publish(alert.user_id, _encode('alert', RiskAlertSerializer(alert).data))
+    except Exception as e:
+        # Le temps réel ne doit jamais faire échouer l'ingestion
+        logger.error(f"❌ Publication temps réel en échec: {e}")
@@ -0,0 +1,99 @@
+"""
+Flux Server-Sent Events des lectures et alertes de l'utilisateur (ASGI requis)
+
+EventSource ne peut pas envoyer d'en-tête Authorization: le client échange son
+JWT contre un ticket court à usage unique (events/ticket/) passé en ?ticket=.
+Le JWT n'apparaît ainsi jamais dans l'URL ni dans les logs d'accès.
+"""
+import asyncio
+import secrets
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+from .realtime import get_broker
+
+User = get_user_model()
+
+
+def _ticket_key(ticket):
+    return f"sensors:sse_ticket:{ticket}"
+
+
+@api_view(['POST'])
+def event_ticket(request):
+    """Ticket d'accès au flux SSE (usage unique, REALTIME_TICKET_TTL secondes)"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_ticket_key(ticket), request.user.id, settings.REALTIME_TICKET_TTL)
+    return Response({'ticket': ticket, 'expires_in': settings.REALTIME_TICKET_TTL})
+
+
+def _redeem_ticket(ticket):
+    """user_id du ticket, consommé (un seul delete réussit en cas de course), sinon None"""
+    key = _ticket_key(ticket)
+    user_id = cache.get(key)
+    if user_id is None or not cache.delete(key):
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+def _authenticate(request):
+    """Utilisateur du JWT (en-tête Authorization) ou du ticket ?ticket= (EventSource), sinon None"""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return _redeem_ticket(ticket)
+
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def _event_stream(user_id):
+    # Premier message immédiat: le client sait que l'abonnement est actif
+    yield ': connected\n\n'
+    messages = get_broker().subscribe(user_id).__aiter__()
+    next_message = None
+    try:
+        while True:
+            if next_message is None:
+                next_message = asyncio.ensure_future(messages.__anext__())
+            done, _ = await asyncio.wait({next_message}, timeout=settings.REALTIME_HEARTBEAT_SECONDS)
+            if not done:
+                # Garder la connexion ouverte à travers les proxies
+                yield ': keep-alive\n\n'
+                continue
+            message = next_message.result()
+            next_message = None
+            yield f'data: {message}\n\n'
+    finally:
+        if next_message is not None:
+            next_message.cancel()
+        await messages.aclose()
+
+
+async def sensor_events(request):
+    """
+    Flux SSE: nouvelles lectures et alertes de l'utilisateur authentifié
+
+    Remplace le polling de latest/, risk_score/ et alerts/unread/.
+    """
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentification requise'}, status=401)
+
+    response = StreamingHttpResponse(_event_stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
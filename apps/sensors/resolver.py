@@ -0,0 +1,134 @@
+"""
+Résolution en cache des cibles d'ingestion (utilisateur et bracelet)
+
+device_id -> (user_id, bracelet_id), email -> user_id et utilisateur ->
+bracelet par défaut sont servis par le cache. Les instances renvoyées sont
+différées (Model.from_db): seuls les identifiants sont chargés, suffisants
+pour l'ingestion. Invalidation par signaux (apps.sensors.signals), à
+l'écriture puis de nouveau au commit (une lecture concurrente ne peut pas
+remettre l'ancienne valeur en cache).
+
+L'invalidation doit atteindre tous les processus: le cache n'est utilisé que
+s'il est partagé (RESOLVER_CACHE_TTL > 0, soit REDIS_URL défini). Sinon
+chaque résolution lit la base.
+"""
+import hashlib
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from apps.sensors.models import BraceletDevice
+
+User = get_user_model()
+
+
+def _get_many(keys):
+    return cache.get_many(keys) if settings.RESOLVER_CACHE_TTL else {}
+
+
+def _set_many(values):
+    if settings.RESOLVER_CACHE_TTL and values:
+        cache.set_many(values, settings.RESOLVER_CACHE_TTL)
+
+
+def _remember(values):
+    # Au commit: après l'invalidation (post_save) de la création qui vient d'avoir lieu
+    transaction.on_commit(lambda: _set_many(values))
+
+
+def _forget(keys):
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def device_key(device_id):
+    return f"sensors:resolver:device:{device_id}"
+
+
+def email_key(email):
+    # Les emails ne sont pas des clés de cache sûres (memcached): hachage
+    return f"sensors:resolver:email:{hashlib.sha256(email.encode()).hexdigest()}"
+
+
+def default_bracelet_key(user_id):
+    return f"sensors:resolver:default_bracelet:{user_id}"
+
+
+def user_ref(user_id):
+    """Instance User différée (seul l'id est chargé)"""
+    return User.from_db(None, ['id'], [user_id])
+
+
+def bracelet_ref(bracelet_id, user_id, device_id):
+    """Instance BraceletDevice différée (id, user_id, device_id)"""
+    return BraceletDevice.from_db(None, ['id', 'user_id', 'device_id'], [bracelet_id, user_id, device_id])
+
+
+def user_ids_for_emails(emails):
+    """dict email -> user_id (emails inconnus absents), une requête au plus pour les absents du cache"""
+    emails = set(emails)
+    keys = {email_key(email): email for email in emails}
+    cached = _get_many(keys)
+    found = {keys[key]: user_id for key, user_id in cached.items()}
+
+    missing = emails - set(found)
+    if missing:
+        loaded = dict(User.objects.filter(email__in=missing).values_list('email', 'id'))
+        _set_many({email_key(email): user_id for email, user_id in loaded.items()})
+        found.update(loaded)
+    return found
+
+
+def devices(device_ids):
+    """dict device_id -> (user_id, bracelet_id) pour les bracelets existants"""
+    device_ids = set(device_ids)
+    keys = {device_key(device_id): device_id for device_id in device_ids}
+    cached = _get_many(keys)
+    found = {keys[key]: tuple(value) for key, value in cached.items()}
+
+    missing = device_ids - set(found)
+    if missing:
+        loaded = {
+            device_id: (user_id, bracelet_id)
+            for device_id, user_id, bracelet_id in BraceletDevice.objects.filter(
+                device_id__in=missing
+            ).values_list('device_id', 'user_id', 'id')
+        }
+        _set_many({device_key(device_id): value for device_id, value in loaded.items()})
+        found.update(loaded)
+    return found
+
+
+def remember_device(bracelet):
+    _remember({device_key(bracelet.device_id): (bracelet.user_id, bracelet.pk)})
+
+
+def default_bracelet(user):
+    """Bracelet connecté de l'utilisateur (différé) ou None, mis en cache"""
+    key = default_bracelet_key(user.pk)
+    cached = _get_many([key]).get(key)
+    if cached is not None:
+        return bracelet_ref(cached[0], user.pk, cached[1])
+
+    row = BraceletDevice.objects.filter(user=user, is_connected=True).values_list('id', 'device_id').first()
+    if row is None:
+        return None
+    _set_many({key: row})
+    return bracelet_ref(row[0], user.pk, row[1])
+
+
+def remember_default_bracelet(bracelet):
+    _remember({default_bracelet_key(bracelet.user_id): (bracelet.pk, bracelet.device_id)})
+
+
+def forget_device(device_id, *user_ids):
+    _forget([device_key(device_id)] + [default_bracelet_key(user_id) for user_id in user_ids])
+
+
+def forget_default_bracelets(*user_ids):
+    """Bracelet déconnecté sans post_save (écriture groupée de device_state)"""
+    _forget([default_bracelet_key(user_id) for user_id in user_ids])
+
+
+def forget_email(*emails):
+    _forget([email_key(email) for email in emails if email])
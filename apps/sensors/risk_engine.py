@@ -0,0 +1,166 @@
+"""
+Moteur de calcul du score de risque SensorData
+
+Les seuils sont décrits une seule fois dans RISK_BANDS et évalués soit ligne
+par ligne (Python pur), soit par colonnes avec NumPy pour les traitements en
+lot (bulk ingest, synchronisation Ubidots, recalcul historique).
+"""
+try:
+    import numpy as np
+except ImportError:  # NumPy optionnel: repli sur l'évaluation ligne par ligne
+    np = None
+
+INF = float('inf')
+
+# Bandes (borne basse, borne haute, points): une bande s'applique si la valeur
+# est < borne basse ou > borne haute. Évaluées dans l'ordre, la première gagne.
+RISK_BANDS = {
+    # ⭐⭐⭐⭐⭐ SpO2 (poids max: 30 points)
+    'spo2': ((90, INF, 30), (95, INF, 20), (98, INF, 10)),
+    # ⭐⭐⭐⭐⭐ Fréquence respiratoire (poids: 25 points)
+    'respiratory_rate': ((12, 30, 25), (15, 25, 15)),
+    # ⭐⭐⭐⭐⭐ AQI (poids: 20 points)
+    'aqi': ((-INF, 300, 20), (-INF, 150, 15), (-INF, 100, 10), (-INF, 50, 5)),
+    # ⭐⭐⭐⭐ eCO2 - CJMCU-811 (poids: 15 points)
+    'eco2': ((-INF, 5000, 15), (-INF, 2000, 10), (-INF, 1000, 5)),
+    # ⭐⭐⭐ TVOC - CJMCU-811 (poids: 10 points)
+    'tvoc': ((-INF, 3300, 10), (-INF, 1000, 5), (-INF, 220, 2)),
+    # ⭐⭐⭐⭐ Fréquence cardiaque (poids: 15 points)
+    'heart_rate': ((50, 120, 15), (60, 100, 8)),
+}
+
+# ⭐⭐⭐⭐ Fumée détectée (poids: 10 points)
+SMOKE_POINTS = 10
+MAX_SCORE = 100
+
+# Score < borne => niveau, au-delà de la dernière borne: CRITICAL
+RISK_LEVEL_BOUNDS = (25, 50, 75)
+RISK_LEVELS = ('LOW', 'MODERATE', 'HIGH', 'CRITICAL')
+
+RISK_FIELDS = tuple(RISK_BANDS) + ('smoke_detected',)
+
+# En dessous de cette taille de lot, la conversion en tableaux coûte plus qu'elle ne rapporte
+VECTORIZE_MIN_ROWS = 32
+
+
+def risk_level_for(score):
+    """Niveau de risque correspondant à un score"""
+    for bound, level in zip(RISK_LEVEL_BOUNDS, RISK_LEVELS):
+        if score < bound:
+            return level
+    return RISK_LEVELS[-1]
+
+
+def is_scorable(spo2=None, aqi=None):
+    """Le score n'est calculé que si SpO2 ou AQI est présent"""
+    return spo2 is not None or aqi is not None
+
+
+def score_row(spo2=None, respiratory_rate=None, aqi=None, eco2=None,
+              tvoc=None, heart_rate=None, smoke_detected=False):
+    """Score de risque (0-100) d'une seule lecture"""
+    values = {
+        'spo2': spo2, 'respiratory_rate': respiratory_rate, 'aqi': aqi,
+        'eco2': eco2, 'tvoc': tvoc, 'heart_rate': heart_rate,
+    }
+    score = 0
+
+    for field, bands in RISK_BANDS.items():
+        value = values[field]
+        if value is None:
+            continue
+        for low, high, points in bands:
+            if value < low or value > high:
+                score += points
+                break
+
+    if smoke_detected:
+        score += SMOKE_POINTS
+
+    return min(score, MAX_SCORE)
+
+
+def _score_batch_python(columns, size):
+    scores = []
+    levels = []
+    for i in range(size):
+        row = {field: columns[field][i] for field in RISK_FIELDS}
+        if not is_scorable(row['spo2'], row['aqi']):
+            scores.append(None)
+            levels.append(None)
+            continue
+        score = score_row(**row)
+        scores.append(score)
+        levels.append(risk_level_for(score))
+    return scores, levels
+
+
+def _as_float_array(values, size):
+    return np.fromiter(
+        (np.nan if value is None else value for value in values), dtype=float, count=size
+    )
+
+
+def _score_batch_numpy(columns, size):
+    total = np.zeros(size, dtype=np.int64)
+
+    for field, bands in RISK_BANDS.items():
+        values = _as_float_array(columns[field], size)
+        # NaN (valeur absente) ne satisfait aucune comparaison: 0 point
+        conditions = [(values < low) | (values > high) for low, high, _ in bands]
+        choices = [points for _, _, points in bands]
+        total += np.select(conditions, choices, default=0)
+
+    smoke = np.fromiter((bool(value) for value in columns['smoke_detected']), dtype=bool, count=size)
+    total += smoke * SMOKE_POINTS
+    total = np.minimum(total, MAX_SCORE)
+
+    level_index = np.searchsorted(RISK_LEVEL_BOUNDS, total, side='right')
+    scorable = ~(
+        np.isnan(_as_float_array(columns['spo2'], size))
+        & np.isnan(_as_float_array(columns['aqi'], size))
+    )
+
+    scores = [int(s) if ok else None for s, ok in zip(total.tolist(), scorable.tolist())]
+    levels = [RISK_LEVELS[i] if ok else None for i, ok in zip(level_index.tolist(), scorable.tolist())]
+    return scores, levels
+
+
+def score_batch(columns):
+    """
+    Calculer les scores de risque d'un lot de lectures
+
+    Args:
+        columns: dict champ -> séquence de valeurs (spo2, respiratory_rate, aqi,
+                 eco2, tvoc, heart_rate, smoke_detected). Champs absents = None.
+
+    Returns:
+        (risk_scores, risk_levels): listes alignées sur l'entrée, None pour les
+        lignes sans SpO2 ni AQI (score non calculable)
+    """
+    size = max((len(values) for values in columns.values()), default=0)
+    default = {field: [None] * size for field in RISK_FIELDS}
+    default['smoke_detected'] = [False] * size
+    columns = {
+        field: default[field] if columns.get(field) is None else columns[field]
+        for field in RISK_FIELDS
+    }
+
+    if np is not None and size >= VECTORIZE_MIN_ROWS:
+        return _score_batch_numpy(columns, size)
+    return _score_batch_python(columns, size)
+
+
+def score_instances(instances):
+    """Appliquer risk_score / risk_level à une liste d'instances SensorData"""
+    columns = {
+        field: [getattr(instance, field) for instance in instances]
+        for field in RISK_FIELDS
+    }
+    scores, levels = score_batch(columns)
+
+    for instance, score, level in zip(instances, scores, levels):
+        if score is not None:
+            instance.risk_score = score
+            instance.risk_level = level
+    return instances
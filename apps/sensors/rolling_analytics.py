@@ -0,0 +1,282 @@
+"""
+Analyses glissantes incrémentales (SensorAnalytics, SensorData.spo2_variation_1h / aqi_avg_3h)
+
+Chaque fenêtre est découpée en WINDOW_BUCKETS tranches agrégées (nombre,
+somme, somme des carrés, min, max), persistées par utilisateur dans
+RollingWindowState. Un lot relit et réécrit une ligne verrouillée par
+utilisateur: coût constant quelle que soit la fenêtre, état partagé par tous
+les processus et annulé avec la transaction d'ingestion. Une lecture en
+retard rejoint sa tranche sans relecture de l'historique. SensorData n'est
+parcouru qu'à la première ingestion d'un utilisateur.
+"""
+from datetime import timedelta
+from django.conf import settings
+from apps.sensors import risk_engine
+from apps.sensors.models import RollingWindowState, SensorAnalytics, SensorData
+
+# Fenêtres: nom -> (champ SensorData, durée en secondes)
+WINDOWS = {
+    'spo2_1h': ('spo2', 3600),
+    'heart_rate_1h': ('heart_rate', 3600),
+    'respiratory_rate_1h': ('respiratory_rate', 3600),
+    'aqi_3h': ('aqi', 3 * 3600),
+    'aqi_6h': ('aqi', 6 * 3600),
+    'aqi_24h': ('aqi', 24 * 3600),
+}
+MAX_WINDOW = timedelta(seconds=max(seconds for _, seconds in WINDOWS.values()))
+WINDOW_FIELDS = tuple(sorted({field for field, _ in WINDOWS.values()}))
+# Valeurs instantanées utilisées par le score environnemental
+SNAPSHOT_FIELDS = ('eco2', 'tvoc', 'smoke_detected')
+
+# Tranches par fenêtre (précision de la fenêtre: 1/WINDOW_BUCKETS de sa durée)
+WINDOW_BUCKETS = 60
+
+# Points maximum des bandes de risque (première bande = la plus pénalisante)
+RESPIRATORY_FIELDS = ('spo2', 'respiratory_rate', 'heart_rate')
+ENVIRONMENT_FIELDS = ('aqi', 'eco2', 'tvoc')
+RESPIRATORY_MAX_POINTS = sum(risk_engine.RISK_BANDS[field][0][2] for field in RESPIRATORY_FIELDS)
+ENVIRONMENT_MAX_POINTS = (
+    sum(risk_engine.RISK_BANDS[field][0][2] for field in ENVIRONMENT_FIELDS) + risk_engine.SMOKE_POINTS
+)
+
+
+class RollingWindow:
+    """
+    Fenêtre temporelle glissante par tranches: somme, somme des carrés, min et max
+
+    Une tranche sort dès que son début quitte la fenêtre: la fenêtre couvre
+    sa durée moins au plus une tranche. Sommes courantes en O(1), min et max
+    en O(WINDOW_BUCKETS).
+    """
+
+    def __init__(self, seconds):
+        self.span = seconds
+        self.width = max(seconds // WINDOW_BUCKETS, 1)
+        self.latest = None  # Horodatage (s) le plus récent vu
+        self._buckets = {}  # index de tranche -> [nombre, somme, somme des carrés, min, max], ordre croissant
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, timestamp, value):
+        """Ajouter une lecture (éventuellement en retard) puis évincer les tranches sorties"""
+        seconds = timestamp.timestamp()
+        if self.latest is None or seconds > self.latest:
+            self.latest = seconds
+        cutoff = self.latest - self.span
+        index = int(seconds // self.width)
+        if value is not None and index * self.width > cutoff:
+            value = float(value)
+            bucket = self._buckets.get(index)
+            if bucket is None:
+                late = bool(self._buckets) and index < next(reversed(self._buckets))
+                self._buckets[index] = [1, value, value * value, value, value]
+                if late:
+                    self._buckets = dict(sorted(self._buckets.items()))
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                bucket[2] += value * value
+                bucket[3] = min(bucket[3], value)
+                bucket[4] = max(bucket[4], value)
+            self.count += 1
+            self.total += value
+            self.total_sq += value * value
+        self._evict(cutoff)
+
+    def _evict(self, cutoff):
+        while self._buckets:
+            index = next(iter(self._buckets))
+            if index * self.width > cutoff:
+                break
+            count, total, total_sq, _, _ = self._buckets.pop(index)
+            self.count -= count
+            self.total -= total
+            self.total_sq -= total_sq
+        if not self.count:
+            self.total = self.total_sq = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def min(self):
+        return min(bucket[3] for bucket in self._buckets.values()) if self._buckets else None
+
+    @property
+    def max(self):
+        return max(bucket[4] for bucket in self._buckets.values()) if self._buckets else None
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return None
+        mean = self.mean
+        # max(): les sommes courantes peuvent dériver légèrement sous zéro
+        return max(self.total_sq / self.count - mean * mean, 0.0) ** 0.5
+
+    def to_state(self):
+        """État JSON: [dernier horodatage, [index, nombre, somme, somme des carrés, min, max]...]"""
+        return [self.latest, [[index, *bucket] for index, bucket in self._buckets.items()]]
+
+    @classmethod
+    def from_state(cls, seconds, state):
+        window = cls(seconds)
+        window.latest, buckets = state
+        for index, *bucket in buckets:
+            window._buckets[index] = bucket
+            window.count += bucket[0]
+            window.total += bucket[1]
+            window.total_sq += bucket[2]
+        return window
+
+
+class UserWindows:
+    """Fenêtres d'un utilisateur"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.windows = {
+            name: RollingWindow.from_state(seconds, state[name]) if name in state else RollingWindow(seconds)
+            for name, (_, seconds) in WINDOWS.items()
+        }
+
+    def push(self, timestamp, values):
+        for name, (field, _) in WINDOWS.items():
+            self.windows[name].push(timestamp, values.get(field))
+
+    def to_state(self):
+        return {name: window.to_state() for name, window in self.windows.items()}
+
+    def metrics(self):
+        """Valeurs SensorAnalytics courantes (hors scores composites)"""
+        windows = self.windows
+        spo2 = windows['spo2_1h']
+        return {
+            'spo2_variation_1h': spo2.max - spo2.min if spo2.count else None,
+            'spo2_avg_1h': _round(spo2.mean),
+            'spo2_min_1h': spo2.min,
+            'aqi_avg_3h': _round(windows['aqi_3h'].mean),
+            'aqi_avg_6h': _round(windows['aqi_6h'].mean),
+            'aqi_avg_24h': _round(windows['aqi_24h'].mean),
+            'heart_rate_avg_1h': _round(windows['heart_rate_1h'].mean),
+            # Écart-type de la FC sur 1h (pas d'intervalles RR sur le MAX30102)
+            'heart_rate_variability': _round(windows['heart_rate_1h'].std),
+            'respiratory_rate_avg_1h': _round(windows['respiratory_rate_1h'].mean),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def composite_scores(metrics, latest):
+    """
+    Scores composites à partir des moyennes glissantes
+
+    Returns:
+        (respiratory_health_score, environmental_risk_score), 0-100, None si non calculable.
+        Santé respiratoire: 100 = aucune bande de risque atteinte.
+    """
+    vitals = {
+        'spo2': metrics['spo2_avg_1h'],
+        'respiratory_rate': metrics['respiratory_rate_avg_1h'],
+        'heart_rate': metrics['heart_rate_avg_1h'],
+    }
+    respiratory = None
+    if any(value is not None for value in vitals.values()):
+        points = risk_engine.score_row(**vitals)
+        respiratory = 100 - round(points * 100 / RESPIRATORY_MAX_POINTS)
+
+    environment = {
+        'aqi': metrics['aqi_avg_3h'],
+        'eco2': latest.get('eco2'),
+        'tvoc': latest.get('tvoc'),
+    }
+    environmental = None
+    if any(value is not None for value in environment.values()) or latest.get('smoke_detected'):
+        points = risk_engine.score_row(smoke_detected=bool(latest.get('smoke_detected')), **environment)
+        environmental = round(points * 100 / ENVIRONMENT_MAX_POINTS)
+    return respiratory, environmental
+
+
+def apply(instances):
+    """
+    Faire avancer les fenêtres avec un lot de lectures non sauvegardées
+
+    À appeler dans la transaction d'ingestion: les lignes RollingWindowState
+    sont verrouillées, les lots concurrents d'un même utilisateur s'enchaînent.
+    Renseigne spo2_variation_1h et aqi_avg_3h sur chaque instance (valeurs
+    vues à l'arrivée de la lecture) et prépare au plus un instantané
+    SensorAnalytics par utilisateur et par ANALYTICS_SNAPSHOT_SECONDS.
+
+    Returns:
+        Liste d'instances SensorAnalytics non sauvegardées
+    """
+    by_user = {}
+    for instance in instances:
+        by_user.setdefault(instance.user_id, []).append(instance)
+    if not by_user:
+        return []
+
+    states = RollingWindowState.objects.select_for_update().filter(user_id__in=by_user).order_by('user_id')
+    rows = list(states)
+    if len(rows) < len(by_user):
+        # Premier lot d'un utilisateur: ligne d'état créée (insertions concurrentes ignorées) puis verrouillée
+        known = {row.user_id for row in rows}
+        RollingWindowState.objects.bulk_create(
+            [RollingWindowState(user_id=user_id) for user_id in by_user if user_id not in known],
+            ignore_conflicts=True
+        )
+        rows = list(states.all())
+    snapshots = []
+    for row in rows:
+        user_instances = sorted(by_user[row.user_id], key=lambda instance: instance.timestamp)
+        snapshot = _apply_user(row, user_instances)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    RollingWindowState.objects.bulk_update(rows, ['windows', 'last_snapshot'])
+    return snapshots
+
+
+def _apply_user(row, instances):
+    if row.windows is None:
+        state = _rebuild(row.user_id, instances[-1].timestamp)
+    else:
+        state = UserWindows(row.windows)
+
+    metrics = latest = None
+    for instance in instances:
+        values = {field: getattr(instance, field) for field in WINDOW_FIELDS + SNAPSHOT_FIELDS}
+        state.push(instance.timestamp, values)
+        metrics = state.metrics()
+        instance.spo2_variation_1h = metrics['spo2_variation_1h']
+        instance.aqi_avg_3h = metrics['aqi_avg_3h']
+        latest = values
+    row.windows = state.to_state()
+
+    newest = instances[-1].timestamp
+    interval = timedelta(seconds=settings.ANALYTICS_SNAPSHOT_SECONDS)
+    if row.last_snapshot is not None and newest - row.last_snapshot < interval:
+        return None
+    row.last_snapshot = newest
+    respiratory, environmental = composite_scores(metrics, latest)
+    return SensorAnalytics(
+        user_id=row.user_id,
+        timestamp=newest,
+        respiratory_health_score=respiratory,
+        environmental_risk_score=environmental,
+        **metrics,
+    )
+
+
+def _rebuild(user_id, until):
+    """Fenêtres chargées depuis SensorData (première ingestion de l'utilisateur)"""
+    state = UserWindows()
+    rows = SensorData.objects.filter(
+        user_id=user_id, timestamp__gt=until - MAX_WINDOW
+    ).order_by('timestamp').values_list('timestamp', *WINDOW_FIELDS)
+    for row in rows:
+        state.push(row[0], dict(zip(WINDOW_FIELDS, row[1:])))
+    return state
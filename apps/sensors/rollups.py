@@ -0,0 +1,383 @@
+"""
+Agrégats pré-calculés de SensorData (table SensorRollup: 1 minute, 1 heure, 1 jour)
+
+Les tranches sont mises à jour à l'ingestion (une lecture, un merge par
+résolution) et recalculées depuis SensorData par compact_sensor_rollups,
+tranche close par tranche close en petites transactions.
+Les statistiques d'une période sont lues sur la résolution la plus grossière
+qui la couvre: jours entiers, puis heures et minutes aux bords, puis lignes
+brutes pour les minutes incomplètes. 30 jours ≈ 30 lignes au lieu de ~40k.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+from apps.sensors.models import SensorData, SensorRollup
+
+# Du plus fin au plus grossier
+RESOLUTIONS = ('1m', '1h', '1d')
+STEPS = {'1m': timedelta(minutes=1), '1h': timedelta(hours=1), '1d': timedelta(days=1)}
+TRUNCATE = {'1m': TruncMinute, '1h': TruncHour, '1d': TruncDay}
+
+METRICS = ('spo2', 'heart_rate', 'respiratory_rate', 'aqi', 'risk_score')
+
+# Compteur -> champs dont au moins un doit être présent
+SENSOR_COUNTERS = {
+    'max30102_count': ('spo2', 'heart_rate'),
+    'dht11_count': ('temperature', 'humidity'),
+    'cjmcu811_count': ('eco2', 'tvoc'),
+}
+RISK_COUNTERS = {
+    'LOW': 'risk_low_count',
+    'MODERATE': 'risk_moderate_count',
+    'HIGH': 'risk_high_count',
+    'CRITICAL': 'risk_critical_count',
+}
+RISK_NONE_COUNTER = 'risk_none_count'
+
+SUM_FIELDS = (
+    ('count',)
+    + tuple(f'{metric}_{suffix}' for metric in METRICS for suffix in ('count', 'sum'))
+    + tuple(SENSOR_COUNTERS) + tuple(RISK_COUNTERS.values()) + (RISK_NONE_COUNTER,)
+)
+MIN_FIELDS = tuple(f'{metric}_min' for metric in METRICS)
+MAX_FIELDS = tuple(f'{metric}_max' for metric in METRICS)
+VALUE_FIELDS = SUM_FIELDS + MIN_FIELDS + MAX_FIELDS
+
+
+def bucket_start(timestamp, resolution):
+    """Début (UTC) de la tranche contenant timestamp"""
+    timestamp = timestamp.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if resolution in ('1h', '1d'):
+        timestamp = timestamp.replace(minute=0)
+    if resolution == '1d':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def _bucket_end(timestamp, resolution):
+    """Première borne de tranche >= timestamp"""
+    start = bucket_start(timestamp, resolution)
+    return start if start == timestamp else start + STEPS[resolution]
+
+
+def _empty():
+    values = dict.fromkeys(SUM_FIELDS, 0)
+    values.update(dict.fromkeys(MIN_FIELDS + MAX_FIELDS))
+    return values
+
+
+def _merge(target, values):
+    """Fusionner des agrégats (dict) dans target (dict), min/max None ignorés"""
+    for field in SUM_FIELDS:
+        target[field] += values[field] or 0
+    for fields, pick in ((MIN_FIELDS, min), (MAX_FIELDS, max)):
+        for field in fields:
+            if values[field] is not None:
+                current = target[field]
+                target[field] = values[field] if current is None else pick(current, values[field])
+    return target
+
+
+def _reading_values(instance):
+    """Agrégats d'une seule lecture"""
+    values = _empty()
+    values['count'] = 1
+    for metric in METRICS:
+        value = getattr(instance, metric)
+        if value is not None:
+            values[f'{metric}_count'] = 1
+            values[f'{metric}_sum'] = value
+            values[f'{metric}_min'] = values[f'{metric}_max'] = value
+    for counter, fields in SENSOR_COUNTERS.items():
+        if any(getattr(instance, field) is not None for field in fields):
+            values[counter] = 1
+    values[RISK_COUNTERS.get(instance.risk_level, RISK_NONE_COUNTER)] = 1
+    return values
+
+
+def update_rollups(instances):
+    """
+    Ajouter un lot de lectures sauvegardées aux tranches (dans la transaction d'ingestion)
+
+    Nombre de requêtes constant: lecture verrouillée des tranches touchées,
+    bulk_update des existantes, bulk_create des nouvelles.
+    """
+    deltas = {}
+    for instance in instances:
+        values = _reading_values(instance)
+        for resolution in RESOLUTIONS:
+            key = (instance.user_id, resolution, bucket_start(instance.timestamp, resolution))
+            _merge(deltas.setdefault(key, _empty()), values)
+    if deltas:
+        _apply_deltas(deltas)
+
+
+def _apply_deltas(deltas, retry=True):
+    existing = {
+        (rollup.user_id, rollup.resolution, rollup.bucket): rollup
+        for rollup in SensorRollup.objects.select_for_update().filter(
+            user_id__in={key[0] for key in deltas},
+            bucket__in={key[2] for key in deltas},
+        )
+    }
+
+    now = timezone.now()
+    to_update = []
+    to_create = {}
+    for key, delta in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            to_create[key] = SensorRollup(user_id=key[0], resolution=key[1], bucket=key[2], **delta)
+            continue
+        values = _merge({field: getattr(rollup, field) for field in VALUE_FIELDS}, delta)
+        for field, value in values.items():
+            setattr(rollup, field, value)
+        rollup.updated_at = now
+        to_update.append(rollup)
+
+    if to_update:
+        SensorRollup.objects.bulk_update(to_update, VALUE_FIELDS + ('updated_at',))
+    if to_create:
+        try:
+            with transaction.atomic():
+                SensorRollup.objects.bulk_create(to_create.values())
+        except IntegrityError:
+            # Tranche créée en parallèle: elle existe désormais, on fusionne dedans
+            if not retry:
+                raise
+            _apply_deltas({key: deltas[key] for key in to_create}, retry=False)
+
+
+def _raw_aggregates():
+    aggregates = {'count': Count('id')}
+    for metric in METRICS:
+        aggregates[f'{metric}_count'] = Count(metric)
+        aggregates[f'{metric}_sum'] = Sum(metric)
+        aggregates[f'{metric}_min'] = Min(metric)
+        aggregates[f'{metric}_max'] = Max(metric)
+    for counter, fields in SENSOR_COUNTERS.items():
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__isnull': False})
+        aggregates[counter] = Count('id', filter=condition)
+    for level, counter in RISK_COUNTERS.items():
+        aggregates[counter] = Count('id', filter=Q(risk_level=level))
+    aggregates[RISK_NONE_COUNTER] = Count('id', filter=~Q(risk_level__in=list(RISK_COUNTERS)))
+    return aggregates
+
+
+def _rollup_aggregates():
+    aggregates = {field: Sum(field) for field in SUM_FIELDS}
+    aggregates.update({field: Min(field) for field in MIN_FIELDS})
+    aggregates.update({field: Max(field) for field in MAX_FIELDS})
+    return aggregates
+
+
+def _segments(start, end, resolutions):
+    """Découper [start, end) en (résolution, début, fin), tranches les plus grossières au centre"""
+    if start >= end:
+        return []
+    if not resolutions:
+        return [(None, start, end)]
+    coarse = resolutions[-1]
+    first, last = _bucket_end(start, coarse), bucket_start(end, coarse)
+    if first >= last:
+        return _segments(start, end, resolutions[:-1])
+    return (
+        _segments(start, first, resolutions[:-1])
+        + [(coarse, first, last)]
+        + _segments(last, end, resolutions[:-1])
+    )
+
+
+def plan(start, now=None):
+    """
+    Plan de lecture des statistiques depuis start
+
+    Returns:
+        Liste de (résolution ou None pour SensorData, début, fin). La dernière
+        tranche brute n'a pas de fin (minute en cours, horloges en avance).
+    """
+    now = now or timezone.now()
+    horizon = now - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS)
+    segments = []
+    for resolution, segment_start, segment_end in _segments(start, now, RESOLUTIONS):
+        # Minutes purgées par la compaction: lignes brutes (< 1h en bord de période)
+        if resolution == '1m' and segment_start < horizon:
+            resolution = None
+        segments.append((resolution, segment_start, segment_end))
+    if segments and segments[-1][0] is None:
+        segments[-1] = (None, segments[-1][1], None)
+    else:
+        segments.append((None, bucket_start(now, '1m') if segments else start, None))
+    return segments
+
+
+def summarize(user, start, now=None):
+    """
+    Agrégats des lectures de user depuis start (au plus deux requêtes)
+
+    Returns:
+        dict de VALUE_FIELDS (count, <métrique>_count/_sum/_min/_max, compteurs)
+    """
+    rollup_filter = Q()
+    raw_filter = Q()
+    for resolution, segment_start, segment_end in plan(start, now):
+        if resolution is None:
+            condition = Q(timestamp__gte=segment_start)
+            if segment_end is not None:
+                condition &= Q(timestamp__lt=segment_end)
+            raw_filter |= condition
+        else:
+            rollup_filter |= Q(resolution=resolution, bucket__gte=segment_start, bucket__lt=segment_end)
+
+    summary = _empty()
+    if rollup_filter:
+        _merge(summary, SensorRollup.objects.filter(rollup_filter, user=user).aggregate(**_rollup_aggregates()))
+    if raw_filter:
+        _merge(summary, SensorData.objects.filter(raw_filter, user=user).aggregate(**_raw_aggregates()))
+    return summary
+
+
+def average(summary, metric):
+    count = summary[f'{metric}_count']
+    return summary[f'{metric}_sum'] / count if count else None
+
+
+def extremum(summary, field):
+    """Min/max en entier si la métrique l'est (les tranches stockent des flottants)"""
+    value = summary[field]
+    return int(value) if value is not None and value == int(value) else value
+
+
+def risk_distribution(summary):
+    """[{'risk_level', 'count'}] pour les niveaux présents ('' = non scoré)"""
+    levels = list(RISK_COUNTERS.items()) + [('', RISK_NONE_COUNTER)]
+    return [
+        {'risk_level': level, 'count': summary[counter]}
+        for level, counter in levels
+        if summary[counter]
+    ]
+
+
+def _slices(resolution, since, until, user_ids):
+    """(utilisateur, tranche) ayant des lectures ou des tranches stockées dans [since, until)"""
+    readings = SensorData.objects.order_by()
+    stored = SensorRollup.objects.filter(resolution=resolution)
+    if since is not None:
+        readings = readings.filter(timestamp__gte=since)
+        stored = stored.filter(bucket__gte=since)
+    if until is not None:
+        readings = readings.filter(timestamp__lt=until)
+        stored = stored.filter(bucket__lt=until)
+    if user_ids is not None:
+        readings = readings.filter(user_id__in=user_ids)
+        stored = stored.filter(user_id__in=user_ids)
+
+    slices = set(readings.annotate(
+        slice=TRUNCATE[resolution]('timestamp', tzinfo=dt_timezone.utc)
+    ).values_list('user_id', 'slice').distinct())
+    slices.update(stored.values_list('user_id', 'bucket'))
+    return sorted(slices, key=lambda item: (item[1], item[0]))
+
+
+def _rewrite(user_id, start, end, resolutions):
+    """Remplacer les tranches de user_id sur [start, end) par les agrégats SensorData (une transaction courte)"""
+    readings = SensorData.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+    batch = []
+    try:
+        with transaction.atomic():
+            SensorRollup.objects.filter(
+                user_id=user_id, resolution__in=resolutions, bucket__gte=start, bucket__lt=end
+            ).delete()
+            for resolution in resolutions:
+                rows = readings.annotate(
+                    bucket=TRUNCATE[resolution]('timestamp', tzinfo=dt_timezone.utc)
+                ).values('bucket').annotate(**_raw_aggregates()).order_by()
+                batch += [
+                    SensorRollup(user_id=user_id, resolution=resolution, bucket=row['bucket'], **_merge(_empty(), row))
+                    for row in rows
+                ]
+            SensorRollup.objects.bulk_create(batch)
+    except IntegrityError:
+        # Tranche créée entre-temps par une ingestion: reprise à la prochaine passe
+        return 0
+    return len(batch)
+
+
+def _rewrite_day(user_id, day):
+    """Recalculer la tranche jour de user_id depuis ses tranches heure (jour clos)"""
+    hours = SensorRollup.objects.filter(
+        user_id=user_id, resolution='1h', bucket__gte=day, bucket__lt=day + STEPS['1d']
+    )
+    try:
+        with transaction.atomic():
+            summary = hours.aggregate(**_rollup_aggregates())
+            SensorRollup.objects.filter(user_id=user_id, resolution='1d', bucket=day).delete()
+            if not summary['count']:
+                return 0
+            SensorRollup.objects.create(user_id=user_id, resolution='1d', bucket=day, **_merge(_empty(), summary))
+    except IntegrityError:
+        return 0
+    return 1
+
+
+def rebuild(since=None, user_ids=None, until=None):
+    """
+    Recalculer les tranches depuis SensorData (réparation, backfill)
+
+    since et until sont alignés sur des jours entiers (UTC) pour que toutes
+    les résolutions soient recalculées sur la même plage. Une transaction
+    par utilisateur et par jour: les verrous de l'ingestion restent courts.
+
+    Returns:
+        Nombre de tranches écrites
+    """
+    if since is not None:
+        since = bucket_start(since, '1d')
+    if until is not None:
+        until = _bucket_end(until, '1d')
+    return sum(
+        _rewrite(user_id, day, day + STEPS['1d'], RESOLUTIONS)
+        for user_id, day in _slices('1d', since, until, user_ids)
+    )
+
+
+def compact(since, now=None, user_ids=None):
+    """
+    Compaction incrémentale des tranches closes depuis since
+
+    Heures closes: minutes et heure recalculées depuis SensorData, une
+    transaction par utilisateur et par heure. Jours clos de la plage: tranche
+    jour recalculée depuis ses heures. Les tranches ouvertes (heure et jour
+    courants) restent maintenues par l'ingestion seule.
+
+    Returns:
+        (tranches écrites, début de la plage de la passe suivante)
+    """
+    now = now or timezone.now()
+    closed = bucket_start(now, '1h')
+    written = sum(
+        _rewrite(user_id, hour, hour + STEPS['1h'], ('1m', '1h'))
+        for user_id, hour in _slices('1h', bucket_start(since, '1h'), closed, user_ids)
+    )
+
+    first_day, today = bucket_start(since, '1d'), bucket_start(now, '1d')
+    days = SensorRollup.objects.filter(resolution__in=('1h', '1d'), bucket__gte=first_day, bucket__lt=today)
+    if user_ids is not None:
+        days = days.filter(user_id__in=user_ids)
+    days = days.annotate(day=TruncDay('bucket', tzinfo=dt_timezone.utc)).values_list('user_id', 'day')
+    for user_id, day in sorted(set(days), key=lambda item: (item[1], item[0])):
+        written += _rewrite_day(user_id, day)
+    return written, closed
+
+
+def prune(now=None):
+    """Supprimer les tranches minute au-delà de ROLLUP_MINUTE_RETENTION_DAYS"""
+    now = now or timezone.now()
+    horizon = bucket_start(now - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS), '1h')
+    deleted, _ = SensorRollup.objects.filter(resolution='1m', bucket__lt=horizon).delete()
+    return deleted
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import BraceletDevice, SensorData, SensorAnalytics, RiskAlert
-from Security.core.security import SensorDataValidator, APISecurityValidator
+from .validation import validate_reading
+from Security.core.security import APISecurityValidator
 
 class BraceletDeviceSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,46 +46,17 @@ class SensorDataCreateSerializer(serializers.ModelSerializer):
             'temperature', 'humidity', 'activity_level', 'steps'
         ]
     
-    def validate_spo2(self, value):
-        """Validation sécurisée du SpO2"""
-        return SensorDataValidator.validate_spo2(value)
-    
-    def validate_respiratory_rate(self, value):
-        """Validation sécurisée de la fréquence respiratoire"""
-        return SensorDataValidator.validate_respiratory_rate(value)
-    
-    def validate_heart_rate(self, value):
-        """Validation sécurisée de la fréquence cardiaque"""
-        return SensorDataValidator.validate_heart_rate(value)
-    
-    def validate_aqi(self, value):
-        """Validation sécurisée de l'AQI"""
-        return SensorDataValidator.validate_aqi(value)
-    
-    def validate_temperature(self, value):
-        """Validation sécurisée de la température"""
-        return SensorDataValidator.validate_temperature(value)
-    
-    def validate_humidity(self, value):
-        """Validation sécurisée de l'humidité - DHT11"""
-        return SensorDataValidator.validate_humidity(value)
-    
-    def validate_eco2(self, value):
-        """Validation sécurisée de l'eCO2 - CJMCU-811"""
-        return SensorDataValidator.validate_eco2(value)
-    
-    def validate_tvoc(self, value):
-        """Validation sécurisée du TVOC - CJMCU-811"""
-        return SensorDataValidator.validate_tvoc(value)
-    
     def validate(self, data):
-        """Validation globale de l'intégrité des données"""
-        # Validation de l'intégrité des données
-        SensorDataValidator.validate_data_integrity(data)
+        """Validation globale: plages capteurs et intégrité des données"""
+        # En lot, les plages sont vérifiées une seule fois sur tout le tableau (validate_batch)
+        if not self.context.get('bulk'):
+            errors = validate_reading(data)
+            if errors:
+                raise serializers.ValidationError(errors)
         
-        # Validation de la fréquence des requêtes
+        # Validation de la fréquence des requêtes (faite une seule fois pour un lot)
         request = self.context.get('request')
-        if request and request.user:
+        if request and request.user and not self.context.get('bulk'):
             APISecurityValidator.validate_request_frequency(request.user, 'sensor_data')
             APISecurityValidator.validate_sensitive_data_access(request.user, 'medical_data')
         
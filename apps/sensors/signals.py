@@ -0,0 +1,45 @@
+"""
+Invalidation du cache de résolution (apps.sensors.resolver)
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from apps.sensors import resolver
+from apps.sensors.models import BraceletDevice
+
+User = get_user_model()
+
+
+@receiver(post_init, sender=BraceletDevice)
+def remember_bracelet_owner(sender, instance, **kwargs):
+    # __dict__: ne pas charger les champs différés
+    instance._resolver_snapshot = (instance.__dict__.get('device_id'), instance.__dict__.get('user_id'))
+
+
+@receiver(post_save, sender=BraceletDevice)
+@receiver(post_delete, sender=BraceletDevice)
+def forget_bracelet(sender, instance, **kwargs):
+    """Device créé, réattribué, (dé)connecté ou supprimé"""
+    old_device_id, old_user_id = getattr(instance, '_resolver_snapshot', (None, None))
+    resolver.forget_device(instance.device_id, instance.user_id, *filter(None, [old_user_id]))
+    if old_device_id and old_device_id != instance.device_id:
+        resolver.forget_device(old_device_id)
+    instance._resolver_snapshot = (instance.device_id, instance.user_id)
+
+
+@receiver(post_init, sender=User)
+def remember_user_email(sender, instance, **kwargs):
+    instance._resolver_email = instance.__dict__.get('email')
+
+
+@receiver(post_save, sender=User)
+def forget_changed_email(sender, instance, created, **kwargs):
+    old_email = getattr(instance, '_resolver_email', None)
+    if not created and old_email != instance.email:
+        resolver.forget_email(old_email, instance.email)
+    instance._resolver_email = instance.email
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    resolver.forget_email(instance.email)
@@ -0,0 +1,1925 @@
+import asyncio
+import json
+import re
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.models import Avg, Max, Min
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import AsyncClient, RequestFactory, SimpleTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from unittest import mock
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import (
+    BraceletDevice, SensorData, RiskAlert, UbidotsSyncCursor, IngestQueueItem, NotificationOutbox,
+    LatestSensorState, RollingWindowState, SensorAnalytics, SensorRollup
+)
+from .ingest_queue import drain_queue
+from .ingest_service import existing_ubidots_timestamps, ingest_readings
+from . import alert_engine, device_state, export, notifications, read_serializers, realtime, realtime_views, history, resolver, risk_engine, rolling_analytics, rollups, validation
+from .serializers import RiskAlertSerializer, SensorAnalyticsSerializer, SensorDataSerializer
+from Security.core.security import SensorDataValidator
+from api import renderers as api_renderers
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+from .ubidots_service import UbidotsService
+
+User = get_user_model()
+
+# Écritures d'état des bracelets immédiates: pas de timer en arrière-plan pendant les tests
+_device_state_settings = override_settings(DEVICE_STATE_FLUSH_SECONDS=0)
+
+
+def setUpModule():
+    _device_state_settings.enable()
+
+
+def tearDownModule():
+    _device_state_settings.disable()
+
+
+class SensorBulkIngestTestCase(APITestCase):
+    """Tests pour l'ingestion en lot data/bulk/"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.bulk_url = '/api/v1/sensors/data/bulk/'
+
+    def _readings(self, count):
+        now = timezone.now()
+        return [
+            {
+                'timestamp': (now - timedelta(minutes=i)).isoformat(),
+                'spo2': 97,
+                'heart_rate': 72,
+                'respiratory_rate': 16,
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_creates_all_rows(self):
+        """Toutes les lectures valides sont créées avec score de risque"""
+        response = self.client.post(self.bulk_url, self._readings(5), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(SensorData.objects.filter(user=self.user).count(), 5)
+        for row in response.data['results']:
+            self.assertEqual(row['status'], 'created')
+            self.assertEqual(row['risk_level'], 'LOW')
+        self.assertIsNotNone(SensorData.objects.first().hour_of_day)
+
+    def test_bulk_reports_invalid_rows(self):
+        """Les lignes invalides sont rejetées individuellement"""
+        readings = self._readings(3)
+        readings[1]['spo2'] = 20
+
+        response = self.client.post(self.bulk_url, {'readings': readings}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['results'][1]['status'], 'invalid')
+        self.assertIn('spo2', response.data['results'][1]['errors'])
+
+    def test_bulk_creates_alerts(self):
+        """Les alertes sont créées pour les lectures critiques"""
+        readings = self._readings(2)
+        readings[0]['spo2'] = 85
+
+        self.client.post(self.bulk_url, readings, format='json')
+
+        alert = RiskAlert.objects.get(user=self.user)
+        self.assertEqual(alert.alert_type, 'LOW_SPO2')
+        self.assertEqual(alert.sensor_data.spo2, 85)
+
+    def test_bulk_query_count_is_constant(self):
+        """Le nombre de requêtes ne dépend pas de la taille du lot"""
+        BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        # Premier lot: création du dernier état connu
+        self.client.post(self.bulk_url, self._readings(1), format='json')
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.bulk_url, self._readings(5), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.bulk_url, self._readings(40), format='json')
+
+        # SQLite limite une requête à 999 paramètres: l'INSERT des tranches SensorRollup
+        # (une par minute du lot, ~35 colonnes) y est découpé, pas sur PostgreSQL
+        def counted(queries):
+            return [q for q in queries if not q['sql'].startswith('INSERT INTO "sensors_sensorrollup"')]
+
+        self.assertEqual(len(counted(small)), len(counted(large)))
+
+    def test_bulk_rejects_empty_payload(self):
+        """Un lot vide est refusé"""
+        response = self.client.post(self.bulk_url, [], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AlertEngineTestCase(APITestCase):
+    """Tests du moteur de règles d'alertes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        self.start = timezone.now() - timedelta(hours=2)
+
+    def _ingest(self, minutes, **fields):
+        # Carences écrites au commit de l'ingestion
+        with self.captureOnCommitCallbacks(execute=True):
+            return ingest_readings(self.user, self.bracelet, [
+                {'timestamp': self.start + timedelta(minutes=minute), 'spo2': 97, **fields}
+                for minute in minutes
+            ])
+
+    def test_zero_reading_raises_no_alert(self):
+        """spo2=0 (capteur hors poignet) n'est pas une SpO2 critique"""
+        self._ingest([0], spo2=0, respiratory_rate=0, aqi=0)
+        self.assertFalse(RiskAlert.objects.exists())
+
+        self._ingest([1], spo2=85)
+        self.assertEqual(list(RiskAlert.objects.values_list('alert_type', flat=True)), ['LOW_SPO2'])
+
+    def test_rolled_back_ingest_keeps_no_cooldown(self):
+        """Une ingestion annulée n'arme pas la carence: le rejeu crée l'alerte"""
+        from django.db import transaction
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            ingest_readings(self.user, self.bracelet, [
+                {'timestamp': self.start, 'spo2': 97, 'smoke_detected': True}
+            ])
+            raise RuntimeError('rollback')
+        self.assertEqual(alert_engine.unread_count(self.user.id), 0)
+
+        self._ingest([0], smoke_detected=True)
+        self.assertEqual(RiskAlert.objects.filter(alert_type='SMOKE_DETECTED').count(), 1)
+        self.assertEqual(alert_engine.unread_count(self.user.id), 1)
+
+    def test_episode_creates_single_alert(self):
+        """Une longue exposition à la fumée ne crée qu'une alerte par carence"""
+        self._ingest(range(0, 5), smoke_detected=True)
+        self._ingest(range(5, 9), smoke_detected=True)
+        self.assertEqual(RiskAlert.objects.filter(alert_type='SMOKE_DETECTED').count(), 1)
+
+        # Après la carence, un nouvel épisode est signalé
+        self._ingest([30], smoke_detected=True)
+        self.assertEqual(RiskAlert.objects.filter(alert_type='SMOKE_DETECTED').count(), 2)
+
+    def test_escalation_bypasses_cooldown(self):
+        """Une aggravation de sévérité passe malgré la carence"""
+        self._ingest([0, 1], aqi=200)
+        self._ingest([2, 3], aqi=350)
+
+        severities = list(
+            RiskAlert.objects.filter(alert_type='POOR_AIR_QUALITY')
+            .order_by('sensor_data__timestamp').values_list('severity', flat=True)
+        )
+        self.assertEqual(severities, ['WARNING', 'CRITICAL'])
+
+    def test_alerts_inserted_in_one_query(self):
+        """Les alertes d'un lot sont insérées avec une seule requête"""
+        readings = [
+            {'timestamp': self.start + timedelta(hours=i), 'spo2': 85, 'smoke_detected': True}
+            for i in range(3)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            ingest_readings(self.user, self.bracelet, readings)
+
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "sensors_riskalert"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(RiskAlert.objects.count(), 6)
+
+    def test_webhook_readings_trigger_alerts(self):
+        """Les lectures reçues par webhook passent par le moteur d'alertes"""
+        self.client.post('/api/v1/sensors/ubidots/webhook/', {
+            'device_id': 'dev-abc',
+            'user_email': self.user.email,
+            'timestamp': int(timezone.now().timestamp() * 1000),
+            'data': {'spo2': 85},
+        }, format='json')
+
+        self.assertTrue(RiskAlert.objects.filter(alert_type='LOW_SPO2').exists())
+
+
+def legacy_risk_score(spo2, respiratory_rate, aqi, eco2, tvoc, heart_rate, smoke_detected):
+    """Copie de l'ancienne chaîne if/elif de SensorData.calculate_risk_score (référence)"""
+    score = 0
+    if spo2 is not None:
+        if spo2 < 90:
+            score += 30
+        elif spo2 < 95:
+            score += 20
+        elif spo2 < 98:
+            score += 10
+    if respiratory_rate is not None:
+        if respiratory_rate > 30 or respiratory_rate < 12:
+            score += 25
+        elif respiratory_rate > 25 or respiratory_rate < 15:
+            score += 15
+    if aqi is not None:
+        if aqi > 300:
+            score += 20
+        elif aqi > 150:
+            score += 15
+        elif aqi > 100:
+            score += 10
+        elif aqi > 50:
+            score += 5
+    if eco2 is not None:
+        if eco2 > 5000:
+            score += 15
+        elif eco2 > 2000:
+            score += 10
+        elif eco2 > 1000:
+            score += 5
+    if tvoc is not None:
+        if tvoc > 3300:
+            score += 10
+        elif tvoc > 1000:
+            score += 5
+        elif tvoc > 220:
+            score += 2
+    if heart_rate is not None:
+        if heart_rate > 120 or heart_rate < 50:
+            score += 15
+        elif heart_rate > 100 or heart_rate < 60:
+            score += 8
+    if smoke_detected:
+        score += 10
+    return min(score, 100)
+
+
+class RiskEngineTestCase(SimpleTestCase):
+    """Tests d'équivalence du moteur de risque avec l'ancien calcul"""
+
+    def _columns(self):
+        # Valeurs aux frontières de chaque seuil, flottants et absences comprises
+        grid = {
+            'spo2': [None, 85, 89.5, 90, 94, 95, 97.9, 98, 100],
+            'respiratory_rate': [None, 11, 12, 14, 15, 25, 26, 30, 31],
+            'aqi': [None, 0, 50, 51, 100, 101, 150, 151, 300, 301],
+            'eco2': [None, 400, 1000, 1001, 2000, 2001, 5000, 5001],
+            'tvoc': [None, 0, 220, 221, 1000, 1001, 3300, 3301],
+            'heart_rate': [None, 49, 50, 59, 60, 100, 101, 120, 121],
+            'smoke_detected': [False, True, None],
+        }
+        size = 2000
+        return {
+            field: [values[(i * (k + 3) + i // (k + 1)) % len(values)] for i in range(size)]
+            for k, (field, values) in enumerate(grid.items())
+        }, size
+
+    def _expected(self, columns, size):
+        scores, levels = [], []
+        for i in range(size):
+            row = {field: columns[field][i] for field in risk_engine.RISK_FIELDS}
+            if row['spo2'] is None and row['aqi'] is None:
+                scores.append(None)
+                levels.append(None)
+                continue
+            score = legacy_risk_score(**row)
+            scores.append(score)
+            levels.append('LOW' if score < 25 else 'MODERATE' if score < 50 else 'HIGH' if score < 75 else 'CRITICAL')
+        return scores, levels
+
+    def test_vectorized_matches_legacy(self):
+        """Le chemin NumPy reproduit exactement l'ancien calcul"""
+        columns, size = self._columns()
+        self.assertEqual(risk_engine.score_batch(columns), self._expected(columns, size))
+
+    def test_python_fallback_matches_legacy(self):
+        """Le repli sans NumPy reproduit exactement l'ancien calcul"""
+        columns, size = self._columns()
+        with mock.patch.object(risk_engine, 'np', None):
+            self.assertEqual(risk_engine.score_batch(columns), self._expected(columns, size))
+
+    def test_save_uses_engine(self):
+        """save() et calculate_risk_score() passent par le moteur"""
+        reading = SensorData(spo2=88, aqi=310, smoke_detected=True, timestamp=timezone.now())
+        reading.apply_derived_fields()
+        self.assertEqual(reading.risk_score, 60)
+        self.assertEqual(reading.risk_level, 'HIGH')
+        self.assertEqual(reading.calculate_risk_score(), 60)
+
+
+class BatchValidationTestCase(SimpleTestCase):
+    """Tests du validateur en lot"""
+
+    def setUp(self):
+        validation._log_state.clear()
+
+    def test_batch_matches_field_validators(self):
+        """Les erreurs du lot reprennent les plages et messages de SensorDataValidator"""
+        rows = [
+            {'spo2': 97, 'heart_rate': 72},
+            {'spo2': 20},
+            {'temperature': 50.0, 'eco2': 'beaucoup'},
+            {'humidity': None},
+        ]
+
+        errors = validation.validate_batch(rows)
+
+        self.assertEqual(set(errors), {1, 2})
+        with self.assertRaises(DjangoValidationError) as ctx:
+            SensorDataValidator.validate_spo2(20)
+        self.assertEqual(errors[1]['spo2'], ctx.exception.messages)
+        self.assertEqual(set(errors[2]), {'temperature', 'eco2'})
+
+    def test_large_batch_is_fast(self):
+        """10k lectures sont validées en quelques millisecondes"""
+        rows = [
+            {'spo2': 90 + i % 10, 'heart_rate': 60 + i % 50, 'respiratory_rate': 16,
+             'temperature': 36.5, 'humidity': 40, 'eco2': 400, 'tvoc': 100, 'aqi': 30}
+            for i in range(10_000)
+        ]
+
+        start = time.perf_counter()
+        errors = validation.validate_batch(rows)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, {})
+        self.assertLess(elapsed, 0.5)
+
+    def test_warnings_are_rate_limited(self):
+        """Les anomalies sont agrégées par lot et journalisées au plus une fois par intervalle"""
+        rows = [{'spo2': 80} for _ in range(500)]
+
+        with self.assertLogs('django.security', level='WARNING') as logs:
+            validation.validate_batch(rows)
+            validation.validate_batch(rows)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('(x500)', logs.records[0].getMessage())
+
+
+class FakeUbidotsResponse:
+    """Réponse HTTP minimale pour simuler l'API Ubidots"""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeUbidotsSession:
+    """Session simulée: 2 devices, 3 variables chacun, latence fixe par appel"""
+
+    BASE_VALUES = {'spo2': 96, 'hr': 70, 'temp': 36}
+
+    def __init__(self, latency=0.0, base_ms=None, values_count=3, page_size=1000):
+        self.latency = latency
+        self.base_ms = base_ms or int((time.time() - 600) * 1000)
+        self.values_count = values_count
+        self.page_size = page_size
+        self.calls = []
+
+    def values(self, variable_id, page):
+        # Ordre décroissant comme l'API Ubidots, paginé avec lien 'next'
+        base_value = self.BASE_VALUES[variable_id.rsplit('-', 1)[-1]]
+        all_values = [
+            {'timestamp': self.base_ms + i * 60_000, 'value': base_value + i % 3}
+            for i in reversed(range(self.values_count))
+        ]
+        chunk = all_values[(page - 1) * self.page_size:page * self.page_size]
+        has_next = page * self.page_size < len(all_values)
+        return {
+            'count': len(all_values),
+            'next': f'https://industrial.api.ubidots.com/api/v1.6/variables/{variable_id}/values/?page={page + 1}' if has_next else None,
+            'results': chunk,
+        }
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.calls.append((url, params, timeout))
+        time.sleep(self.latency)
+        if url.endswith('/devices/'):
+            return FakeUbidotsResponse({'results': [{'id': 'dev1', 'label': 'a'}, {'id': 'dev2', 'label': 'b'}]})
+        if url.endswith('/variables'):
+            device_id = url.split('/')[-2]
+            return FakeUbidotsResponse({'results': [
+                {'id': f'{device_id}-spo2', 'label': 'spo2'},
+                {'id': f'{device_id}-hr', 'label': 'heart_rate'},
+                {'id': f'{device_id}-temp', 'label': 'temperature'},
+            ]})
+        path, _, query = url.partition('?')
+        variable_id = path.split('/')[-3]
+        page = int(query.split('=')[1]) if query else 1
+        return FakeUbidotsResponse(self.values(variable_id, page))
+
+
+class UbidotsSyncTestCase(APITestCase):
+    """Tests de la synchronisation Ubidots"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+
+    def _service(self, session):
+        service = UbidotsService(api_token='token')
+        service.session = session
+        return service
+
+    def test_sync_fetches_concurrently(self):
+        """Le temps de synchro suit l'appel le plus lent, pas la somme des appels"""
+        session = FakeUbidotsSession(latency=0.2)
+
+        start = time.perf_counter()
+        result = self._service(session).sync_sensor_data(self.user.email)
+        elapsed = time.perf_counter() - start
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['total_synced'], 6)
+        # 1 (devices) + 2 (variables) + 6 (valeurs) appels de 0.2s: ~1.8s en séquentiel
+        self.assertEqual(len(session.calls), 9)
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(all(timeout for _, _, timeout in session.calls))
+
+    def test_shared_session_retries_rate_limits(self):
+        """La session partagée réessaie sur 429/5xx avec jitter"""
+        adapter = UbidotsService(api_token='token').session.get_adapter('https://industrial.api.ubidots.com')
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertGreater(adapter.max_retries.backoff_jitter, 0)
+        self.assertIs(UbidotsService(api_token='other').session, UbidotsService(api_token='token').session)
+
+    def test_resync_is_noop(self):
+        """Relancer la même synchro n'insère rien et coûte un nombre fixe de requêtes"""
+        service = self._service(FakeUbidotsSession())
+        service.sync_sensor_data(self.user.email)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = service.sync_sensor_data(self.user.email)
+
+        self.assertEqual(result['total_synced'], 0)
+        self.assertEqual(SensorData.objects.filter(user=self.user).count(), 6)
+        # utilisateur + watermarks + (bracelet, existant, last_sync) par device
+        self.assertLessEqual(len(queries), 2 + 3 * 2)
+
+    def test_sync_skips_rows_from_webhook(self):
+        """Une lecture déjà reçue par webhook n'est pas dupliquée par la synchro"""
+        session = FakeUbidotsSession()
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='ubidots_dev1')
+        SensorData.objects.create(
+            user=self.user, bracelet=bracelet, timestamp=timezone.now(),
+            ubidots_device_id='dev1', ubidots_timestamp=session.base_ms
+        )
+
+        result = self._service(session).sync_sensor_data(self.user.email)
+
+        self.assertEqual(result['total_synced'], 5)
+        self.assertEqual(
+            SensorData.objects.filter(ubidots_device_id='dev1', ubidots_timestamp=session.base_ms).count(), 1
+        )
+
+    def test_incremental_sync_starts_from_watermark(self):
+        """La synchro suivante ne demande que les valeurs après le watermark (moins le recouvrement)"""
+        session = FakeUbidotsSession()
+        service = self._service(session)
+        service.sync_sensor_data(self.user.email)
+
+        cursor = UbidotsSyncCursor.objects.get(user=self.user, variable_id='dev1-spo2')
+        self.assertEqual(cursor.last_timestamp, session.base_ms + 2 * 60_000)
+
+        session.calls.clear()
+        result = service.sync_sensor_data(self.user.email)
+
+        self.assertEqual(result['mode'], 'incremental')
+        value_calls = [params for url, params, _ in session.calls if url.endswith('/values/')]
+        self.assertTrue(value_calls)
+        for params in value_calls:
+            self.assertEqual(params['start'], cursor.last_timestamp - 300_000)
+
+    def test_backfill_ignores_watermark(self):
+        """hours_back force une fenêtre explicite"""
+        session = FakeUbidotsSession()
+        service = self._service(session)
+        service.sync_sensor_data(self.user.email)
+        session.calls.clear()
+
+        result = service.sync_sensor_data(self.user.email, hours_back=48)
+
+        self.assertEqual(result['mode'], 'backfill')
+        expected_start = (timezone.now() - timedelta(hours=48)).timestamp() * 1000
+        starts = [params['start'] for url, params, _ in session.calls if url.endswith('/values/')]
+        self.assertAlmostEqual(min(starts), expected_start, delta=60_000)
+
+    def test_reader_follows_pagination(self):
+        """Le lecteur suit les pages 'next' sans tronquer"""
+        session = FakeUbidotsSession(values_count=2500)
+        service = self._service(session)
+
+        pages = list(service.iter_variable_values('dev1-spo2'))
+
+        self.assertEqual([len(page) for page in pages], [1000, 1000, 500])
+        self.assertEqual(len(service.get_variable_values('dev1-spo2')), 2500)
+
+    def test_backfill_is_processed_in_time_slices(self):
+        """Un backfill long est découpé en tranches successives"""
+        session = FakeUbidotsSession()
+        service = self._service(session)
+
+        with self.settings(UBIDOTS_SYNC_CHUNK_HOURS=24):
+            service.sync_sensor_data(self.user.email, hours_back=24 * 7)
+
+        first_pages = [params for url, params, _ in session.calls if url.endswith('/values/')]
+        # 6 variables x 7 tranches d'un jour
+        self.assertEqual(len(first_pages), 6 * 7)
+
+    def test_metadata_is_cached(self):
+        """Devices et variables ne sont demandés qu'une fois, jusqu'à invalidation"""
+        session = FakeUbidotsSession()
+        service = self._service(session)
+        service.sync_sensor_data(self.user.email)
+
+        session.calls.clear()
+        service.sync_sensor_data(self.user.email)
+        self.assertTrue(all(url.endswith('/values/') for url, _, _ in session.calls))
+
+        service.invalidate_metadata()
+        session.calls.clear()
+        service.sync_sensor_data(self.user.email)
+        self.assertEqual(
+            sum(1 for url, _, _ in session.calls if not url.endswith('/values/')), 1 + 2
+        )
+
+
+class IngestQueueTestCase(APITestCase):
+    """Tests du webhook Ubidots en mode write-behind"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.webhook_url = '/api/v1/sensors/ubidots/webhook/'
+        self.base_ms = int(timezone.now().timestamp() * 1000)
+
+    def _payload(self, offset=0, device_id='dev-abc', email='test@example.com'):
+        return {
+            'device_id': device_id,
+            'user_email': email,
+            'timestamp': self.base_ms + offset * 1000,
+            'data': {'spo2': 97, 'heart_rate': 72},
+        }
+
+    def test_async_webhook_enqueues(self):
+        """En mode asynchrone le webhook répond 202 sans écrire de SensorData"""
+        with self.settings(UBIDOTS_WEBHOOK_ASYNC=True):
+            response = self.client.post(self.webhook_url, self._payload(), format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(IngestQueueItem.objects.count(), 1)
+        self.assertFalse(SensorData.objects.exists())
+
+    def test_async_webhook_rejects_invalid_payload(self):
+        """La forme du payload est validée avant la mise en file"""
+        payload = self._payload()
+        payload['timestamp'] = 'hier'
+        with self.settings(UBIDOTS_WEBHOOK_ASYNC=True):
+            response = self.client.post(self.webhook_url, payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IngestQueueItem.objects.exists())
+
+    def test_drain_inserts_in_bulk_and_dedupes(self):
+        """Le consommateur insère le lot, ignore les rejeux et conserve les échecs"""
+        payloads = [self._payload(i) for i in range(20)]
+        payloads.append(self._payload(3))  # rejeu Ubidots
+        payloads.append(self._payload(0, email='inconnu@example.com', device_id='dev-xyz'))
+        for payload in payloads:
+            IngestQueueItem.objects.create(payload=payload)
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = drain_queue(batch_size=100)
+
+        self.assertEqual(stats, {'processed': 22, 'created': 20, 'failed': 1, 'retried': 0})
+        self.assertEqual(SensorData.objects.filter(ubidots_device_id='dev-abc').count(), 20)
+        # Savepoints: résolution + un par device (SAVEPOINT / RELEASE), fenêtres: création, verrou, écriture
+        self.assertLess(len(queries), 40)
+        failed = IngestQueueItem.objects.get()
+        self.assertEqual(failed.status, 'FAILED')
+        self.assertEqual(failed.attempts, 1)
+
+        # Rejouer le même lot plus tard ne crée rien
+        IngestQueueItem.objects.create(payload=self._payload(5))
+        self.assertEqual(drain_queue()['created'], 0)
+        self.assertEqual(SensorData.objects.count(), 20)
+
+    def test_drain_isolates_failing_device(self):
+        """Une erreur d'ingestion n'annule que le groupe du device, réessayé jusqu'à MAX_ATTEMPTS"""
+        from .ingest_queue import MAX_ATTEMPTS
+        from . import ingest_queue
+        for i in range(3):
+            IngestQueueItem.objects.create(payload=self._payload(i))
+            IngestQueueItem.objects.create(payload=self._payload(i, device_id='dev-bad'))
+
+        real_ingest = ingest_queue.ingest_ubidots_readings
+
+        def failing_ingest(user, bracelet, device_id, readings, **kwargs):
+            if device_id == 'dev-bad':
+                raise RuntimeError('base indisponible')
+            return real_ingest(user, bracelet, device_id, readings, **kwargs)
+
+        with mock.patch.object(ingest_queue, 'ingest_ubidots_readings', side_effect=failing_ingest):
+            stats = drain_queue()
+            self.assertEqual(stats, {'processed': 6, 'created': 3, 'failed': 0, 'retried': 3})
+            self.assertEqual(SensorData.objects.filter(ubidots_device_id='dev-abc').count(), 3)
+            pending = IngestQueueItem.objects.filter(status='PENDING')
+            self.assertEqual(pending.count(), 3)
+            self.assertTrue(all(item.attempts == 1 and 'base indisponible' in item.error for item in pending))
+
+            for _ in range(MAX_ATTEMPTS - 1):
+                drain_queue()
+
+        self.assertEqual(drain_queue()['processed'], 0)
+        self.assertEqual(IngestQueueItem.objects.filter(status='FAILED', attempts=MAX_ATTEMPTS).count(), 3)
+
+    @override_settings(RESOLVER_CACHE_TTL=300)
+    def test_webhook_single_reading_query_budget(self):
+        """Lecture unique par webhook (état chaud, cache de résolution partagé): budget de requêtes fixe"""
+        # Même heure et même jour pour toutes les lectures: tranches de rollup déjà créées
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+        self.base_ms = int(hour.timestamp() * 1000)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.webhook_url, self._payload(0), format='json')
+
+        # savepoint, état glissant (select_for_update + update), insert, rollups (select + update),
+        # dernier état, bracelet (last_sync + is_connected en une écriture), release
+        with self.assertNumQueries(9):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.webhook_url, self._payload(1), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        bracelet = BraceletDevice.objects.get(device_id='dev-abc')
+        self.assertTrue(bracelet.is_connected)
+        self.assertIsNotNone(bracelet.last_sync)
+
+    def test_lean_ingest_accepts_arrays_and_is_idempotent(self):
+        """ubidots/ingest/ accepte un tableau et ignore les rejeux"""
+        url = '/api/v1/sensors/ubidots/ingest/'
+        payloads = [self._payload(i) for i in range(5)]
+        payloads.append({'device_id': 'dev-abc'})
+
+        response = self.client.post(url, payloads, format='json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['created'], 5)
+        self.assertEqual(body['errors'][0]['index'], 5)
+
+        # Rejeu: écarté par le cache sans insertion
+        response = self.client.post(url, payloads[0], format='json')
+        self.assertEqual(response.json()['duplicates'], 1)
+
+        # Rejeu après perte du cache: écarté par la contrainte en base
+        cache.clear()
+        response = self.client.post(url, payloads[:2], format='json')
+        self.assertEqual(response.json(), {'status': 'success', 'created': 0, 'duplicates': 2, 'errors': []})
+        self.assertEqual(SensorData.objects.count(), 5)
+
+    def test_lean_ingest_honours_idempotency_key(self):
+        """Une requête rejouée avec la même Idempotency-Key n'est pas retraitée"""
+        url = '/api/v1/sensors/ubidots/ingest/'
+        first = self.client.post(url, [self._payload(0)], format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post(url, [self._payload(1)], format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.json()['status'], 'duplicate')
+        self.assertEqual(SensorData.objects.count(), 1)
+
+        # Même clé envoyée par un autre device: lot distinct, traité
+        other = self.client.post(url, [self._payload(0, device_id='dev-other')], format='json',
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(other.status_code, 201)
+        self.assertEqual(SensorData.objects.count(), 2)
+
+    def test_lean_ingest_rejects_non_string_identifiers(self):
+        """device_id / user_email non chaînes: erreur par ligne, le reste du lot est inséré"""
+        url = '/api/v1/sensors/ubidots/ingest/'
+        bad_device = self._payload(1)
+        bad_device['device_id'] = 12345
+        bad_email = self._payload(2)
+        bad_email['user_email'] = ['test@example.com']
+        empty_device = self._payload(3, device_id='  ')
+
+        response = self.client.post(url, [self._payload(0), bad_device, bad_email, empty_device], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['created'], 1)
+        self.assertEqual([error['index'] for error in body['errors']], [1, 2, 3])
+        self.assertIn('device_id', body['errors'][0]['error'])
+        self.assertIn('user_email', body['errors'][1]['error'])
+
+    def test_lean_ingest_is_served_without_middlewares(self):
+        """ubidots/ingest/ passe par le handler sans middlewares (ASGI et WSGI); le reste garde la pile"""
+        from respira_project.asgi import application as asgi_application
+        from respira_project.wsgi import application as wsgi_application
+
+        async def call(path, body):
+            communicator = ApplicationCommunicator(asgi_application, {
+                'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+                'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+            })
+            await communicator.send_input({'type': 'http.request', 'body': body})
+            start = await communicator.receive_output(5)
+            await communicator.receive_output(5)
+            return start['status'], {name.lower() for name, _ in start['headers']}
+
+        # ASGI (une connexion par requête): chemins sans accès base
+        lean_status, lean_headers = async_to_sync(call)('/api/v1/sensors/ubidots/ingest/', b'{')
+        _, full_headers = async_to_sync(call)('/api/v1/sensors/', b'')
+        self.assertEqual(lean_status, 400)
+        self.assertNotIn(b'x-frame-options', lean_headers)
+        self.assertIn(b'x-frame-options', full_headers)
+
+        # WSGI (même thread que le test): ingestion réelle par l'URLconf dédiée
+        environ = RequestFactory().generic(
+            'POST', '/api/v1/sensors/ubidots/ingest/', json.dumps([self._payload(0)]),
+            content_type='application/json'
+        ).environ
+        started = []
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            wsgi_application(environ, lambda status, headers: started.append((status, dict(headers))))
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        status, headers = started[0]
+        self.assertTrue(status.startswith('201'))
+        self.assertNotIn('X-Frame-Options', headers)
+        self.assertEqual(SensorData.objects.count(), 1)
+
+    def test_webhook_concurrent_duplicate_returns_existing_row(self):
+        """Livraison concurrente (contrôle d'existence dépassé): pas de 500, la lecture existante est renvoyée"""
+        payload = self._payload(0)
+        first = self.client.post(self.webhook_url, payload, format='json')
+        calls = []
+
+        def racing(*args):
+            # Premier contrôle: l'autre livraison n'est pas encore visible
+            calls.append(args)
+            return set() if len(calls) == 1 else existing_ubidots_timestamps(*args)
+
+        with mock.patch('apps.sensors.ingest_service.existing_ubidots_timestamps', side_effect=racing):
+            response = self.client.post(self.webhook_url, payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'duplicate')
+        self.assertEqual(response.data['sensor_data_id'], first.data['sensor_data_id'])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(SensorData.objects.count(), 1)
+
+    def test_webhook_rejects_out_of_range_values(self):
+        """Le webhook applique les mêmes plages que l'API"""
+        payload = self._payload()
+        payload['data']['spo2'] = 20
+
+        response = self.client.post(self.webhook_url, payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('SpO2 invalide', response.data['error'])
+        self.assertFalse(SensorData.objects.exists())
+
+
+class RiskAlertStateTestCase(APITestCase):
+    """Tests du compteur d'alertes non lues et des actions en lot"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        start = timezone.now() - timedelta(days=1)
+        # Lectures espacées de plus que la carence: une alerte chacune
+        ingest_readings(self.user, bracelet, [
+            {'timestamp': start + timedelta(hours=i), 'spo2': 85} for i in range(5)
+        ])
+        self.alert_ids = list(RiskAlert.objects.values_list('id', flat=True))
+
+    def test_unread_count_is_cached_and_kept_in_sync(self):
+        """Le badge est servi par le cache et suit l'ingestion et la lecture"""
+        url = '/api/v1/sensors/alerts/unread_count/'
+        self.assertEqual(self.client.get(url).data['unread_count'], 5)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if 'sensors_riskalert' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/sensors/alerts/mark_read/', {'ids': self.alert_ids[:3]}, format='json')
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(self.client.get(url).data['unread_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/sensors/alerts/{self.alert_ids[3]}/mark_read/')
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+    def test_bulk_actions_run_single_update(self):
+        """mark_read et dismiss en lot n'émettent qu'un UPDATE"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/v1/sensors/alerts/dismiss/', {'all': True}, format='json')
+
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "sensors_riskalert"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(RiskAlert.objects.filter(is_dismissed=True, is_read=True).count(), 5)
+        self.assertEqual(self.client.get('/api/v1/sensors/alerts/unread_count/').data['unread_count'], 0)
+
+    def test_mark_read_unknown_alert_is_404(self):
+        """Alerte inexistante ou identifiant non numérique: 404"""
+        for pk in (max(self.alert_ids) + 1, 'abc'):
+            response = self.client.post(f'/api/v1/sensors/alerts/{pk}/mark_read/')
+            self.assertEqual(response.status_code, 404, pk)
+
+    def test_bulk_action_requires_ids(self):
+        """Sans 'ids' ni 'all', la requête est refusée"""
+        response = self.client.post('/api/v1/sensors/alerts/mark_read/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unread_is_paginated(self):
+        """La liste des non lues est paginée"""
+        response = self.client.get('/api/v1/sensors/alerts/unread/', {'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class RecordingSender:
+    """Transport de test qui conserve les envois (par instance)"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, notifications):
+        self.sent += [notification.id for notification in notifications]
+        return {}
+
+
+class FailingSender:
+    """Transport de test toujours en échec"""
+
+    def send_batch(self, notifications):
+        return {notification.id: 'service indisponible' for notification in notifications}
+
+
+class NotificationOutboxTestCase(APITestCase):
+    """Tests de l'outbox des notifications push"""
+
+    def setUp(self):
+        cache.clear()
+        notifications._senders.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+
+    def _ingest_critical(self):
+        start = timezone.now() - timedelta(minutes=5)
+        ingest_readings(self.user, self.bracelet, [
+            {'timestamp': start, 'spo2': 85, 'smoke_detected': True},
+            {'timestamp': start + timedelta(minutes=1), 'spo2': 97, 'respiratory_rate': 35},
+        ])
+
+    def test_critical_alerts_fill_outbox(self):
+        """Seules les alertes critiques sont ajoutées à l'outbox, liées à leur alerte"""
+        self._ingest_critical()
+
+        outbox = NotificationOutbox.objects.all()
+        self.assertEqual(
+            sorted(outbox.values_list('payload__alert_type', flat=True)), ['LOW_SPO2', 'SMOKE_DETECTED']
+        )
+        self.assertTrue(all(n.alert_id for n in outbox))
+
+    def test_dispatch_sends_in_batches(self):
+        """Le dispatcher envoie les notifications dues et enregistre leur état"""
+        self._ingest_critical()
+
+        with self.settings(NOTIFICATION_SENDERS={'push': 'apps.sensors.tests.RecordingSender'}):
+            stats = notifications.dispatch_pending()
+            self.assertEqual(len(notifications.get_sender('push').sent), 2)
+            self.assertEqual(notifications.dispatch_pending()['sent'], 0)
+
+        self.assertEqual(stats, {'sent': 2, 'retried': 0, 'failed': 0, 'skipped': 0})
+        self.assertFalse(NotificationOutbox.objects.exclude(status='SENT').exists())
+
+    def test_missing_sender_keeps_notifications_pending(self):
+        """Sans transport configuré rien n'est marqué envoyé et le dispatcher refuse de démarrer"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        self._ingest_critical()
+
+        with self.settings(NOTIFICATION_SENDERS={'push': ''}):
+            # Déjà en file (transport retiré après coup): conservées
+            self.assertEqual(notifications.dispatch_pending(),
+                             {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 2})
+            with self.assertRaises(CommandError):
+                call_command('dispatch_notifications')
+
+        self.assertEqual(NotificationOutbox.objects.filter(status='PENDING', attempts=0).count(), 2)
+
+    def test_nothing_is_queued_without_sender(self):
+        """Sans transport configuré, les alertes critiques ne remplissent pas l'outbox"""
+        with self.settings(NOTIFICATION_SENDERS={'push': ''}):
+            self._ingest_critical()
+
+        self.assertTrue(RiskAlert.objects.filter(severity='CRITICAL').exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        """Un échec reporte l'envoi, puis abandonne après le nombre max de tentatives"""
+        self._ingest_critical()
+
+        with self.settings(NOTIFICATION_SENDERS={'push': 'apps.sensors.tests.FailingSender'},
+                           NOTIFICATION_MAX_ATTEMPTS=2):
+            self.assertEqual(notifications.dispatch_pending()['retried'], 2)
+            # Pas encore dû: rien n'est renvoyé
+            self.assertEqual(notifications.dispatch_pending()['retried'], 0)
+            notification = NotificationOutbox.objects.first()
+            self.assertGreater(notification.next_attempt_at, timezone.now())
+
+            NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(notifications.dispatch_pending()['failed'], 2)
+
+        self.assertEqual(NotificationOutbox.objects.get(pk=notification.pk).last_error, 'service indisponible')
+
+
+class RealtimeTestCase(APITestCase):
+    """Tests du canal temps réel (SSE)"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+
+    def test_in_process_broker_fans_out_across_threads(self):
+        """Un message publié depuis un autre thread parvient à chaque abonné de l'utilisateur"""
+        broker = realtime.InProcessBroker()
+
+        async def scenario():
+            first = broker.subscribe(self.user.id).__aiter__()
+            second = broker.subscribe(self.user.id).__aiter__()
+            other = broker.subscribe(self.user.id + 1).__aiter__()
+            pending = [asyncio.ensure_future(it.__anext__()) for it in (first, second, other)]
+            await asyncio.sleep(0)
+            await asyncio.to_thread(broker.publish, self.user.id, 'hello')
+            received = await asyncio.wait_for(asyncio.gather(*pending[:2]), timeout=1)
+            self.assertFalse(pending[2].done())
+            pending[2].cancel()
+            for it in (first, second):
+                await it.aclose()
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), ['hello', 'hello'])
+        self.assertEqual(broker._subscribers, {})
+
+    def test_ingest_publishes_after_commit(self):
+        """L'ingestion publie la dernière lecture et les alertes une fois la transaction validée"""
+        published = []
+        broker = mock.Mock(publish=lambda user_id, message: published.append(json.loads(message)))
+        start = timezone.now() - timedelta(minutes=5)
+
+        with mock.patch.object(realtime, 'get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                ingest_readings(self.user, self.bracelet, [
+                    {'timestamp': start + timedelta(minutes=i), 'spo2': 85 if i == 0 else 97}
+                    for i in range(3)
+                ])
+                self.assertEqual(published, [])
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual([event['event'] for event in published], ['reading', 'alert'])
+        self.assertEqual(published[0]['data']['spo2'], 97)
+        self.assertEqual(published[1]['data']['alert_type'], 'LOW_SPO2')
+
+    def test_event_stream_requires_jwt(self):
+        """Le flux SSE refuse les clients non authentifiés"""
+        response = self.client.get('/api/v1/sensors/events/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_event_stream_rejects_jwt_in_query_string(self):
+        """Le JWT n'est plus accepté dans l'URL (logs d'accès)"""
+        token = str(AccessToken.for_user(self.user))
+        request = RequestFactory().get('/api/v1/sensors/events/', {'token': token})
+        response = async_to_sync(realtime_views.sensor_events)(request)
+        self.assertEqual(response.status_code, 401)
+
+    def test_event_ticket_is_single_use(self):
+        """Le ticket SSE n'ouvre qu'un seul flux"""
+        self.client.force_authenticate(user=self.user)
+        ticket = self.client.post('/api/v1/sensors/events/ticket/').data['ticket']
+
+        self.assertEqual(realtime_views._authenticate(RequestFactory().get('/', {'ticket': ticket})), self.user)
+        self.assertIsNone(realtime_views._authenticate(RequestFactory().get('/', {'ticket': ticket})))
+        self.assertIsNone(realtime_views._authenticate(RequestFactory().get('/', {'ticket': 'inconnu'})))
+
+    def test_event_stream_delivers_messages(self):
+        """Un client authentifié reçoit les messages publiés pour lui"""
+        self.client.force_authenticate(user=self.user)
+        ticket = self.client.post('/api/v1/sensors/events/ticket/').data['ticket']
+        request = RequestFactory().get('/api/v1/sensors/events/', {'ticket': ticket})
+        response = async_to_sync(realtime_views.sensor_events)(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def read():
+            stream = response.streaming_content.__aiter__()
+            connected = await stream.__anext__()
+            pending = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.05)
+            realtime.get_broker().publish(self.user.id, '{"event": "alert"}')
+            message = await asyncio.wait_for(pending, timeout=1)
+            await stream.aclose()
+            return connected, message
+
+        connected, message = asyncio.run(read())
+        self.assertEqual(connected, b': connected\n\n')
+        self.assertEqual(message, b'data: {"event": "alert"}\n\n')
+
+
+class LatestSensorStateTestCase(APITestCase):
+    """Tests du dernier état connu"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        self.now = timezone.now()
+
+    def _ingest(self, minutes_ago, **fields):
+        return ingest_readings(self.user, self.bracelet, [
+            {'timestamp': self.now - timedelta(minutes=minutes_ago), 'spo2': 97, **fields}
+        ])[0]
+
+    def test_current_state_endpoints_skip_sensor_data(self):
+        """latest/, data/latest, data/risk_score et health_summary lisent l'état courant"""
+        self._ingest(10, spo2=94)
+        newest = self._ingest(1, spo2=96, heart_rate=70)
+
+        for url in ('/api/v1/sensors/latest/', '/api/v1/sensors/data/latest/',
+                    '/api/v1/sensors/data/risk_score/'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertFalse(
+                [q for q in queries if 'FROM "sensors_sensordata"' in q['sql']], url
+            )
+
+        self.assertEqual(self.client.get('/api/v1/sensors/data/latest/').data['id'], newest.id)
+        self.assertEqual(self.client.get('/api/v1/sensors/latest/').data['max30102']['spo2'], 96)
+
+        with mock.patch('Security.core.security.APISecurityValidator.validate_request_frequency'):
+            summary = self.client.get('/api/v1/sensors/data/health_summary/')
+        self.assertEqual(summary.data['latest_data']['id'], newest.id)
+
+    def test_older_batch_does_not_replace_state(self):
+        """Un lot hors-ligne plus ancien ne remplace pas l'état courant"""
+        newest = self._ingest(1)
+        self._ingest(60, spo2=90)
+
+        state = LatestSensorState.objects.get(user=self.user)
+        self.assertEqual(state.sensor_data_id, newest.id)
+        self.assertEqual(state.spo2, 97)
+
+    def test_falls_back_to_sensor_data(self):
+        """Sans état enregistré, la dernière lecture SensorData est utilisée"""
+        reading = SensorData.objects.create(
+            user=self.user, bracelet=self.bracelet, timestamp=self.now, spo2=95
+        )
+
+        response = self.client.get('/api/v1/sensors/data/risk_score/')
+
+        self.assertEqual(response.data['risk_score'], reading.risk_score)
+
+    def test_deleted_reading_is_replaced_in_state(self):
+        """Supprimer la dernière lecture via l'API remet l'état sur la précédente"""
+        previous = self._ingest(10, spo2=94)
+        newest = self._ingest(1, spo2=96)
+
+        self.client.delete(f'/api/v1/sensors/data/{newest.pk}/')
+
+        self.assertEqual(self.client.get('/api/v1/sensors/data/latest/').data['id'], previous.id)
+        state = LatestSensorState.objects.get(user=self.user)
+        self.assertEqual(state.spo2, 94)
+
+    def test_updated_reading_refreshes_state(self):
+        """Modifier la dernière lecture via l'API met l'état à jour"""
+        newest = self._ingest(1, spo2=96)
+
+        response = self.client.patch(f'/api/v1/sensors/data/{newest.pk}/', {'spo2': 91}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LatestSensorState.objects.get(user=self.user).spo2, 91)
+        self.assertEqual(self.client.get('/api/v1/sensors/latest/').data['max30102']['spo2'], 91)
+
+
+
+class DeviceStateBufferTestCase(APITestCase):
+    """Tests des écritures différées de l'état des bracelets"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=False)
+        device_state.flush()
+
+    def test_writes_are_coalesced(self):
+        """Plusieurs lectures rapprochées ne produisent qu'une écriture du bracelet"""
+        start = timezone.now() - timedelta(minutes=10)
+        with self.settings(DEVICE_STATE_FLUSH_SECONDS=60):
+            with CaptureQueriesContext(connection) as queries:
+                for i in range(5):
+                    ingest_readings(self.user, self.bracelet, [{'timestamp': start + timedelta(minutes=i), 'spo2': 97}])
+                device_state.record(self.bracelet, is_connected=True)
+
+            self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "sensors_braceletdevice"')])
+            self.assertIsNone(BraceletDevice.objects.get(pk=self.bracelet.pk).last_sync)
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(device_state.flush(), 1)
+            self.assertEqual(len(queries), 1)
+
+        stored = BraceletDevice.objects.get(pk=self.bracelet.pk)
+        self.assertTrue(stored.is_connected)
+        self.assertEqual(stored.last_sync, self.bracelet.last_sync)
+
+    def test_last_sync_never_moves_back(self):
+        """Un état plus ancien enregistré ensuite ne fait pas reculer last_sync"""
+        now = timezone.now()
+        with self.settings(DEVICE_STATE_FLUSH_SECONDS=60):
+            device_state.record(self.bracelet, last_sync=now)
+            device_state.record(self.bracelet, last_sync=now - timedelta(minutes=5), battery_level=80)
+            device_state.flush()
+
+        stored = BraceletDevice.objects.get(pk=self.bracelet.pk)
+        self.assertEqual(stored.last_sync, now)
+        self.assertEqual(stored.battery_level, 80)
+
+    def test_due_flush_runs_after_commit(self):
+        """Écriture groupée due: faite après le commit de l'ingestion, pas dans sa transaction"""
+        other = BraceletDevice.objects.create(
+            user=User.objects.create_user(username='other', email='other@example.com', password='x'),
+            device_id='b2', is_connected=False,
+        )
+        with self.settings(DEVICE_STATE_FLUSH_SECONDS=60):
+            device_state.record(other, is_connected=True)
+            device_state.buffer._last_flush -= 120
+            with self.captureOnCommitCallbacks() as callbacks:
+                with CaptureQueriesContext(connection) as queries:
+                    ingest_readings(self.user, self.bracelet, [{'timestamp': timezone.now(), 'spo2': 97}])
+            self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "sensors_braceletdevice"')])
+
+            for callback in callbacks:
+                callback()
+
+        self.assertTrue(BraceletDevice.objects.get(pk=other.pk).is_connected)
+        self.assertIsNotNone(BraceletDevice.objects.get(pk=self.bracelet.pk).last_sync)
+
+    def test_failed_write_keeps_pending_state(self):
+        """Une écriture en échec ne perd pas l'état: il est écrit au flush suivant"""
+        with self.settings(DEVICE_STATE_FLUSH_SECONDS=60):
+            device_state.record(self.bracelet, is_connected=True)
+            with mock.patch.object(BraceletDevice.objects, 'bulk_update', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    device_state.flush()
+            self.assertEqual(device_state.flush(), 1)
+
+        self.assertTrue(BraceletDevice.objects.get(pk=self.bracelet.pk).is_connected)
+
+    @override_settings(RESOLVER_CACHE_TTL=3600)
+    def test_disconnect_invalidates_default_bracelet(self):
+        """Un bracelet déconnecté par écriture groupée n'est plus servi comme bracelet par défaut"""
+        BraceletDevice.objects.filter(pk=self.bracelet.pk).update(is_connected=True)
+        self.assertEqual(resolver.default_bracelet(self.user).pk, self.bracelet.pk)
+
+        with self.settings(DEVICE_STATE_FLUSH_SECONDS=60):
+            device_state.record(self.bracelet, is_connected=False)
+            device_state.flush()
+
+        self.assertIsNone(resolver.default_bracelet(self.user))
+
+
+@override_settings(RESOLVER_CACHE_TTL=3600)
+class IngestResolverTestCase(APITestCase):
+    """Tests du cache de résolution device/email -> utilisateur"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.base_ms = int(timezone.now().timestamp() * 1000)
+
+    def _post(self, offset, email='test@example.com', device_id='dev-abc'):
+        return self.client.post('/api/v1/sensors/ubidots/webhook/', {
+            'device_id': device_id,
+            'user_email': email,
+            'timestamp': self.base_ms + offset * 1000,
+            'data': {'spo2': 97},
+        }, format='json')
+
+    def _lookup_queries(self, queries):
+        return [
+            q for q in queries
+            if q['sql'].startswith('SELECT') and ('FROM "users_user"' in q['sql'] or 'FROM "sensors_braceletdevice"' in q['sql'])
+        ]
+
+    def test_webhook_resolves_from_cache(self):
+        """Après la première livraison, utilisateur et bracelet ne sont plus requêtés"""
+        # Commit exécuté: l'invalidation post_save de la création ne doit pas effacer la mise en cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._post(0).status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._post(1).status_code, 201)
+
+        self.assertEqual(self._lookup_queries(queries), [])
+        self.assertEqual(BraceletDevice.objects.filter(device_id='dev-abc').count(), 1)
+
+    def test_reassigned_device_is_invalidated(self):
+        """Un device réattribué n'est plus résolu vers son ancien propriétaire"""
+        self._post(0)
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        bracelet = BraceletDevice.objects.get(device_id='dev-abc')
+        bracelet.user = other
+        bracelet.save()
+
+        self.assertEqual(self._post(1).status_code, 409)
+        self.assertEqual(self._post(2, email='other@example.com').status_code, 201)
+
+    def test_invalidated_again_on_commit(self):
+        """Une résolution concurrente avant le commit ne laisse pas l'ancien propriétaire en cache"""
+        self._post(0)
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        bracelet = BraceletDevice.objects.get(device_id='dev-abc')
+        with self.captureOnCommitCallbacks(execute=True):
+            bracelet.user = other
+            bracelet.save()
+            # Lecture d'un autre process avant le commit: ancienne valeur remise en cache
+            cache.set(resolver.device_key('dev-abc'), (self.user.pk, bracelet.pk))
+
+        self.assertEqual(self._post(1).status_code, 409)
+
+    @override_settings(RESOLVER_CACHE_TTL=0)
+    def test_disabled_without_shared_cache(self):
+        """Sans cache partagé, la résolution lit toujours la base"""
+        self._post(0)
+        self.assertIsNone(cache.get(resolver.device_key('dev-abc')))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._post(1).status_code, 201)
+        self.assertTrue(self._lookup_queries(queries))
+
+    def test_changed_email_is_invalidated(self):
+        """Un email modifié ne résout plus l'ancien compte"""
+        self._post(0)
+        self.user.email = 'new@example.com'
+        self.user.save()
+
+        self.assertEqual(self._post(1).status_code, 404)
+        self.assertEqual(self._post(2, email='new@example.com').status_code, 201)
+
+    def test_default_bracelet_is_cached(self):
+        """La création via l'API ne recherche plus le bracelet par défaut à chaque lecture"""
+        self.client.force_authenticate(user=self.user)
+        url = '/api/v1/sensors/data/bulk/'
+        reading = {'timestamp': timezone.now().isoformat(), 'spo2': 97}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, [reading], format='json')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, [{**reading, 'timestamp': (timezone.now() - timedelta(minutes=1)).isoformat()}],
+                             format='json')
+
+        self.assertFalse([q for q in self._lookup_queries(queries) if 'sensors_braceletdevice' in q['sql']])
+
+
+class RollingWindowTestCase(SimpleTestCase):
+    """Tests de la fenêtre glissante incrémentale"""
+
+    def test_matches_full_rescan(self):
+        """Moyenne, min, max et écart-type identiques à un recalcul complet de la fenêtre"""
+        start = timezone.now()
+        window = rolling_analytics.RollingWindow(600)
+        history = []
+        for i, value in enumerate([97, 92, None, 99, 88, 95, 96, 90, 98, 94] * 3):
+            timestamp = start + timedelta(seconds=90 * i)
+            window.push(timestamp, value)
+            if value is not None:
+                history.append((timestamp, value))
+            expected = [v for t, v in history if t > timestamp - timedelta(seconds=600)]
+
+            self.assertEqual(window.count, len(expected))
+            self.assertEqual(window.min, min(expected))
+            self.assertEqual(window.max, max(expected))
+            self.assertAlmostEqual(window.mean, sum(expected) / len(expected))
+            if len(expected) > 1:
+                mean = sum(expected) / len(expected)
+                variance = sum((v - mean) ** 2 for v in expected) / len(expected)
+                self.assertAlmostEqual(window.std, variance ** 0.5)
+
+
+class RollingAnalyticsTestCase(APITestCase):
+    """Tests des analyses glissantes alimentées à l'ingestion"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        self.start = timezone.now() - timedelta(hours=2)
+
+    def _ingest(self, minutes, spo2, aqi=None):
+        return ingest_readings(self.user, self.bracelet, [
+            {'timestamp': self.start + timedelta(minutes=minute), 'spo2': value, 'aqi': aqi}
+            for minute, value in zip(minutes, spo2)
+        ])
+
+    def test_fields_are_populated(self):
+        """Les lectures et l'instantané SensorAnalytics portent les valeurs glissantes"""
+        self._ingest([0, 30, 50], [97, 91, 95], aqi=80)
+        instances = self._ingest([70], [96], aqi=120)
+
+        # Fenêtre 1h à t=70: lectures de t=30, 50 et 70
+        self.assertEqual(instances[0].spo2_variation_1h, 5)
+        self.assertEqual(instances[0].aqi_avg_3h, 90)
+        stored = SensorData.objects.get(pk=instances[0].pk)
+        self.assertEqual(stored.spo2_variation_1h, 5)
+
+        analytics = SensorAnalytics.objects.filter(user=self.user).order_by('timestamp')
+        self.assertEqual(analytics.count(), 2)
+        latest = analytics.last()
+        self.assertEqual(latest.spo2_min_1h, 91)
+        self.assertEqual(latest.spo2_avg_1h, 94)
+        self.assertIsNotNone(latest.respiratory_health_score)
+        self.assertIsNotNone(latest.environmental_risk_score)
+
+    def test_steady_state_does_not_scan_window(self):
+        """Une fois l'état construit, une lecture ne relit pas l'historique"""
+        self._ingest([0, 1, 2], [97, 96, 95])
+
+        with CaptureQueriesContext(connection) as queries:
+            self._ingest([3], [94])
+
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'sensors_sensordata' in q['sql']])
+
+    def test_state_is_rebuilt_from_sensor_data(self):
+        """Sans état persisté (première ingestion), les fenêtres sont rechargées depuis la base"""
+        self._ingest([0, 30, 50], [97, 91, 95])
+        RollingWindowState.objects.filter(user=self.user).delete()
+
+        instances = self._ingest([70], [96])
+
+        self.assertEqual(instances[0].spo2_variation_1h, 5)
+
+    def test_late_reading_is_merged(self):
+        """Une lecture en retard rejoint sa tranche sans relire l'historique"""
+        self._ingest([0, 50], [97, 95])
+
+        with CaptureQueriesContext(connection) as queries:
+            instances = self._ingest([40], [90])
+
+        self.assertEqual(instances[0].spo2_variation_1h, 7)
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'sensors_sensordata' in q['sql']])
+
+    def test_rolled_back_batch_keeps_state(self):
+        """Un lot annulé ne laisse pas ses lectures dans les fenêtres persistées"""
+        self._ingest([0], [97])
+
+        with mock.patch.object(rollups, 'update_rollups', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._ingest([10], [80])
+        instances = self._ingest([20], [95])
+
+        self.assertEqual(instances[0].spo2_variation_1h, 2)
+
+
+class SensorRollupTestCase(APITestCase):
+    """Tests des tranches pré-agrégées et des statistiques qui les lisent"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        now = timezone.now()
+        # Lectures toutes les 7h sur 35 jours (dont certaines hors période)
+        readings = [
+            {
+                'timestamp': now - timedelta(hours=7 * i, minutes=i % 50),
+                'spo2': 88 + i % 12,
+                'heart_rate': 60 + i % 40,
+                'aqi': 20 + (i * 13) % 200 if i % 3 else None,
+                'temperature': 25.0 if i % 2 else None,
+            }
+            for i in range(120)
+        ]
+        ingest_readings(self.user, self.bracelet, readings)
+
+    def _expected(self, hours):
+        queryset = SensorData.objects.filter(user=self.user, timestamp__gte=timezone.now() - timedelta(hours=hours))
+        stats = queryset.aggregate(avg_spo2=Avg('spo2'), min_spo2=Min('spo2'), max_aqi=Max('aqi'))
+        stats['total'] = queryset.count()
+        return stats
+
+    def test_stats_match_raw_aggregates(self):
+        """Les statistiques lues sur les tranches sont identiques au calcul sur les lignes brutes"""
+        response = self.client.get('/api/v1/sensors/data/stats/', {'period': '30d'})
+        expected = self._expected(720)
+
+        self.assertEqual(response.data['total_readings'], expected['total'])
+        self.assertAlmostEqual(response.data['stats']['avg_spo2'], expected['avg_spo2'])
+        self.assertEqual(response.data['stats']['min_spo2'], expected['min_spo2'])
+        self.assertEqual(response.data['stats']['max_aqi'], expected['max_aqi'])
+        self.assertEqual(
+            sum(row['count'] for row in response.data['risk_distribution']), expected['total']
+        )
+
+    def test_plan_uses_coarsest_resolution(self):
+        """30 jours: jours entiers au centre, heures et minutes aux bords seulement"""
+        now = timezone.now()
+        segments = rollups.plan(now - timedelta(days=30), now)
+        days = [segment for segment in segments if segment[0] == '1d']
+
+        self.assertEqual(len(days), 1)
+        self.assertGreaterEqual((days[0][2] - days[0][1]).days, 28)
+        for resolution, start, end in segments:
+            if resolution in ('1m', None) and end is not None:
+                self.assertLessEqual(end - start, timedelta(hours=1))
+        self.assertIsNone(segments[-1][2])
+
+    def test_sensor_stats_counts(self):
+        """sensor_stats compte les lectures par capteur depuis les tranches"""
+        response = self.client.get('/api/v1/sensors/stats/', {'hours': 240})
+        queryset = SensorData.objects.filter(user=self.user, timestamp__gte=timezone.now() - timedelta(hours=240))
+
+        self.assertEqual(response.data['total_records'], queryset.count())
+        self.assertEqual(response.data['dht11_count'], queryset.filter(temperature__isnull=False).count())
+
+    def test_rebuild_matches_incremental(self):
+        """La compaction recalcule exactement les tranches maintenues à l'ingestion"""
+        fields = ('user_id', 'resolution', 'bucket') + rollups.VALUE_FIELDS
+        incremental = set(SensorRollup.objects.values_list(*fields))
+
+        rollups.rebuild()
+
+        self.assertEqual(set(SensorRollup.objects.values_list(*fields)), incremental)
+
+    def test_compact_rewrites_closed_buckets_only(self):
+        """La compaction corrige les tranches closes et laisse les tranches ouvertes à l'ingestion"""
+        now = timezone.now()
+        ingest_readings(self.user, self.bracelet, [{'timestamp': now, 'spo2': 95}])
+        open_hour = rollups.bucket_start(now, '1h')
+        closed = SensorRollup.objects.filter(resolution='1h', bucket__lt=open_hour).latest('bucket')
+        yesterday = rollups.bucket_start(now, '1d') - timedelta(days=1)
+        SensorRollup.objects.filter(pk=closed.pk).update(count=999)
+        SensorRollup.objects.filter(resolution='1d', bucket=yesterday).update(count=999)
+        SensorRollup.objects.filter(resolution='1h', bucket=open_hour).update(count=999)
+
+        written, next_since = rollups.compact(now - timedelta(hours=48), now=now)
+
+        self.assertGreater(written, 0)
+        self.assertEqual(next_since, open_hour)
+        self.assertEqual(SensorRollup.objects.get(resolution='1h', bucket=closed.bucket).count, closed.count)
+        day = SensorRollup.objects.get(resolution='1d', bucket=yesterday)
+        self.assertEqual(day.count, SensorData.objects.filter(
+            user=self.user, timestamp__gte=yesterday, timestamp__lt=yesterday + timedelta(days=1)
+        ).count())
+        self.assertEqual(SensorRollup.objects.get(resolution='1h', bucket=open_hour).count, 999)
+
+    def test_deleted_reading_is_removed_from_rollups(self):
+        """Supprimer une lecture via l'API met ses tranches à jour"""
+        reading = SensorData.objects.filter(user=self.user).first()
+        self.client.delete(f'/api/v1/sensors/data/{reading.pk}/')
+
+        response = self.client.get('/api/v1/sensors/data/stats/', {'period': '30d'})
+
+        self.assertEqual(response.data['total_readings'], self._expected(720)['total'])
+
+
+class SensorHistoryTestCase(APITestCase):
+    """Tests de l'historique agrégé data/history/"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        self.start = (timezone.now() - timedelta(days=2)).replace(minute=0, second=0, microsecond=0)
+        self.readings = [
+            {'timestamp': self.start + timedelta(minutes=7 * i), 'spo2': 90 + i % 9, 'temperature': 20.0 + i % 5}
+            for i in range(60)
+        ]
+        ingest_readings(self.user, bracelet, self.readings)
+        self.url = '/api/v1/sensors/data/history/'
+
+    def _params(self, **params):
+        return {'from': self.start.isoformat(), 'to': (self.start + timedelta(hours=7)).isoformat(), **params}
+
+    def _expected(self, field, size):
+        buckets = {}
+        for reading in self.readings:
+            buckets.setdefault(history.align(reading['timestamp'], size), []).append(reading[field])
+        return buckets
+
+    def test_rollup_series_in_one_query(self):
+        """Séries horaires lues sur les tranches, en colonnes, en une requête"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, self._params(bucket='1h', metrics='spo2', agg='avg,min,max'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['source'], 'rollup_1h')
+        self.assertEqual(len(queries), 1)
+        expected = self._expected('spo2', timedelta(hours=1))
+        self.assertEqual(response.data['timestamps'], sorted(expected))
+        self.assertEqual(response.data['count'], [len(expected[t]) for t in sorted(expected)])
+        series = response.data['series']['spo2']
+        self.assertEqual(series['min'], [min(expected[t]) for t in sorted(expected)])
+        for value, t in zip(series['avg'], sorted(expected)):
+            self.assertAlmostEqual(value, sum(expected[t]) / len(expected[t]), places=2)
+
+    def test_raw_series_for_metrics_without_rollups(self):
+        """Les métriques absentes des tranches sont agrégées sur SensorData, tranches de 15 minutes"""
+        response = self.client.get(self.url, self._params(bucket='15m', metrics='temperature', agg='max,count'))
+
+        self.assertEqual(response.data['source'], 'raw')
+        expected = self._expected('temperature', timedelta(minutes=15))
+        self.assertEqual(response.data['series']['temperature']['max'], [max(expected[t]) for t in sorted(expected)])
+        self.assertEqual(response.data['series']['temperature']['count'], [len(expected[t]) for t in sorted(expected)])
+
+    def test_invalid_parameters(self):
+        """Paramètres invalides: 400"""
+        for params in ({'bucket': '7m'}, {'metrics': 'password'}, {'agg': 'median'}, {'from': 'hier'}):
+            response = self.client.get(self.url, self._params(**params))
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.url, {'from': '2020-01-01T00:00:00Z', 'bucket': '1m'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CursorPaginationTestCase(APITestCase):
+    """Tests de la pagination par curseur des lectures et alertes"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        start = timezone.now() - timedelta(hours=5)
+        # Horodatages en double: l'ordre (timestamp, id) doit rester stable
+        ingest_readings(self.user, bracelet, [
+            {'timestamp': start + timedelta(minutes=i // 2), 'spo2': 97} for i in range(45)
+        ])
+
+    def _walk(self, url):
+        ids, pages = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            pages.append(queries)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids, pages
+
+    def test_pages_cover_history_without_count_or_offset(self):
+        """Toutes les lectures sont vues une fois, sans COUNT ni OFFSET"""
+        ids, pages = self._walk('/api/v1/sensors/data/?page_size=10')
+
+        expected = list(
+            SensorData.objects.filter(user=self.user).order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        for queries in pages:
+            for query in queries:
+                self.assertNotIn('COUNT(', query['sql'])
+                # OFFSET limité aux doublons d'horodatage à la frontière de page
+                match = re.search(r'OFFSET (\d+)', query['sql'])
+                self.assertLessEqual(int(match.group(1)) if match else 0, 1)
+        self.assertEqual(len({len(queries) for queries in pages}), 1)
+
+    def test_count_is_opt_in(self):
+        """Le total n'est calculé que sur demande"""
+        response = self.client.get('/api/v1/sensors/data/')
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get('/api/v1/sensors/data/', {'count': 'true'})
+        self.assertEqual(response.data['count'], 45)
+
+
+class SensorExportTestCase(APITestCase):
+    """Tests de l'export en flux data/export/"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        self.start = timezone.now() - timedelta(days=3)
+        ingest_readings(self.user, bracelet, [
+            {'timestamp': self.start + timedelta(minutes=10 * i), 'spo2': 85 if i == 5 else 97, 'temperature': 24.5}
+            for i in range(30)
+        ])
+        self.url = '/api/v1/sensors/data/export/'
+
+    def _content(self, response):
+        return b''.join(
+            chunk.encode() if isinstance(chunk, str) else chunk for chunk in response.streaming_content
+        ).decode()
+
+    def test_csv_is_streamed(self):
+        """CSV en flux: en-tête puis une ligne par lecture, lue à la consommation"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'output': 'csv'})
+        self.assertFalse([q for q in queries if 'FROM "sensors_sensordata"' in q['sql']])
+
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        lines = self._content(response).splitlines()
+        self.assertEqual(len(lines), 31)
+        self.assertTrue(lines[0].startswith('id,timestamp,bracelet_id,spo2'))
+        self.assertIn('24.5', lines[1])
+
+    def test_ndjson_range_and_alerts(self):
+        """NDJSON filtré par période, et export des alertes"""
+        response = self.client.get(self.url, {
+            'output': 'ndjson', 'from': (self.start + timedelta(minutes=100)).isoformat(),
+        })
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0]['spo2'], 97)
+
+        response = self.client.get(self.url, {'output': 'ndjson', 'dataset': 'alerts'})
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['alert_type'] for row in rows], ['LOW_SPO2'])
+
+    def test_asgi_export_is_streamed_by_chunks(self):
+        """Sous ASGI, l'export est un flux asynchrone: un bloc lu par morceau envoyé, rien de matérialisé"""
+        token = str(AccessToken.for_user(self.user))
+
+        async def consume():
+            response = await AsyncClient().get(
+                self.url, {'output': 'csv'}, headers={'authorization': f'Bearer {token}'}
+            )
+            self.assertTrue(response.is_async)
+            chunks = response.streaming_content
+            received = [await anext(chunks), await anext(chunks)]
+            # Requêtes du thread de la vue (connexion propre au thread)
+            reads_before_first_block = await sync_to_async(
+                lambda: len(self._export_reads(connection.queries[queries.initial_queries:]))
+            )()
+            received += [chunk async for chunk in chunks]
+            return received, reads_before_first_block
+
+        with mock.patch.object(export, 'EXPORT_CHUNK_SIZE', 10), CaptureQueriesContext(connection) as queries:
+            chunks, reads_before_first_block = async_to_sync(consume)()
+
+        self.assertEqual(reads_before_first_block, 1)
+        self.assertEqual(len(self._export_reads(queries)), 4)  # 3 blocs de 10 + bloc vide final
+        lines = b''.join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in chunks).decode().splitlines()
+        self.assertEqual(len(lines), 31)
+
+    @staticmethod
+    def _export_reads(queries):
+        return [q for q in queries if q['sql'].startswith('SELECT') and 'FROM "sensors_sensordata"' in q['sql']]
+
+    def test_invalid_parameters(self):
+        """Format ou jeu de données inconnu: 400"""
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'dataset': 'users'}).status_code, 400)
+
+    def test_parquet_requires_pyarrow(self):
+        """Parquet: fichier valide avec pyarrow, 400 sinon"""
+        response = self.client.get(self.url, {'output': 'parquet'})
+        if export.pa is None:
+            self.assertEqual(response.status_code, 400)
+            return
+        import io
+        table = export.pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 30)
+
+
+class SensorProjectionTestCase(APITestCase):
+    """Tests des projections ?fields= et des presets capteurs"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        start = timezone.now() - timedelta(hours=2)
+        ingest_readings(self.user, bracelet, [
+            {'timestamp': start + timedelta(minutes=i), 'spo2': 97, 'heart_rate': 70}
+            if i % 2 else {'timestamp': start + timedelta(minutes=i), 'temperature': 22.5, 'humidity': 40}
+            for i in range(10)
+        ])
+
+    def _sensordata_selects(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "sensors_sensordata"' in q['sql']]
+
+    def test_sensor_type_presets(self):
+        """Chaque preset filtre ses lectures avant la limite et ne lit que ses colonnes"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/sensors/data/max30102/', {'limit': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(list(response.data['data'][0]), ['timestamp', 'spo2', 'heart_rate', 'risk_level'])
+        select = self._sensordata_selects(queries)[0]
+        self.assertNotIn('"temperature"', select.split('FROM')[0])
+
+        response = self.client.get('/api/v1/sensors/data/dht11/')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['data'][0]['temperature'], 22.5)
+        self.assertEqual(self.client.get('/api/v1/sensors/data/cjmcu811/').data['count'], 0)
+        self.assertEqual(self.client.get('/api/v1/sensors/data/max30102/', {'fields': 'bogus'}).status_code, 400)
+
+    def test_invalid_sensor_type_returns_400(self):
+        """Type inconnu: 400 avec la liste des types, le détail data/<id>/ reste routé"""
+        response = self.client.get('/api/v1/sensors/data/bogus/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max30102', response.data['valid_types'])
+
+        reading = SensorData.objects.filter(user=self.user).first()
+        self.assertEqual(self.client.get(f'/api/v1/sensors/data/{reading.pk}/').data['id'], reading.pk)
+
+    def test_list_fields_match_full_serializer(self):
+        """?fields= renvoie les mêmes valeurs que la représentation complète"""
+        full = self.client.get('/api/v1/sensors/data/').data['results']
+        response = self.client.get('/api/v1/sensors/data/', {'fields': 'timestamp,spo2'})
+
+        self.assertEqual(response.data['results'], [
+            {'timestamp': row['timestamp'], 'spo2': row['spo2']} for row in full
+        ])
+        next_page = self.client.get('/api/v1/sensors/data/', {'fields': 'max30102', 'page_size': 4})
+        self.assertIsNotNone(next_page.data['next'])
+        self.assertEqual(self.client.get('/api/v1/sensors/data/', {'fields': 'password'}).status_code, 400)
+
+
+class ReadSerializerTestCase(APITestCase):
+    """Tests des serializers de lecture rapides (sortie identique à DRF)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        bracelet = BraceletDevice.objects.create(user=self.user, device_id='b1', is_connected=True)
+        start = timezone.now() - timedelta(hours=1)
+        ingest_readings(self.user, bracelet, [
+            {'timestamp': start + timedelta(minutes=i, microseconds=i * 137), 'spo2': 86 + i,
+             'aqi': 40 * i, 'temperature': 21.5, 'smoke_detected': i == 3, 'pollen_level': 'HIGH'}
+            for i in range(8)
+        ])
+        SensorAnalytics.objects.create(user=self.user, timestamp=start, spo2_avg_1h=95.5, respiratory_health_score=80)
+
+    def test_identical_to_model_serializers(self):
+        """values_list() + ReadSerializer == ModelSerializer, octet pour octet"""
+        renderer = JSONRenderer()
+        for serializer_class, reader, queryset in (
+            (SensorDataSerializer, read_serializers.sensor_data, SensorData.objects.order_by('id')),
+            (RiskAlertSerializer, read_serializers.risk_alerts, RiskAlert.objects.order_by('id')),
+            (SensorAnalyticsSerializer, read_serializers.sensor_analytics, SensorAnalytics.objects.order_by('id')),
+        ):
+            self.assertTrue(queryset.exists())
+            expected = renderer.render(serializer_class(queryset, many=True).data)
+            self.assertEqual(renderer.render(reader.to_representation(reader.values_list(queryset))), expected)
+            self.assertEqual(renderer.render(reader.to_representation(reader.values(queryset))), expected)
+
+    def test_list_endpoints_unchanged(self):
+        """Les listes paginées renvoient la représentation DRF habituelle"""
+        for url, serializer_class, queryset in (
+            ('/api/v1/sensors/data/', SensorDataSerializer, SensorData.objects.order_by('-timestamp', '-id')),
+            ('/api/v1/sensors/alerts/', RiskAlertSerializer, RiskAlert.objects.order_by('-timestamp', '-id')),
+            ('/api/v1/sensors/alerts/unread/', RiskAlertSerializer, RiskAlert.objects.order_by('-timestamp', '-id')),
+            ('/api/v1/sensors/analytics/', SensorAnalyticsSerializer, SensorAnalytics.objects.all()),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                JSONRenderer().render(response.data['results']),
+                JSONRenderer().render(serializer_class(queryset, many=True).data),
+            )
+
+
+class ORJSONRendererTestCase(SimpleTestCase):
+    """Tests du rendu / de la lecture JSON orjson"""
+
+    def test_matches_json_renderer(self):
+        """Même JSON que JSONRenderer pour les données sérialisées (chaînes, nombres, clés non-chaînes)"""
+        data = {
+            'results': [{'id': 1, 'spo2': 97, 'temperature': 21.5, 'risk_level': 'ÉLEVÉ', 'timestamp': '2026-01-01T00:00:00.000000Z'}],
+            'counts': {1: 3, 2: None},
+            'message': 'ligne\u2028suivante',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_native_types(self):
+        """datetime en ISO (UTC -> Z), Decimal et timedelta via l'encodeur DRF"""
+        from datetime import datetime, timezone as dt_timezone
+        from decimal import Decimal
+        rendered = json.loads(ORJSONRenderer().render({
+            'at': datetime(2026, 1, 1, 12, 30, tzinfo=dt_timezone.utc),
+            'value': Decimal('12.5'),
+            'window': timedelta(minutes=5),
+        }))
+        self.assertEqual(rendered, {'at': '2026-01-01T12:30:00Z', 'value': 12.5, 'window': '300.0'})
+
+    def test_fallbacks(self):
+        """Sans orjson ou en rendu indenté: JSONRenderer"""
+        data = {'a': [1, 2]}
+        with mock.patch.object(api_renderers, 'orjson', None):
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parser(self):
+        """Corps UTF-8 décodé par orjson, JSON invalide ou NaN -> ParseError"""
+        from io import BytesIO
+        from rest_framework.exceptions import ParseError
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"spo2": 97, "note": "é"}'.encode())), {'spo2': 97, 'note': 'é'})
+        for body in (b'{"spo2": NaN}', b'{"spo2": '):
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
@@ -2,16 +2,66 @@
 Service pour récupérer les données depuis l'API Ubidots
 """
 import requests
+import hashlib
 import logging
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
-from apps.sensors.models import SensorData, BraceletDevice
+from apps.sensors import device_state
+from apps.sensors.models import BraceletDevice, UbidotsSyncCursor
+from apps.sensors.ingest_service import ingest_ubidots_readings
+from apps.sensors.validation import validate_batch
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Labels Ubidots reconnus pour chaque champ SensorData
+FIELD_LABELS = {
+    'spo2': ('spo2', 'spo_2', 'oxygen'),
+    'heart_rate': ('heart_rate', 'heartrate', 'hr', 'bpm'),
+    'temperature': ('temperature', 'temp', 't'),
+    'humidity': ('humidity', 'hum', 'h'),
+    'eco2': ('eco2', 'co2', 'carbon'),
+    'tvoc': ('tvoc', 'voc', 'volatile'),
+    'respiratory_rate': ('respiratory_rate', 'breathing', 'resp'),
+}
+LABEL_TO_FIELD = {label: field for field, labels in FIELD_LABELS.items() for label in labels}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Session HTTP partagée (keep-alive) pour tous les appels Ubidots du process.
+    Retry avec backoff + jitter sur 429/5xx (Retry-After respecté).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=getattr(settings, 'UBIDOTS_MAX_RETRIES', 3),
+                backoff_factor=0.5,
+                backoff_jitter=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({'GET'}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            pool_size = getattr(settings, 'UBIDOTS_MAX_WORKERS', 8)
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
 class UbidotsService:
     def __init__(self, api_token=None):
         self.api_token = api_token or getattr(settings, 'UBIDOTS_API_TOKEN', None)
@@ -20,79 +70,182 @@ class UbidotsService:
             'X-Auth-Token': self.api_token,
             'Content-Type': 'application/json'
         }
+        self.session = get_http_session()
+        # (connexion, lecture) en secondes
+        self.timeout = getattr(settings, 'UBIDOTS_TIMEOUT', (3.05, 15))
+        self.max_workers = getattr(settings, 'UBIDOTS_MAX_WORKERS', 8)
+        self.metadata_ttl = getattr(settings, 'UBIDOTS_METADATA_TTL', 3600)
         
         if not self.api_token:
             logger.warning("UBIDOTS_API_TOKEN non configuré dans settings")
     
+    def _get(self, url, params=None):
+        return self.session.get(url, headers=self.headers, params=params, timeout=self.timeout)
+    
+    def run_concurrently(self, func, items):
+        """Exécuter func(item) en parallèle (pool borné), résultats dans l'ordre des items"""
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+    
+    def _cache_key(self, kind, device_id=''):
+        """Clé de cache des métadonnées, propre au token (jamais stocké en clair)"""
+        token_hash = hashlib.sha256((self.api_token or '').encode()).hexdigest()[:16]
+        return f"ubidots:{kind}:{token_hash}:{device_id}"
+    
+    def invalidate_metadata(self, device_id=None):
+        """Invalider le cache des métadonnées (tout le token, ou un seul device)"""
+        if device_id is None:
+            devices = cache.get(self._cache_key('devices')) or []
+            keys = [self._cache_key('devices')]
+            for device in devices:
+                keys += [self._cache_key('variables', device['id']), self._cache_key('variable_map', device['id'])]
+            cache.delete_many(keys)
+        else:
+            cache.delete_many([
+                self._cache_key('variables', device_id),
+                self._cache_key('variable_map', device_id),
+            ])
+    
     def get_devices(self):
-        """Récupérer tous les devices Ubidots via API v2.0"""
+        """Récupérer tous les devices Ubidots via API v2.0 (cache UBIDOTS_METADATA_TTL)"""
+        cache_key = self._cache_key('devices')
+        devices = cache.get(cache_key)
+        if devices is not None:
+            return devices
+        
         try:
             # Utiliser l'API v2.0 qui fonctionne
-            response = requests.get(
-                'https://industrial.api.ubidots.com/api/v2.0/devices/',
-                headers=self.headers
-            )
+            response = self._get('https://industrial.api.ubidots.com/api/v2.0/devices/')
             response.raise_for_status()
             data = response.json()
             # v2.0 retourne {"results": [...]}
-            return data.get('results', data) if isinstance(data, dict) else data
+            devices = data.get('results', data) if isinstance(data, dict) else data
         except Exception as e:
             logger.error(f"Erreur récupération devices Ubidots: {e}")
             return []
+        
+        cache.set(cache_key, devices, self.metadata_ttl)
+        return devices
     
     def get_device_variables(self, device_id):
-        """Récupérer les variables d'un device via datasources endpoint"""
+        """Récupérer les variables d'un device via datasources endpoint (cache UBIDOTS_METADATA_TTL)"""
+        cache_key = self._cache_key('variables', device_id)
+        variables = cache.get(cache_key)
+        if variables is not None:
+            return variables
+        
         try:
             # Utiliser l'endpoint datasources qui contient les variables
-            response = requests.get(
-                f"{self.base_url}/datasources/{device_id}/variables",
-                headers=self.headers
-            )
+            response = self._get(f"{self.base_url}/datasources/{device_id}/variables")
             response.raise_for_status()
             data = response.json()
             # Retourne {"results": [...]} ou directement une liste
-            return data.get('results', data) if isinstance(data, dict) else data
+            variables = data.get('results', data) if isinstance(data, dict) else data
         except Exception as e:
             logger.error(f"Erreur récupération variables device {device_id}: {e}")
             return []
+        
+        cache.set(cache_key, variables, self.metadata_ttl)
+        return variables
+    
+    def get_variable_map(self, device_id):
+        """Mapping champ SensorData -> variable Ubidots d'un device (cache UBIDOTS_METADATA_TTL)"""
+        cache_key = self._cache_key('variable_map', device_id)
+        variable_map = cache.get(cache_key)
+        if variable_map is None:
+            variable_map = self.map_variables(self.get_device_variables(device_id))
+            # Mapping vide = device sans variable connue ou erreur API: pas mis en cache
+            if variable_map:
+                cache.set(cache_key, variable_map, self.metadata_ttl)
+        return variable_map
+    
+    def _time_params(self, start_time=None, end_time=None):
+        """Filtres temporels Ubidots (timestamps Unix en millisecondes)"""
+        params = {}
+        if start_time:
+            if isinstance(start_time, datetime):
+                params['start'] = int(start_time.timestamp() * 1000)
+            else:
+                params['start'] = start_time
+                
+        if end_time:
+            if isinstance(end_time, datetime):
+                params['end'] = int(end_time.timestamp() * 1000)
+            else:
+                params['end'] = end_time
+        return params
+    
+    def iter_variable_values(self, variable_id, start_time=None, end_time=None, page_size=1000):
+        """
+        Générateur des valeurs d'une variable, page par page
+        
+        Suit les liens 'next' de la pagination Ubidots jusqu'à la dernière page.
+        Les erreurs HTTP sont propagées (pas de troncature silencieuse).
+        
+        Yields:
+            Liste des valeurs d'une page ({'timestamp': ms, 'value': ...})
+        """
+        url = f"{self.base_url}/variables/{variable_id}/values/"
+        params = {'page_size': page_size, **self._time_params(start_time, end_time)}
+        
+        while url:
+            response = self._get(url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            
+            # Ubidots peut renvoyer {'results': [...], 'next': ...} ou directement une liste
+            if not isinstance(data, dict):
+                if data:
+                    yield data
+                return
+            
+            results = data.get('results') or []
+            if results:
+                yield results
+            
+            url = data.get('next')
+            params = None  # L'URL 'next' contient déjà les paramètres
     
     def get_variable_values(self, variable_id, start_time=None, end_time=None, page_size=1000):
-        """Récupérer les valeurs d'une variable"""
+        """Récupérer toutes les valeurs d'une variable (toutes pages) sous forme de liste"""
         try:
-            params = {'page_size': page_size}
-            
-            # Filtres temporels (timestamps Unix en millisecondes)
-            if start_time:
-                if isinstance(start_time, datetime):
-                    params['start'] = int(start_time.timestamp() * 1000)
-                else:
-                    params['start'] = start_time
-                    
-            if end_time:
-                if isinstance(end_time, datetime):
-                    params['end'] = int(end_time.timestamp() * 1000)
-                else:
-                    params['end'] = end_time
-            
-            response = requests.get(
-                f"{self.base_url}/variables/{variable_id}/values/",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+            values = []
+            for page in self.iter_variable_values(variable_id, start_time, end_time, page_size):
+                values.extend(page)
+                # Une seule page demandée explicitement (ex: dernière valeur)
+                if page_size == 1:
+                    break
+            return values
         except Exception as e:
             logger.error(f"Erreur récupération valeurs variable {variable_id}: {e}")
             return []
     
-    def sync_sensor_data(self, user_email, device_mapping=None, hours_back=24):
+    def map_variables(self, variables):
+        """Mapper les variables Ubidots (par label) vers nos champs SensorData"""
+        variable_map = {}
+        for var in variables:
+            field = LABEL_TO_FIELD.get(var.get('label', '').lower())
+            if field:
+                variable_map[field] = var['id']
+        return variable_map
+    
+    def sync_sensor_data(self, user_email, device_mapping=None, hours_back=None):
         """
         Synchroniser les données capteurs depuis Ubidots
         
+        Par défaut la synchro est incrémentale: chaque variable reprend à son
+        watermark (UbidotsSyncCursor) moins un petit recouvrement pour les
+        données tardives. Les appels HTTP (variables puis valeurs de tous les
+        devices) sont faits en parallèle; les écritures en base restent sur le
+        thread courant.
+        
         Args:
             user_email: Email de l'utilisateur
             device_mapping: Mapping device_id -> user_email si différent
-            hours_back: Nombre d'heures à récupérer
+            hours_back: Backfill explicite sur N heures (ignore les watermarks)
         """
         try:
             # Trouver l'utilisateur
@@ -104,124 +257,118 @@ class UbidotsService:
             
             # Période de récupération
             end_time = timezone.now()
-            start_time = end_time - timedelta(hours=hours_back)
+            backfill_start = end_time - timedelta(
+                hours=hours_back if hours_back is not None
+                else getattr(settings, 'UBIDOTS_SYNC_INITIAL_HOURS', 24)
+            )
+            overlap_ms = getattr(settings, 'UBIDOTS_SYNC_OVERLAP_SECONDS', 300) * 1000
             
-            logger.info(f"🔄 Synchronisation Ubidots pour {user_email} - {hours_back}h")
+            mode = 'backfill' if hours_back is not None else 'incremental'
+            logger.info(f"🔄 Synchronisation Ubidots ({mode}) pour {user_email}")
             
             # Récupérer les devices
             devices = self.get_devices()
             if not devices:
                 return {'error': 'Aucun device Ubidots trouvé'}
             
+            device_ids = [device['id'] for device in devices]
+            
+            # Mapping des variables de tous les devices (cache, sinon en parallèle)
+            variable_maps = dict(zip(
+                device_ids, self.run_concurrently(self.get_variable_map, device_ids)
+            ))
+            
+            # Watermarks existants (une requête)
+            cursors = {
+                (cursor.device_id, cursor.variable_id): cursor
+                for cursor in UbidotsSyncCursor.objects.filter(user=user)
+            }
+            
+            def fetch_start(device_id, var_id):
+                cursor = cursors.get((device_id, var_id))
+                if hours_back is not None or cursor is None:
+                    return int(backfill_start.timestamp() * 1000)
+                return cursor.last_timestamp - overlap_ms
+            
+            fetches = [
+                (device_id, field, var_id, fetch_start(device_id, var_id))
+                for device_id, variable_map in variable_maps.items()
+                for field, var_id in variable_map.items()
+            ]
+            
+            devices_by_id = {device['id']: device for device in devices}
+            for device_id in device_ids:
+                device = devices_by_id[device_id]
+                logger.info(f"📱 Device: {device.get('label', device_id)} ({device_id})")
+                logger.info(f"📊 Variables mappées: {list(variable_maps[device_id].keys())}")
+            
+            bracelets = {}
+            devices_with_new_data = set()
+            failed_variables = set()
             total_synced = 0
+            end_ms = int(end_time.timestamp() * 1000)
             
-            for device in devices:
-                device_id = device['id']
-                device_label = device.get('label', device_id)
-                
-                logger.info(f"📱 Device: {device_label} ({device_id})")
+            # Tranches de temps successives (de la plus ancienne à la plus récente):
+            # mémoire bornée par tranche, même pour un backfill de plusieurs semaines
+            for slice_start, slice_end in self._time_slices(
+                min((fetch[3] for fetch in fetches), default=end_ms), end_ms
+            ):
+                slice_fetches = [
+                    fetch for fetch in fetches
+                    if fetch[2] not in failed_variables and fetch[3] <= slice_end
+                ]
+                if not slice_fetches:
+                    continue
                 
-                # Trouver ou créer le bracelet Django
-                bracelet, created = BraceletDevice.objects.get_or_create(
-                    user=user,
-                    device_id=f"ubidots_{device_id}",
-                    defaults={
-                        'device_name': f"Ubidots {device_label}",
-                        'is_connected': True,
-                        'battery_level': 100
-                    }
+                # Valeurs de toutes les variables de tous les devices en parallèle
+                fetched_values = self.run_concurrently(
+                    lambda fetch: self._collect_values(fetch[2], max(fetch[3], slice_start), slice_end),
+                    slice_fetches
                 )
                 
-                # Récupérer les variables du device
-                variables = self.get_device_variables(device_id)
+                values_by_device = {}
+                for (device_id, field, var_id, _), values in zip(slice_fetches, fetched_values):
+                    if values is None:
+                        # Échec: on n'avance plus ce watermark pendant cette synchro
+                        failed_variables.add(var_id)
+                        continue
+                    values_by_device.setdefault(device_id, []).append((field, var_id, values))
                 
-                # Mapper les variables aux champs de données
-                variable_map = {}
-                for var in variables:
-                    var_label = var.get('label', '').lower()
-                    var_id = var['id']
+                for device_id, device_values in values_by_device.items():
+                    bracelet = bracelets.get(device_id)
+                    if bracelet is None:
+                        bracelet = bracelets[device_id] = self._get_bracelet(user, devices_by_id[device_id])
                     
-                    # Mapping des labels Ubidots vers nos champs
-                    if var_label in ['spo2', 'spo_2', 'oxygen']:
-                        variable_map['spo2'] = var_id
-                    elif var_label in ['heart_rate', 'heartrate', 'hr', 'bpm']:
-                        variable_map['heart_rate'] = var_id
-                    elif var_label in ['temperature', 'temp', 't']:
-                        variable_map['temperature'] = var_id
-                    elif var_label in ['humidity', 'hum', 'h']:
-                        variable_map['humidity'] = var_id
-                    elif var_label in ['eco2', 'co2', 'carbon']:
-                        variable_map['eco2'] = var_id
-                    elif var_label in ['tvoc', 'voc', 'volatile']:
-                        variable_map['tvoc'] = var_id
-                    elif var_label in ['respiratory_rate', 'breathing', 'resp']:
-                        variable_map['respiratory_rate'] = var_id
-                
-                logger.info(f"📊 Variables mappées: {list(variable_map.keys())}")
-                
-                # Récupérer les données pour chaque variable
-                sensor_data_batch = {}
-                
-                for field, var_id in variable_map.items():
-                    values = self.get_variable_values(var_id, start_time, end_time)
-                    
-                    for value_data in values:
-                        timestamp_ms = value_data['timestamp']
-                        timestamp = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
-                        value = value_data['value']
-                        
-                        # Grouper par timestamp
-                        if timestamp_ms not in sensor_data_batch:
-                            sensor_data_batch[timestamp_ms] = {
-                                'timestamp': timestamp,
-                                'ubidots_timestamp': timestamp_ms,
-                                'ubidots_device_id': device_id
-                            }
-                        
-                        sensor_data_batch[timestamp_ms][field] = value
-                
-                # Créer les enregistrements SensorData
-                for timestamp_ms, data in sensor_data_batch.items():
-                    # Vérifier si déjà existant
-                    existing = SensorData.objects.filter(
-                        user=user,
-                        ubidots_timestamp=timestamp_ms,
-                        ubidots_device_id=device_id
-                    ).first()
-                    
-                    if existing:
-                        continue  # Skip si déjà existant
+                    readings = self._group_by_timestamp(device_id, device_values)
+                    # Lectures hors plage capteur: ignorées (le watermark avance quand même)
+                    invalid = validate_batch(readings)
+                    if invalid:
+                        logger.warning(f"⚠️ {len(invalid)} lectures Ubidots hors plage ignorées ({device_id})")
+                        readings = [reading for index, reading in enumerate(readings) if index not in invalid]
                     
-                    # Créer nouveau record
-                    sensor_data = SensorData.objects.create(
-                        user=user,
-                        bracelet=bracelet,
-                        timestamp=data['timestamp'],
-                        ubidots_device_id=data['ubidots_device_id'],
-                        ubidots_timestamp=data['ubidots_timestamp'],
-                        
-                        # Données capteurs
-                        spo2=data.get('spo2'),
-                        heart_rate=data.get('heart_rate'),
-                        temperature=data.get('temperature'),
-                        humidity=data.get('humidity'),
-                        eco2=data.get('eco2'),
-                        tvoc=data.get('tvoc'),
-                        respiratory_rate=data.get('respiratory_rate'),
-                        
-                        activity_level='REST'
-                    )
+                    created_readings = ingest_ubidots_readings(user, bracelet, device_id, readings)
+                    total_synced += len(created_readings)
+                    if created_readings:
+                        devices_with_new_data.add(device_id)
                     
-                    total_synced += 1
-                
-                # Mettre à jour le bracelet
-                bracelet.last_sync = timezone.now()
-                bracelet.save()
+                    # Avancer les watermarks une fois les lectures du device écrites
+                    self._advance_cursors(user, device_id, device_values, cursors)
+            
+            # Mettre à jour les bracelets sans nouvelle lecture (sinon fait par l'ingestion)
+            for device_id in device_ids:
+                if device_id in devices_with_new_data:
+                    continue
+                bracelet = bracelets.get(device_id) or self._get_bracelet(user, devices_by_id[device_id])
+                device_state.record(bracelet, last_sync=timezone.now())
+            
+            if failed_variables:
+                logger.warning(f"⚠️ Variables Ubidots en échec (reprises à la prochaine synchro): {sorted(failed_variables)}")
             
             logger.info(f"✅ Synchronisation terminée: {total_synced} nouveaux enregistrements")
             
             return {
                 'success': True,
+                'mode': mode,
                 'total_synced': total_synced,
                 'period_hours': hours_back,
                 'devices_processed': len(devices)
@@ -231,21 +378,111 @@ class UbidotsService:
             logger.error(f"❌ Erreur synchronisation Ubidots: {e}")
             return {'error': str(e)}
     
+    def _time_slices(self, start_ms, end_ms):
+        """Découper [start_ms, end_ms] en tranches de UBIDOTS_SYNC_CHUNK_HOURS"""
+        step = int(getattr(settings, 'UBIDOTS_SYNC_CHUNK_HOURS', 24) * 3600 * 1000)
+        slice_start = start_ms
+        while True:
+            slice_end = min(slice_start + step, end_ms)
+            yield slice_start, slice_end
+            if slice_end >= end_ms:
+                return
+            slice_start = slice_end + 1
+    
+    def _collect_values(self, variable_id, start_ms, end_ms):
+        """Valeurs d'une variable sur une tranche (toutes pages), None en cas d'échec"""
+        try:
+            values = []
+            for page in self.iter_variable_values(variable_id, start_ms, end_ms):
+                values.extend(page)
+            return values
+        except Exception as e:
+            logger.error(f"Erreur récupération valeurs variable {variable_id}: {e}")
+            return None
+    
+    def _get_bracelet(self, user, device):
+        """Trouver ou créer le bracelet Django d'un device Ubidots"""
+        device_id = device['id']
+        bracelet, created = BraceletDevice.objects.get_or_create(
+            user=user,
+            device_id=f"ubidots_{device_id}",
+            defaults={
+                'device_name': f"Ubidots {device.get('label', device_id)}",
+                'is_connected': True,
+                'battery_level': 100
+            }
+        )
+        return bracelet
+    
+    def _group_by_timestamp(self, device_id, device_values):
+        """Fusionner les valeurs des variables d'un device en lectures SensorData (par timestamp)"""
+        sensor_data_batch = {}
+        
+        for field, var_id, values in device_values:
+            for value_data in values:
+                timestamp_ms = value_data['timestamp']
+                
+                if timestamp_ms not in sensor_data_batch:
+                    sensor_data_batch[timestamp_ms] = {
+                        'timestamp': datetime.fromtimestamp(timestamp_ms / 1000, tz=dt_timezone.utc),
+                        'ubidots_device_id': device_id,
+                        'ubidots_timestamp': timestamp_ms,
+                        'activity_level': 'REST'
+                    }
+                
+                sensor_data_batch[timestamp_ms][field] = value_data['value']
+        
+        return list(sensor_data_batch.values())
+    
+    def _advance_cursors(self, user, device_id, device_values, cursors):
+        """Enregistrer le plus grand timestamp reçu par variable (jamais de recul)"""
+        to_create = []
+        to_update = []
+        now = timezone.now()
+        
+        for field, var_id, values in device_values:
+            if not values:
+                continue
+            newest = max(value_data['timestamp'] for value_data in values)
+            cursor = cursors.get((device_id, var_id))
+            if cursor is None:
+                cursor = UbidotsSyncCursor(
+                    user=user, device_id=device_id, variable_id=var_id,
+                    field=field, last_timestamp=newest
+                )
+                cursors[(device_id, var_id)] = cursor
+                to_create.append(cursor)
+            elif newest > cursor.last_timestamp:
+                cursor.last_timestamp = newest
+                cursor.field = field
+                cursor.updated_at = now
+                to_update.append(cursor)
+        
+        if to_create:
+            UbidotsSyncCursor.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update:
+            UbidotsSyncCursor.objects.bulk_update(to_update, ['last_timestamp', 'field', 'updated_at'])
+    
     def get_latest_values(self, device_id, variable_labels):
         """Récupérer les dernières valeurs pour des variables spécifiques"""
         try:
             variables = self.get_device_variables(device_id)
             latest_data = {}
             
-            for var in variables:
-                var_label = var.get('label', '').lower()
-                if var_label in variable_labels:
-                    values = self.get_variable_values(var['id'], page_size=1)
-                    if values:
-                        latest_data[var_label] = {
-                            'value': values[0]['value'],
-                            'timestamp': values[0]['timestamp']
-                        }
+            wanted = [
+                (var.get('label', '').lower(), var['id']) for var in variables
+                if var.get('label', '').lower() in variable_labels
+            ]
+            results = self.run_concurrently(
+                lambda item: self.get_variable_values(item[1], page_size=1), wanted
+            )
+            
+            for (var_label, _), values in zip(wanted, results):
+                if values:
+                    latest_data[var_label] = {
+                        'value': values[0]['value'],
+                        'timestamp': values[0]['timestamp']
+                    }
             
             return latest_data
             
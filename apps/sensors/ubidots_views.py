@@ -5,16 +5,26 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.db.models import Q, Avg, Max, Min
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+import hashlib
 import json
 import logging
 
 from .models import SensorData, BraceletDevice
 from .serializers import SensorDataSerializer, SensorDataCreateSerializer
 from .ubidots_service import UbidotsService
+from . import rollups
+from .ingest_queue import enqueue, enqueue_many, ingest_payloads, resolve_targets, validate_webhook_payloads
+from .ingest_service import ingest_ubidots_readings, ubidots_payload_to_reading
+from .latest_state import get_latest_state
+from .projection import PRESETS, PRESET_FILTERS, ProjectionError, parse_fields, project, representation
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -31,56 +41,49 @@ def ubidots_webhook(request):
         logger.info(f"📡 Données Ubidots reçues: {payload}")
         
         # Validation des champs requis
-        if not all(key in payload for key in ['device_id', 'user_email', 'timestamp', 'data']):
+        _, errors = validate_webhook_payloads([payload])
+        if errors:
+            return Response({'error': errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Mode write-behind: mise en file, l'insertion est faite par drain_ingest_queue
+        if settings.UBIDOTS_WEBHOOK_ASYNC:
+            item = enqueue(payload)
             return Response({
-                'error': 'Champs manquants: device_id, user_email, timestamp, data requis'
-            }, status=status.HTTP_400_BAD_REQUEST)
+                'status': 'queued',
+                'queue_id': item.id
+            }, status=status.HTTP_202_ACCEPTED)
         
-        # Trouver l'utilisateur
-        try:
-            user = User.objects.get(email=payload['user_email'])
-        except User.DoesNotExist:
+        # Trouver l'utilisateur et le bracelet/device (cache de résolution, créé si besoin)
+        user, bracelet = resolve_targets([payload])[(payload['user_email'], payload['device_id'])]
+        if user is None:
             logger.warning(f"Utilisateur non trouvé: {payload['user_email']}")
             return Response({
                 'error': 'Utilisateur non trouvé'
             }, status=status.HTTP_404_NOT_FOUND)
+        if bracelet is None:
+            return Response({
+                'error': 'Device associé à un autre utilisateur'
+            }, status=status.HTTP_409_CONFLICT)
         
-        # Trouver ou créer le bracelet/device
-        bracelet, created = BraceletDevice.objects.get_or_create(
-            user=user,
-            device_id=payload['device_id'],
-            defaults={
-                'device_name': f"Capteurs Ubidots {payload['device_id'][-3:]}",
-                'is_connected': True,
-                'battery_level': 100
-            }
-        )
-        
-        # Convertir timestamp Unix (ms) en datetime
-        timestamp = datetime.fromtimestamp(payload['timestamp'] / 1000, tz=timezone.utc)
-        
-        # Créer les données capteur
-        sensor_data = SensorData.objects.create(
-            user=user,
-            bracelet=bracelet,
-            timestamp=timestamp,
-            spo2=payload['data'].get('spo2'),
-            heart_rate=payload['data'].get('heart_rate'),
-            temperature=payload['data'].get('temperature'),
-            humidity=payload['data'].get('humidity'),
-            eco2=payload['data'].get('eco2'),
-            tvoc=payload['data'].get('tvoc'),
-            ubidots_device_id=payload['device_id'],
-            ubidots_timestamp=payload['timestamp'],
-            respiratory_rate=payload['data'].get('respiratory_rate'),
-            activity_level=payload['data'].get('activity_level', 'REST'),
-            steps=payload['data'].get('steps', 0)
+        # Insertion idempotente: rejeu Ubidots ou webhook concurrent (contrainte unique, rechargement et nouvel essai)
+        created = ingest_ubidots_readings(
+            user, bracelet, payload['device_id'], [ubidots_payload_to_reading(payload)],
+            is_connected=True, optimistic=True
         )
-        
-        # Mettre à jour la dernière sync du bracelet
-        bracelet.last_sync = timezone.now()
-        bracelet.is_connected = True
-        bracelet.save()
+        if not created:
+            existing = SensorData.objects.get(
+                user=user,
+                ubidots_device_id=payload['device_id'],
+                ubidots_timestamp=payload['timestamp']
+            )
+            return Response({
+                'status': 'duplicate',
+                'message': 'Données capteurs déjà enregistrées',
+                'sensor_data_id': existing.id,
+                'risk_level': existing.risk_level,
+                'risk_score': existing.risk_score
+            }, status=status.HTTP_200_OK)
+        sensor_data = created[0]
         
         return Response({
             'status': 'success',
@@ -97,45 +100,123 @@ def ubidots_webhook(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _seen_key(payload):
+    return f"ubidots:seen:{payload['device_id']}:{payload['timestamp']}"
+
+
+def _idempotency_cache_key(key, payloads):
+    """Clé Idempotency-Key propre aux devices du lot (deux devices peuvent envoyer la même clé)"""
+    devices = sorted({
+        str(payload.get('device_id')) for payload in payloads if isinstance(payload, dict)
+    })
+    scope = hashlib.sha256('\n'.join(devices).encode()).hexdigest()[:16]
+    return f"ubidots:idem:{scope}:{key}"
+
+
+@csrf_exempt
+@require_POST
+def ubidots_ingest(request):
+    """
+    Webhook allégé (hors DRF): une lecture ou un tableau de lectures
+
+    Pas d'authentification JWT ni de négociation de rendu. En production ce
+    chemin est servi sans la pile de middlewares (core.lean_handler, aiguillé
+    dans asgi.py / wsgi.py); le client de test passe par l'URLconf complète.
+    Idempotent: en-tête
+    Idempotency-Key pour la requête entière, puis clé device_id + timestamp
+    par lecture (cache, puis contrainte unique en base).
+    """
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON invalide'}, status=400)
+
+    payloads = body if isinstance(body, list) else [body]
+    if not payloads:
+        return JsonResponse({'error': 'Aucune lecture fournie'}, status=400)
+    if len(payloads) > settings.SENSOR_BULK_MAX_ITEMS:
+        return JsonResponse({
+            'error': f'Maximum {settings.SENSOR_BULK_MAX_ITEMS} lectures par requête'
+        }, status=413)
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        idempotency_key = _idempotency_cache_key(idempotency_key, payloads)
+        if not cache.add(idempotency_key, 1, settings.UBIDOTS_IDEMPOTENCY_TTL):
+            return JsonResponse({'status': 'duplicate'}, status=200)
+
+    try:
+        valid, errors = validate_webhook_payloads(payloads)
+
+        # Rejeux déjà vus: écartés sans toucher la base
+        seen = cache.get_many([_seen_key(payload) for _, payload in valid])
+        fresh = [(index, payload) for index, payload in valid if _seen_key(payload) not in seen]
+
+        if settings.UBIDOTS_WEBHOOK_ASYNC:
+            enqueue_many([payload for _, payload in fresh])
+            return JsonResponse({
+                'status': 'queued',
+                'queued': len(fresh),
+                'duplicates': len(valid) - len(fresh),
+                'errors': errors
+            }, status=202)
+
+        created, unresolved, errored = ingest_payloads([payload for _, payload in fresh]) if fresh else (0, [], {})
+        for position in unresolved:
+            errors.append({'index': fresh[position][0], 'error': 'Utilisateur non trouvé'})
+        for position in errored:
+            errors.append({'index': fresh[position][0], 'error': 'Erreur serveur lors du traitement de la lecture'})
+        errors.sort(key=lambda error: error['index'])
+        failed = set(unresolved) | set(errored)
+        if errored and idempotency_key:
+            # Lectures en erreur: un renvoi avec la même clé doit pouvoir les rejouer
+            cache.delete(idempotency_key)
+        cache.set_many(
+            {_seen_key(payload): 1 for position, (_, payload) in enumerate(fresh) if position not in failed},
+            settings.UBIDOTS_IDEMPOTENCY_TTL
+        )
+    except Exception as e:
+        if idempotency_key:
+            cache.delete(idempotency_key)
+        logger.error(f"❌ Erreur ingestion Ubidots: {str(e)}")
+        return JsonResponse({'error': 'Erreur serveur lors du traitement des données'}, status=500)
+
+    return JsonResponse({
+        'status': 'success',
+        'created': created,
+        'duplicates': len(valid) - len(failed) - created,
+        'errors': errors
+    }, status=201 if created else 200)
+
+
 @api_view(['GET'])
 def sensor_data_by_type(request, sensor_type):
-    """API pour récupérer les données par type de capteur"""
+    """API pour récupérer les données par type de capteur (?fields= pour restreindre les colonnes)"""
     user = request.user
     
+    if sensor_type not in PRESETS:
+        return Response({
+            'error': f'Type de capteur invalide: {sensor_type}',
+            'valid_types': list(PRESETS)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        fields = parse_fields(request.GET.get('fields'), default=PRESETS[sensor_type])
+    except ProjectionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     hours = int(request.GET.get('hours', 24))
     limit = int(request.GET.get('limit', 100))
     start_time = timezone.now() - timedelta(hours=hours)
     
+    # Filtre capteur avant la limite, seules les colonnes demandées sont lues
     queryset = SensorData.objects.filter(
+        PRESET_FILTERS[sensor_type],
         user=user,
         timestamp__gte=start_time
-    ).order_by('-timestamp')[:limit]
-    
-    # Filtrer selon le type de capteur
-    if sensor_type == 'max30102':
-        queryset = queryset.filter(Q(spo2__isnull=False) | Q(heart_rate__isnull=False))
-        fields = ['timestamp', 'spo2', 'heart_rate', 'risk_level']
-    elif sensor_type == 'dht11':
-        queryset = queryset.filter(Q(temperature__isnull=False) | Q(humidity__isnull=False))
-        fields = ['timestamp', 'temperature', 'humidity']
-    elif sensor_type == 'cjmcu811':
-        queryset = queryset.filter(Q(eco2__isnull=False) | Q(tvoc__isnull=False))
-        fields = ['timestamp', 'eco2', 'tvoc']
-    elif sensor_type == 'all':
-        fields = ['timestamp', 'spo2', 'heart_rate', 'temperature', 'humidity', 'eco2', 'tvoc', 'risk_level']
-    else:
-        return Response({
-            'error': f'Type de capteur invalide: {sensor_type}',
-            'valid_types': ['max30102', 'dht11', 'cjmcu811', 'all']
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Sérialiser les données
-    data = []
-    for item in queryset:
-        row = {}
-        for field in fields:
-            row[field] = getattr(item, field)
-        data.append(row)
+    ).order_by('-timestamp')
+    represent = representation(fields)
+    data = [represent(row) for row in project(queryset, fields)[:limit]]
     
     return Response({
         'sensor_type': sensor_type,
@@ -152,14 +233,15 @@ def sensor_stats(request):
     hours = int(request.GET.get('hours', 24))
     start_time = timezone.now() - timedelta(hours=hours)
     
-    queryset = SensorData.objects.filter(user=user, timestamp__gte=start_time)
+    # Compteurs lus sur les tranches pré-agrégées
+    summary = rollups.summarize(user, start_time)
     
     return Response({
         'period_hours': hours,
-        'total_records': queryset.count(),
-        'max30102_count': queryset.filter(Q(spo2__isnull=False) | Q(heart_rate__isnull=False)).count(),
-        'dht11_count': queryset.filter(Q(temperature__isnull=False) | Q(humidity__isnull=False)).count(),
-        'cjmcu811_count': queryset.filter(Q(eco2__isnull=False) | Q(tvoc__isnull=False)).count()
+        'total_records': summary['count'],
+        'max30102_count': summary['max30102_count'],
+        'dht11_count': summary['dht11_count'],
+        'cjmcu811_count': summary['cjmcu811_count']
     })
 
 
@@ -168,7 +250,7 @@ def latest_sensor_readings(request):
     """Dernières lectures de tous les capteurs"""
     user = request.user
     
-    latest = SensorData.objects.filter(user=user).order_by('-timestamp').first()
+    latest = get_latest_state(user)
     
     if not latest:
         return Response({'message': 'Aucune donnée trouvée'}, status=status.HTTP_404_NOT_FOUND)
@@ -197,8 +279,9 @@ def sync_ubidots_data(request):
     """Synchroniser les données depuis l'API Ubidots"""
     user = request.user
     
-    # Paramètres
-    hours_back = int(request.data.get('hours', 24))
+    # Paramètres (hours = backfill explicite, sinon synchro incrémentale)
+    hours = request.data.get('hours')
+    hours_back = int(hours) if hours is not None else None
     api_token = request.data.get('api_token')  # Token Ubidots fourni par l'utilisateur
     
     if not api_token:
@@ -208,6 +291,8 @@ def sync_ubidots_data(request):
     
     # Initialiser le service Ubidots
     ubidots_service = UbidotsService(api_token=api_token)
+    if request.data.get('refresh'):
+        ubidots_service.invalidate_metadata()
     
     # Synchroniser les données
     result = ubidots_service.sync_sensor_data(
@@ -232,6 +317,8 @@ def ubidots_devices(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     ubidots_service = UbidotsService(api_token=api_token)
+    if request.GET.get('refresh'):
+        ubidots_service.invalidate_metadata()
     devices = ubidots_service.get_devices()
     
     # Simplifier les informations des devices
@@ -262,6 +349,8 @@ def ubidots_variables(request, device_id):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     ubidots_service = UbidotsService(api_token=api_token)
+    if request.GET.get('refresh'):
+        ubidots_service.invalidate_metadata(device_id)
     variables = ubidots_service.get_device_variables(device_id)
     
     # Simplifier les informations des variables
@@ -309,12 +398,6 @@ def ubidots_max30102_data(request):
 
         devices = service.get_devices() or []
 
-        def normalize_values(values):
-            # Ubidots peut renvoyer {'results': [...]} ou directement une liste
-            if isinstance(values, dict) and 'results' in values:
-                return values['results']
-            return values or []
-
         all_entries = []
 
         for device in devices:
@@ -326,20 +409,13 @@ def ubidots_max30102_data(request):
             if device_label_filter and dlabel != device_label_filter:
                 continue
 
-            variables = service.get_device_variables(did) or []
-
-            spo2_var = None
-            hr_var = None
-            for var in variables:
-                vlabel = (var.get('label') or '').lower()
-                if vlabel in ['spo2', 'spo_2', 'oxygen']:
-                    spo2_var = var['id']
-                elif vlabel in ['heart_rate', 'heartrate', 'hr', 'bpm']:
-                    hr_var = var['id']
+            variable_map = service.get_variable_map(did)
+            spo2_var = variable_map.get('spo2')
+            hr_var = variable_map.get('heart_rate')
 
             # Récupérer les valeurs
-            spo2_values = normalize_values(service.get_variable_values(spo2_var, start_time, end_time)) if spo2_var else []
-            hr_values = normalize_values(service.get_variable_values(hr_var, start_time, end_time)) if hr_var else []
+            spo2_values = service.get_variable_values(spo2_var, start_time, end_time) if spo2_var else []
+            hr_values = service.get_variable_values(hr_var, start_time, end_time) if hr_var else []
 
             # Indexer par timestamp (ms)
             merged = {}
@@ -358,7 +434,7 @@ def ubidots_max30102_data(request):
 
             # Construire les entrées
             for ts_ms, vals in merged.items():
-                ts_dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+                ts_dt = datetime.fromtimestamp(ts_ms / 1000, tz=dt_timezone.utc)
                 all_entries.append({
                     'spo2': vals.get('spo2'),
                     'heart_rate': vals.get('heart_rate'),
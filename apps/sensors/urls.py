@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 from . import ubidots_views
+from . import realtime_views
 
 router = DefaultRouter()
 router.register('devices', views.BraceletDeviceViewSet, basename='devices')
@@ -14,6 +15,7 @@ urlpatterns = [
     
     # 📡 UBIDOTS WEBHOOK (PUSH)
     path('ubidots/webhook/', ubidots_views.ubidots_webhook, name='ubidots-webhook'),
+    path('ubidots/ingest/', ubidots_views.ubidots_ingest, name='ubidots-ingest'),
     
     # 🔄 UBIDOTS API SYNC (PULL)
     path('ubidots/sync/', ubidots_views.sync_ubidots_data, name='ubidots-sync'),
@@ -21,8 +23,14 @@ urlpatterns = [
     path('ubidots/devices/<str:device_id>/variables/', ubidots_views.ubidots_variables, name='ubidots-variables'),
     path('ubidots/max30102/', ubidots_views.ubidots_max30102_data, name='ubidots-max30102'),
     
-    # 📊 APIs PAR TYPE DE CAPTEUR
+    # 📊 APIs PAR TYPE DE CAPTEUR (data/<pk>/ du routeur limité aux ids numériques)
     path('data/<str:sensor_type>/', ubidots_views.sensor_data_by_type, name='sensor-data-by-type'),
+    
+    # ⚡ TEMPS RÉEL (SSE, ASGI)
+    path('events/', realtime_views.sensor_events, name='sensor-events'),
+    path('events/ticket/', realtime_views.event_ticket, name='sensor-events-ticket'),
+    
+    # 📊 STATISTIQUES
     path('stats/', ubidots_views.sensor_stats, name='sensor-stats'),
     path('latest/', ubidots_views.latest_sensor_readings, name='latest-readings'),
 ]
@@ -0,0 +1,88 @@
+"""
+Validation en lot des lectures capteurs
+
+Les plages de SensorDataValidator.RANGES sont compilées une fois puis évaluées
+colonne par colonne sur tout le lot. Les valeurs anormales (hors seuils
+d'alerte) sont agrégées par lot et journalisées au plus une fois par
+intervalle, quel que soit le débit d'ingestion.
+"""
+import logging
+import time
+from numbers import Real
+from Security.core.security import SensorDataValidator
+
+logger = logging.getLogger('django.security')
+
+# Intervalle minimal (s) entre deux journalisations d'un même type d'anomalie
+WARNING_LOG_INTERVAL = 60
+
+# (champ, min, max, message d'erreur, seuil bas, seuil haut, niveau, message d'alerte)
+_CHECKS = tuple(
+    (field, *bounds) for field, bounds in SensorDataValidator.RANGES.items()
+)
+_INF = float('inf')
+
+# clé d'anomalie -> (dernière journalisation, occurrences non journalisées)
+_log_state = {}
+
+
+def _log_limited(key, level, message, count):
+    """Journaliser une anomalie agrégée, au plus une fois par WARNING_LOG_INTERVAL"""
+    now = time.monotonic()
+    last, suppressed = _log_state.get(key, (None, 0))
+    total = count + suppressed
+    if last is not None and now - last < WARNING_LOG_INTERVAL:
+        _log_state[key] = (last, total)
+        return
+    _log_state[key] = (now, 0)
+    logger.log(level, message if total == 1 else f"{message} (x{total})")
+
+
+def validate_batch(rows):
+    """
+    Valider un lot de lectures selon SensorDataValidator.RANGES
+
+    Args:
+        rows: Liste de dicts de champs (les champs absents ou None sont ignorés)
+
+    Returns:
+        dict index -> {champ: [message]} pour les lignes invalides (vide si tout est valide)
+    """
+    errors = {}
+    anomalies = {}
+
+    for field, low, high, error, warn_low, warn_high, level, warning in _CHECKS:
+        warn_low = -_INF if warn_low is None else warn_low
+        warn_high = _INF if warn_high is None else warn_high
+        for index, row in enumerate(rows):
+            value = row.get(field)
+            if value is None:
+                continue
+            if not isinstance(value, Real) or isinstance(value, bool):
+                errors.setdefault(index, {})[field] = [f"{field} doit être un nombre"]
+            elif not (low <= value <= high):
+                errors.setdefault(index, {})[field] = [error.format(value=value)]
+            elif level is not None and (value < warn_low or value > warn_high):
+                if field in anomalies:
+                    anomalies[field][3] += 1
+                else:
+                    anomalies[field] = [field, level, warning.format(value=value), 1]
+
+    for index, row in enumerate(rows):
+        if index in errors:
+            continue
+        for level, message in SensorDataValidator.integrity_warnings(row):
+            if message in anomalies:
+                anomalies[message][3] += 1
+            else:
+                anomalies[message] = [message, level, message, 1]
+
+    for key, level, message, count in anomalies.values():
+        _log_limited(key, level, message, count)
+
+    return errors
+
+
+def validate_reading(data):
+    """Valider une seule lecture. Retourne {champ: [message]} ou {}"""
+    return validate_batch([data]).get(0, {})
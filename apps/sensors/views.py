@@ -1,16 +1,41 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from django.db.models import Avg, Max, Min, Count
 from .models import BraceletDevice, SensorData, SensorAnalytics, RiskAlert
 from .serializers import (
     BraceletDeviceSerializer, SensorDataSerializer, 
     SensorDataCreateSerializer, SensorAnalyticsSerializer, RiskAlertSerializer,
     SecureHealthSummarySerializer
 )
+from . import alert_engine, read_serializers, rollups
+from .export import CONTENT_TYPES, ExportError, export_stream
+from .history import HistoryQueryError, query_history
+from .ingest_service import get_default_bracelet, ingest_readings
+from .latest_state import get_latest_state, refresh_latest_state
+from .projection import FIELDS, ProjectionError, parse_fields, project, representation
+from .validation import validate_batch
+from api.pagination import TimestampCursorPagination
 from Security.core.security import APISecurityValidator, DataEncryptionHelper, SensorDataValidator
+import logging
+
+logger = logging.getLogger('django.security')
+
+
+def _read_page(view, queryset, reader):
+    """Page lue en values() et sérialisée par reader (même sortie que le serializer DRF)"""
+    rows = reader.values(queryset)
+    page = view.paginate_queryset(rows)
+    represent = reader.representation()
+    if page is None:
+        return Response([represent(row) for row in rows])
+    return view.get_paginated_response([represent(row) for row in page])
 
 class BraceletDeviceViewSet(viewsets.ModelViewSet):
     serializer_class = BraceletDeviceSerializer
@@ -23,9 +48,13 @@ class BraceletDeviceViewSet(viewsets.ModelViewSet):
 
 class SensorDataViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    # Keyset sur (user, -timestamp): pas de COUNT(*) ni d'OFFSET (total: ?count=true)
+    pagination_class = TimestampCursorPagination
+    # data/<type>/ (sensor_data_by_type) n'est pas capturé par le détail
+    lookup_value_regex = r'\d+'
     
     def get_serializer_class(self):
-        if self.action == 'create':
+        if self.action in ('create', 'bulk'):
             return SensorDataCreateSerializer
         return SensorDataSerializer
     
@@ -33,109 +62,124 @@ class SensorDataViewSet(viewsets.ModelViewSet):
         # Sécurité: isolation des données par utilisateur
         return SensorData.objects.filter(user=self.request.user)
     
+    def list(self, request, *args, **kwargs):
+        """Liste paginée; ?fields=spo2,heart_rate (ou preset) ne lit que ces colonnes"""
+        try:
+            fields = parse_fields(request.query_params.get('fields'), default=FIELDS)
+        except ProjectionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # timestamp / id: clés du curseur de pagination
+        rows = project(self.filter_queryset(self.get_queryset()), fields, extra=('timestamp', 'id'))
+        page = self.paginate_queryset(rows)
+        represent = representation(fields)
+        return self.get_paginated_response([represent(row) for row in page])
+    
     def perform_create(self, serializer):
         # Log sécurisé de création de données
-        import logging
-        logger = logging.getLogger('django.security')
         hashed_user = DataEncryptionHelper.hash_user_identifier(self.request.user.id)
         logger.info(f"Création données capteurs: User#{hashed_user}")
         
-        bracelet = BraceletDevice.objects.filter(
-            user=self.request.user, is_connected=True
-        ).first()
-        
-        if not bracelet:
-            from apps.users.models import CustomUser
-            user: CustomUser = self.request.user  # type: ignore
-            bracelet = BraceletDevice.objects.create(
-                user=user,
-                device_id=f"default_{user.id}",
-                is_connected=True
-            )
+        bracelet = get_default_bracelet(self.request.user)
         
-        bracelet.last_sync = timezone.now()
-        bracelet.save()
-        
-        # Sauvegarder avec calculs automatiques
-        instance = serializer.save(user=self.request.user, bracelet=bracelet)
-        
-        # Créer une alerte si nécessaire
-        self._check_and_create_alerts(instance)
-        
-        return Response(SensorDataSerializer(instance).data, status=status.HTTP_201_CREATED)
-    
-    def _check_and_create_alerts(self, sensor_data):
-        """Créer automatiquement des alertes basées sur les données"""
-        alerts = []
-        
-        # Log sécurisé pour valeurs critiques
-        import logging
-        logger = logging.getLogger('django.security')
-        hashed_user = DataEncryptionHelper.hash_user_identifier(sensor_data.user.id)
-        
-        # ⭐⭐⭐⭐⭐ SpO2 critique
-        if sensor_data.spo2 and sensor_data.spo2 < 90:
-            logger.critical(f"SpO2 critique User#{hashed_user}: {sensor_data.spo2}%")
-            alerts.append({
-                'alert_type': 'LOW_SPO2',
-                'severity': 'CRITICAL',
-                'message': f'SpO2 critique détectée: {sensor_data.spo2}% (normal: >95%)'
-            })
-        
-        # ⭐⭐⭐⭐⭐ Fréquence respiratoire anormale
-        if sensor_data.respiratory_rate:
-            if sensor_data.respiratory_rate > 30:
-                logger.warning(f"FR élevée User#{hashed_user}: {sensor_data.respiratory_rate}/min")
-                alerts.append({
-                    'alert_type': 'HIGH_RESPIRATORY_RATE',
-                    'severity': 'WARNING',
-                    'message': f'Fréquence respiratoire élevée: {sensor_data.respiratory_rate}/min (normal: 12-20/min)'
-                })
-        
-        # ⭐⭐⭐⭐⭐ Qualité de l'air dangereuse
-        if sensor_data.aqi and sensor_data.aqi > 150:
-            logger.warning(f"AQI dangereux User#{hashed_user}: {sensor_data.aqi}")
-            alerts.append({
-                'alert_type': 'POOR_AIR_QUALITY',
-                'severity': 'CRITICAL' if sensor_data.aqi > 300 else 'WARNING',
-                'message': f'Qualité de l\'air dangereuse: AQI {sensor_data.aqi} (bon: <50)'
-            })
-        
-        # ⭐⭐⭐⭐ Fumée détectée
-        if sensor_data.smoke_detected:
-            logger.critical(f"Fumée détectée User#{hashed_user}")
-            alerts.append({
-                'alert_type': 'SMOKE_DETECTED',
-                'severity': 'CRITICAL',
-                'message': 'Fumée détectée dans votre environnement!'
-            })
-        
-        # ⭐⭐⭐⭐ Pollen élevé
-        if sensor_data.pollen_level == 'HIGH':
-            alerts.append({
-                'alert_type': 'HIGH_POLLEN',
-                'severity': 'INFO',
-                'message': 'Niveau de pollen élevé aujourd\'hui'
-            })
-        
-        # Créer les alertes
-        for alert_data in alerts:
-            RiskAlert.objects.create(
-                user=sensor_data.user,
-                sensor_data=sensor_data,
-                **alert_data
-            )
+        # Sauvegarder avec calculs automatiques et alertes
+        serializer.instance = ingest_readings(
+            self.request.user, bracelet, [serializer.validated_data]
+        )[0]
+    
+    def perform_update(self, serializer):
+        previous = serializer.instance.timestamp
+        instance = serializer.save()
+        # Tranches des jours touchés recalculées (min/max non décrémentables)
+        rollups.rebuild(
+            since=min(previous, instance.timestamp), until=max(previous, instance.timestamp),
+            user_ids=[instance.user_id]
+        )
+        refresh_latest_state([instance.user_id])
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        rollups.rebuild(since=instance.timestamp, until=instance.timestamp, user_ids=[instance.user_id])
+        refresh_latest_state([instance.user_id])
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Ingestion en lot des lectures stockées hors-ligne par le bracelet"""
+        readings = request.data.get('readings') if isinstance(request.data, dict) else request.data
+        
+        if not isinstance(readings, list) or not readings:
+            return Response({
+                'error': 'Une liste non vide de lectures est requise'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_items = getattr(settings, 'SENSOR_BULK_MAX_ITEMS', 1000)
+        if len(readings) > max_items:
+            return Response({
+                'error': f'Trop de lectures: {len(readings)} (max {max_items})'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Contrôles de sécurité une seule fois pour tout le lot
+        try:
+            APISecurityValidator.validate_request_frequency(request.user, 'sensor_data')
+            APISecurityValidator.validate_sensitive_data_access(request.user, 'medical_data')
+        except DjangoValidationError as e:
+            return Response({'error': e.messages}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        
+        context = {**self.get_serializer_context(), 'bulk': True}
+        results = [None] * len(readings)
+        valid_rows = []
+        valid_indexes = []
+        
+        for index, row in enumerate(readings):
+            serializer = SensorDataCreateSerializer(data=row, context=context)
+            if serializer.is_valid():
+                valid_rows.append(serializer.validated_data)
+                valid_indexes.append(index)
+            else:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+        
+        # Plages capteurs vérifiées en une passe sur tout le lot
+        range_errors = validate_batch(valid_rows)
+        if range_errors:
+            for position in range_errors:
+                index = valid_indexes[position]
+                results[index] = {'index': index, 'status': 'invalid', 'errors': range_errors[position]}
+            valid_rows = [row for position, row in enumerate(valid_rows) if position not in range_errors]
+            valid_indexes = [index for position, index in enumerate(valid_indexes) if position not in range_errors]
+        
+        created = []
+        if valid_rows:
+            bracelet = get_default_bracelet(request.user)
+            created = ingest_readings(request.user, bracelet, valid_rows)
+        
+        for index, instance in zip(valid_indexes, created):
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': instance.id,
+                'risk_score': instance.risk_score,
+                'risk_level': instance.risk_level
+            }
+        
+        hashed_user = DataEncryptionHelper.hash_user_identifier(request.user.id)
+        logger.info(f"Ingestion en lot: User#{hashed_user} - {len(created)}/{len(readings)} lectures")
+        
+        return Response({
+            'created': len(created),
+            'rejected': len(readings) - len(created),
+            'results': results
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False)
     def latest(self, request):
-        data = self.get_queryset().first()
-        if not data:
+        state = get_latest_state(request.user)
+        if not state:
             return Response({'message': 'Aucune donnée'}, status=404)
-        return Response(self.get_serializer(data).data)
+        return Response(state.payload)
     
     @action(detail=False)
     def risk_score(self, request):
-        latest = self.get_queryset().first()
+        latest = get_latest_state(request.user)
         if not latest:
             return Response({'risk_score': 0, 'risk_level': 'UNKNOWN'})
         return Response({
@@ -150,36 +194,102 @@ class SensorDataViewSet(viewsets.ModelViewSet):
         hours = {'24h': 24, '7d': 168, '30d': 720}[period]
         start = timezone.now() - timedelta(hours=hours)
         
-        qs = self.get_queryset().filter(timestamp__gte=start)
+        # Lecture sur les tranches pré-agrégées (jours, heures, minutes aux bords)
+        summary = rollups.summarize(request.user, start)
         
         # Stats de base
-        stats = qs.aggregate(
-            avg_spo2=Avg('spo2'),
-            min_spo2=Min('spo2'),
-            max_spo2=Max('spo2'),
-            avg_heart_rate=Avg('heart_rate'),
-            min_heart_rate=Min('heart_rate'),
-            max_heart_rate=Max('heart_rate'),
-            avg_respiratory_rate=Avg('respiratory_rate'),
-            avg_aqi=Avg('aqi'),
-            max_aqi=Max('aqi'),
-            avg_risk_score=Avg('risk_score')
-        )
-        
-        # Stats par niveau de risque
-        risk_distribution = qs.values('risk_level').annotate(count=Count('id'))
+        stats = {
+            'avg_spo2': rollups.average(summary, 'spo2'),
+            'min_spo2': rollups.extremum(summary, 'spo2_min'),
+            'max_spo2': rollups.extremum(summary, 'spo2_max'),
+            'avg_heart_rate': rollups.average(summary, 'heart_rate'),
+            'min_heart_rate': rollups.extremum(summary, 'heart_rate_min'),
+            'max_heart_rate': rollups.extremum(summary, 'heart_rate_max'),
+            'avg_respiratory_rate': rollups.average(summary, 'respiratory_rate'),
+            'avg_aqi': rollups.average(summary, 'aqi'),
+            'max_aqi': rollups.extremum(summary, 'aqi_max'),
+            'avg_risk_score': rollups.average(summary, 'risk_score'),
+        }
         
         return Response({
             'period': period,
             'stats': stats,
-            'risk_distribution': risk_distribution,
-            'total_readings': qs.count()
+            # Stats par niveau de risque
+            'risk_distribution': rollups.risk_distribution(summary),
+            'total_readings': summary['count']
         })
     
+    @action(detail=False)
+    def history(self, request):
+        """Séries agrégées pour graphiques: ?from=&to=&bucket=1h&metrics=spo2,heart_rate&agg=avg,min,max"""
+        params = request.query_params
+        start, end = self._parse_datetime(params.get('from')), self._parse_datetime(params.get('to'))
+        if start is False or end is False:
+            return Response({'error': 'from / to: date ISO 8601 attendue'}, status=status.HTTP_400_BAD_REQUEST)
+        end = end or timezone.now()
+        start = start or end - timedelta(hours=24)
+        
+        try:
+            data = query_history(
+                request.user, start, end,
+                bucket=params.get('bucket', '1h'),
+                metrics=[metric for metric in params.get('metrics', 'spo2').split(',') if metric],
+                aggregates=[aggregate for aggregate in params.get('agg', 'avg').split(',') if aggregate],
+            )
+        except HistoryQueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+    
+    @action(detail=False)
+    def export(self, request):
+        """Export en flux: ?output=csv|ndjson|parquet&dataset=readings|alerts&from=&to="""
+        params = request.query_params
+        start, end = self._parse_datetime(params.get('from')), self._parse_datetime(params.get('to'))
+        if start is False or end is False:
+            return Response({'error': 'from / to: date ISO 8601 attendue'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            APISecurityValidator.validate_request_frequency(request.user, 'export')
+            APISecurityValidator.validate_sensitive_data_access(request.user, 'medical_data')
+        except DjangoValidationError as e:
+            return Response({'error': e.messages}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        
+        output = params.get('output', 'csv')
+        dataset = params.get('dataset', 'readings')
+        try:
+            # Sous ASGI, un itérateur synchrone serait lu en entier avant le premier octet
+            stream = export_stream(
+                request.user, output, dataset=dataset, start=start, end=end,
+                asynchronous=isinstance(request._request, ASGIRequest),
+            )
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        hashed_user = DataEncryptionHelper.hash_user_identifier(request.user.id)
+        logger.info(f"Export {dataset} ({output}): User#{hashed_user}")
+        
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[output])
+        filename = f"respira_{dataset}_{timezone.now():%Y%m%d}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @staticmethod
+    def _parse_datetime(value):
+        """Datetime aware, None si absent, False si invalide"""
+        if not value:
+            return None
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            return False
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+    
     @action(detail=False)
     def health_summary(self, request):
         """Résumé de santé intelligent basé sur toutes les métriques"""
-        latest = self.get_queryset().first()
+        latest = get_latest_state(request.user)
         last_24h = self.get_queryset().filter(
             timestamp__gte=timezone.now() - timedelta(hours=24)
         )
@@ -221,30 +331,82 @@ class SensorDataViewSet(viewsets.ModelViewSet):
                           'GOOD' if health_score > 60 else 
                           'FAIR' if health_score > 40 else 'POOR',
             'warnings': warnings,
-            'latest_data': SensorDataSerializer(latest).data,
+            'latest_data': latest.payload,
             'readings_24h': last_24h.count()
         })
 
 
 class RiskAlertViewSet(viewsets.ModelViewSet):
     serializer_class = RiskAlertSerializer
+    pagination_class = TimestampCursorPagination
     
     def get_queryset(self):
         return RiskAlert.objects.filter(user=self.request.user)
     
+    def list(self, request, *args, **kwargs):
+        return _read_page(self, self.filter_queryset(self.get_queryset()), read_serializers.risk_alerts)
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        alert_engine.invalidate_unread_count(self.request.user.id)
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        alert_engine.invalidate_unread_count(self.request.user.id)
+    
     @action(detail=False)
     def unread(self, request):
-        """Alertes non lues"""
+        """Alertes non lues (paginées)"""
         alerts = self.get_queryset().filter(is_read=False)
-        return Response(self.get_serializer(alerts, many=True).data)
+        return _read_page(self, alerts, read_serializers.risk_alerts)
+    
+    @action(detail=False)
+    def unread_count(self, request):
+        """Nombre d'alertes non lues (badge de l'app)"""
+        return Response({'unread_count': alert_engine.unread_count(request.user.id)})
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Marquer une alerte comme lue"""
-        alert = self.get_object()
-        alert.is_read = True
-        alert.save()
+        alert = self.get_object()  # 404 si l'alerte n'existe pas (ou pk invalide)
+        # UPDATE conditionnel: deux requêtes concurrentes ne décrémentent qu'une fois
+        updated = self.get_queryset().filter(pk=alert.pk, is_read=False).update(is_read=True)
+        alert_engine.adjust_unread_count(request.user.id, -updated)
         return Response({'status': 'marked_read'})
+    
+    def _bulk_queryset(self, request):
+        """Alertes ciblées par {'ids': [...]} ou {'all': true}, None si la requête est invalide"""
+        if request.data.get('all') is True:
+            return self.get_queryset()
+        ids = request.data.get('ids')
+        if isinstance(ids, list) and ids and all(isinstance(i, int) for i in ids):
+            return self.get_queryset().filter(id__in=ids)
+        return None
+    
+    @action(detail=False, methods=['post'], url_path='mark_read', url_name='mark-read-bulk')
+    def mark_read_bulk(self, request):
+        """Marquer plusieurs alertes comme lues en une requête"""
+        queryset = self._bulk_queryset(request)
+        if queryset is None:
+            return Response({'error': "'ids' (liste d'entiers) ou 'all': true requis"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        updated = queryset.filter(is_read=False).update(is_read=True)
+        alert_engine.adjust_unread_count(request.user.id, -updated)
+        return Response({'status': 'marked_read', 'updated': updated})
+    
+    @action(detail=False, methods=['post'], url_path='dismiss', url_name='dismiss-bulk')
+    def dismiss(self, request):
+        """Ignorer plusieurs alertes en une requête (elles sont aussi marquées lues)"""
+        queryset = self._bulk_queryset(request)
+        if queryset is None:
+            return Response({'error': "'ids' (liste d'entiers) ou 'all': true requis"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        updated = queryset.filter(is_dismissed=False).update(is_dismissed=True, is_read=True)
+        # Le compteur ne sait pas combien étaient non lues: recalcul à la prochaine lecture
+        alert_engine.invalidate_unread_count(request.user.id)
+        return Response({'status': 'dismissed', 'updated': updated})
 
 
 class SensorAnalyticsViewSet(viewsets.ModelViewSet):
@@ -252,3 +414,6 @@ class SensorAnalyticsViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         return SensorAnalytics.objects.filter(user=self.request.user)
+    
+    def list(self, request, *args, **kwargs):
+        return _read_page(self, self.filter_queryset(self.get_queryset()), read_serializers.sensor_analytics)
@@ -46,6 +46,10 @@ class Conversation(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Historique paginé par curseur
+            models.Index(fields=['user', 'created_at', 'id'], name='conversation_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.created_at}"
\ No newline at end of file
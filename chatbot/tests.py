@@ -189,6 +189,22 @@ class ChatbotViewsTestCase(APITestCase):
         self.assertIn('conversations', data)
         self.assertEqual(len(data['conversations']), 2)
     
+    def test_conversation_history_is_paginated(self):
+        """L'historique est paginé par curseur, derniers messages d'abord"""
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            Conversation.objects.create(user=self.user, message=f"Question {i}", response="", is_user=True)
+        
+        response = self.client.get(self.history_url, {'page_size': 3, 'count': 'true'})
+        data = response.json()
+        
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([c['message'] for c in data['conversations']], ['Question 4', 'Question 3', 'Question 2'])
+        
+        data = self.client.get(data['next']).json()
+        self.assertEqual([c['message'] for c in data['conversations']], ['Question 1', 'Question 0'])
+        self.assertIsNone(data['next'])
+    
     def test_conversation_saved_in_database(self):
         """Test que les conversations sont bien sauvegardées"""
         self.client.force_authenticate(user=self.user)
@@ -2,6 +2,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from api.pagination import CreatedAtCursorPagination
 from .models import ChatbotService, Conversation
 
 
@@ -54,8 +55,11 @@ def chat_view(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversation_history(request):
-    """Récupérer l'historique de conversation"""
-    conversations = Conversation.objects.filter(user=request.user)
+    """Récupérer l'historique de conversation (plus récent d'abord, paginé par curseur, total: ?count=true)"""
+    paginator = CreatedAtCursorPagination()
+    conversations = paginator.paginate_queryset(
+        Conversation.objects.filter(user=request.user), request
+    )
     
     data = []
     for conv in conversations:
@@ -65,4 +69,11 @@ def get_conversation_history(request):
             "created_at": conv.created_at.isoformat()
         })
     
-    return Response({"conversations": data})
\ No newline at end of file
+    response = {
+        "conversations": data,
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+    }
+    if paginator.total is not None:
+        response["count"] = paginator.total
+    return Response(response)
\ No newline at end of file
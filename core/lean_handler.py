@@ -0,0 +1,72 @@
+"""
+Handlers Django sans middlewares pour le webhook d'ingestion Ubidots
+
+Le webhook ubidots/ingest/ n'utilise ni session, ni CSRF, ni utilisateur
+authentifié, ni en-têtes navigateur: la pile de middlewares ne fait qu'y
+ajouter du coût. Ce chemin est servi par un handler dont la chaîne se réduit
+à la vue (URLconf dédiée); le reste de l'application garde la pile complète.
+"""
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+
+LEAN_URLCONF = 'respira_project.lean_urls'
+
+# ⚡ Chemins servis sans middlewares (doivent exister dans LEAN_URLCONF)
+LEAN_PATHS = frozenset({'/api/v1/sensors/ubidots/ingest/'})
+
+
+class LeanHandlerMixin:
+    """Chaîne réduite à la résolution d'URL et à la vue"""
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        get_response = self._get_response_async if is_async else self._get_response
+        self._middleware_chain = convert_exception_to_response(get_response)
+
+    def _prepare(self, request):
+        request.urlconf = LEAN_URLCONF
+        # ALLOWED_HOSTS reste appliqué (DisallowedHost -> 400)
+        request.get_host()
+
+    def _get_response(self, request):
+        self._prepare(request)
+        return super()._get_response(request)
+
+    async def _get_response_async(self, request):
+        self._prepare(request)
+        return await super()._get_response_async(request)
+
+
+class LeanASGIHandler(LeanHandlerMixin, ASGIHandler):
+    pass
+
+
+class LeanWSGIHandler(LeanHandlerMixin, WSGIHandler):
+    pass
+
+
+def lean_asgi_application(application):
+    """Aiguille les chemins LEAN_PATHS vers le handler sans middlewares"""
+    lean = LeanASGIHandler()
+
+    async def dispatch(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] in LEAN_PATHS:
+            return await lean(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return dispatch
+
+
+def lean_wsgi_application(application):
+    """Équivalent WSGI de lean_asgi_application"""
+    lean = LeanWSGIHandler()
+
+    def dispatch(environ, start_response):
+        if environ.get('PATH_INFO') in LEAN_PATHS:
+            return lean(environ, start_response)
+        return application(environ, start_response)
+
+    return dispatch
@@ -0,0 +1,9 @@
+import os
+from django.core.asgi import get_asgi_application
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'respira_project.settings.production')
+django_application = get_asgi_application()
+
+from core.lean_handler import lean_asgi_application  # noqa: E402  (après django.setup())
+
+# ⚡ Webhook d'ingestion servi sans la pile de middlewares
+application = lean_asgi_application(django_application)
@@ -0,0 +1,10 @@
+"""
+URLconf du handler sans middlewares (core.lean_handler)
+"""
+from django.urls import path
+
+from apps.sensors import ubidots_views
+
+urlpatterns = [
+    path('api/v1/sensors/ubidots/ingest/', ubidots_views.ubidots_ingest, name='ubidots-ingest-lean'),
+]
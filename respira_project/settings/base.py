@@ -100,11 +100,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.ORJSONRenderer',  # ⚡ orjson si installé, sinon JSON standard
         'rest_framework.renderers.BrowsableAPIRenderer',  # ✅ Interface HTML interactive
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'api.parsers.ORJSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
@@ -153,6 +153,22 @@ CORS_ALLOW_METHODS = [
 CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
 CORS_PREFLIGHT_MAX_AGE = 86400  # 24h
 
+# Cache partagé entre workers si REDIS_URL est défini (paquet redis requis, obligatoire en production),
+# sinon cache mémoire du process (développement / tests, un seul process)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 IQAIR_API_KEY = os.getenv('IQAIR_API_KEY', '')
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '')
 
@@ -272,3 +288,36 @@ LOGGING = {
 
 # Configuration Ubidots
 UBIDOTS_API_TOKEN = os.getenv('UBIDOTS_API_TOKEN', '')
+UBIDOTS_TIMEOUT = (3.05, 15)  # (connexion, lecture) en secondes
+UBIDOTS_MAX_RETRIES = 3       # Retry avec backoff + jitter sur 429/5xx
+UBIDOTS_MAX_WORKERS = int(os.getenv('UBIDOTS_MAX_WORKERS', '8'))  # Appels HTTP parallèles par synchro
+UBIDOTS_SYNC_INITIAL_HOURS = 24     # Fenêtre de la première synchro d'une variable
+UBIDOTS_SYNC_OVERLAP_SECONDS = 300  # Recouvrement sous le watermark pour les données tardives
+UBIDOTS_SYNC_CHUNK_HOURS = 24       # Tranche de temps traitée en mémoire lors d'un backfill
+UBIDOTS_METADATA_TTL = 3600         # Cache devices / variables Ubidots (invalidation: ?refresh=1)
+
+# Ingestion capteurs
+SENSOR_BULK_MAX_ITEMS = int(os.getenv('SENSOR_BULK_MAX_ITEMS', '1000'))  # Lectures max par appel data/bulk/
+DEVICE_STATE_FLUSH_SECONDS = int(os.getenv('DEVICE_STATE_FLUSH_SECONDS', '10'))  # Écriture groupée last_sync / is_connected des bracelets
+UBIDOTS_WEBHOOK_ASYNC = os.getenv('UBIDOTS_WEBHOOK_ASYNC', 'False').lower() == 'true'  # Webhook: mise en file + 202 (worker drain_ingest_queue)
+UBIDOTS_IDEMPOTENCY_TTL = 3600  # Mémoire des livraisons déjà vues (ubidots/ingest/)
+RESOLVER_CACHE_TTL = 3600 if os.getenv('REDIS_URL') else 0  # Cache device/email -> utilisateur (invalidation par signaux: cache partagé requis, sinon désactivé)
+
+# Notifications push (outbox des alertes critiques, worker dispatch_notifications)
+# Pas de transport par défaut (rien n'est mis en file): StubSender (journalisation seule) en développement et tests uniquement.
+# Une fois un transport réel configuré, ajouter le process "notifier: python manage.py dispatch_notifications --loop" au Procfile
+NOTIFICATION_SENDERS = {
+    'push': os.getenv('NOTIFICATION_PUSH_SENDER', ''),
+}
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_BACKOFF_SECONDS = 30  # Délai de base, doublé à chaque échec (avec jitter)
+
+# Temps réel (SSE /api/v1/sensors/events/, servi par respira_project.asgi)
+REALTIME_BROKER = os.getenv('REALTIME_BROKER', 'apps.sensors.realtime.InProcessBroker')  # Un seul processus; RedisBroker imposé en production
+REALTIME_REDIS_URL = os.getenv('REDIS_URL', '')
+REALTIME_HEARTBEAT_SECONDS = 15
+REALTIME_TICKET_TTL = 30  # Ticket SSE à usage unique (events/ticket/), remplace le JWT en query string
+
+# Analyses glissantes (SensorAnalytics alimentée à l'ingestion)
+ANALYTICS_SNAPSHOT_SECONDS = int(os.getenv('ANALYTICS_SNAPSHOT_SECONDS', '300'))  # Un instantané SensorAnalytics par utilisateur au plus toutes les N secondes (horodatage des lectures)
+ROLLUP_MINUTE_RETENTION_DAYS = 35  # Tranches SensorRollup 1 minute conservées (compact_sensor_rollups), heures et jours gardés
@@ -18,3 +18,8 @@ DATABASES = {
 # ✅ Configuration API Chatbot IA (OpenAI ou Anthropic)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')  # sk-...
 # ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')  # Alternative: Claude
+
+# Notifications push: transport de journalisation (aucun envoi réel)
+NOTIFICATION_SENDERS = {
+    'push': os.getenv('NOTIFICATION_PUSH_SENDER', 'apps.sensors.notifications.StubSender'),
+}
@@ -1,5 +1,6 @@
 from .base import *
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 DEBUG = False
 ALLOWED_HOSTS = [
@@ -18,6 +19,30 @@ DATABASES = {
     )
 }
 
+# Cache partagé obligatoire: carences d'alertes, compteur de non lues, cache de
+# résolution des devices et fenêtres glissantes sont lus et invalidés par tous
+# les processus (workers web, worker, notifier, rollups). Un LocMemCache par
+# process les rendrait incohérents: on refuse de démarrer sans Redis.
+if not os.getenv('REDIS_URL'):
+    raise ImproperlyConfigured("REDIS_URL est requis en production (cache partagé entre processus)")
+try:
+    import redis  # noqa: F401
+except ImportError as e:
+    raise ImproperlyConfigured("Le paquet redis est requis en production (RedisCache)") from e
+
+# Notifications push: le transport de journalisation n'envoie rien, interdit ici
+if any(path.endswith('.StubSender') for path in NOTIFICATION_SENDERS.values()):
+    raise ImproperlyConfigured("StubSender n'envoie aucune notification: interdit en production")
+
+# Temps réel: l'ingestion publie depuis plusieurs processus (workers web, worker de file)
+REALTIME_BROKER = 'apps.sensors.realtime.RedisBroker'
+
+# API: JSON uniquement en production (pas d'interface navigable dans la négociation)
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['api.renderers.ORJSONRenderer'],
+}
+
 # Static files pour Render
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
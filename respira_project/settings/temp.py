@@ -9,4 +9,9 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db_temp.sqlite3',
     }
-}
\ No newline at end of file
+}
+
+# Notifications push: transport de journalisation (aucun envoi réel)
+NOTIFICATION_SENDERS = {
+    'push': os.getenv('NOTIFICATION_PUSH_SENDER', 'apps.sensors.notifications.StubSender'),
+}
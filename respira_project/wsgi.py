@@ -1,4 +1,9 @@
 import os
 from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'respira_project.settings.production')
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+from core.lean_handler import lean_wsgi_application  # noqa: E402  (après django.setup())
+
+# ⚡ Webhook d'ingestion servi sans la pile de middlewares
+application = lean_wsgi_application(django_application)